@@ -19,14 +19,24 @@ Melissa Romanus
 import os
 import sys
 import time
-import pickle
 import random
 import shutil
-import logging, logging.config
+import signal
+import logging
 
 from configobj import ConfigObj
 
-from gibbs_sampling import *
+from status_journal import StatusJournal
+from state_history import StateHistory
+from autotune import CycleTimeController, SubmissionBufferTuner, DrainPlanner
+from launch_priority import LaunchPriority
+from placement import NodePlacement
+from replica_layout import replica_layout
+from retention import RetentionService
+from exchange_trigger import ExchangeTrigger
+from metrics import MetricsRegistry
+from log_config import configure_logging
+from settings import Settings, SettingsError
 
 
 
@@ -64,19 +74,122 @@ def _open(name, mode, max_attempts = 100, wait_time = 1):
         _exit('Too many failures accessing file %s'%name)
     return f
 
+def _write_atomic(name, data):
+    """
+    Writes data to a file by way of a temporary file renamed into place, so
+    that readers never see a partially written file.
+    """
+    tmp_name = '%s.tmp'%name
+    f = _open(tmp_name,'w')
+    f.write(data)
+    f.close()
+    os.rename(tmp_name,name)
+
+# ioctl request to clone (reflink) a file on btrfs, xfs, etc.
+_FICLONE = 0x40049409
+
+def _reflink(src, dst):
+    """
+    Creates dst as a copy-on-write clone of src. Raises OSError if the
+    filesystem does not support it.
+    """
+    import fcntl
+    fsrc = open(src,'rb')
+    fdst = open(dst,'wb')
+    try:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    except (IOError, OSError), e:
+        fdst.close()
+        fsrc.close()
+        os.remove(dst)
+        raise OSError(e.errno, 'reflink not supported', dst)
+    fdst.close()
+    fsrc.close()
+    shutil.copymode(src,dst)
+
+# functions to create a file from another one for each link mode
+_LINK_METHODS = {
+    'hardlink': os.link,
+    'reflink': _reflink,
+    'symlink': lambda src, dst: os.symlink(os.path.abspath(src),dst),
+    'copy': shutil.copy }
+
+# link modes tried in turn by EXTFILES_LINK_MODE = 'auto'; hard links are
+# only made on request since they share the inode of the original file
+_AUTO_LINK_MODES = ('reflink', 'copy')
+
+def _guarded_call(func, *args):
+    """
+    Calls func(*args) in a worker thread. Returns a (result, error) tuple
+    where error is the exception raised, if any, including SystemExit
+    raised by _exit(), so that the main thread can deal with it.
+    """
+    try:
+        return (func(*args), None)
+    except (Exception, SystemExit), e:
+        return (None, e)
+
+def read_nodefile(nodefile):
+    """
+    Reads the list of compute nodes of the SSH transport from a nodefile.
+    There should be six comma separated columns in the nodefile. They are
+    'node name', 'slot number', 'number of threads', 'system architect',
+    'username', and 'name of the temperary folder'. Returns a list of
+    dictionaries with keys node_name, slot_number, threads_number, arch,
+    user_name and tmp_folder.
+    """
+    node_info = []
+    try:
+        f = open(nodefile, 'r')
+        for line in f:
+            if not line.strip():
+                continue
+            lineID = line.split(",")
+            node = {}
+            node["node_name"] = str(lineID[0].strip())
+            node["slot_number"] = str(lineID[1].strip())
+            node["threads_number"] = str(lineID[2].strip())
+            node["arch"] = str(lineID[3].strip())
+            node["user_name"] = str(lineID[4].strip())
+            node["tmp_folder"] = str(lineID[5].strip())
+            #tmp_folder has to be pre-assigned
+            if node["tmp_folder"] == "":
+                _exit('tmp_folder in nodefile needs to be specified')
+            node_info.append(node)
+        f.close()
+    except (IOError, IndexError):
+        _exit("Unable to process nodefile %s" % nodefile)
+    return node_info
+
 class async_re(object):
     """
     Class to set up and run asynchronous file-based RE calculations
     """
-    logging.config.fileConfig(os.path.join(os.path.dirname(__file__), "utils/logging.conf"))
-
     def __init__(self, command_file, options):
         self.command_file = command_file
+        # options: dictionary of settings given by the caller rather than
+        # the control file: 'transport', job transport to use,
+        # 'io_threads', overrides IO_THREADS, 'job_dir', directory of
+        # the files of the job (the working directory by default), and
+        # 'log_tag', suffix of the names of the loggers of the job
+        self.options = options
+        if self.options and self.options.get('job_dir') is not None:
+            self.job_dir = os.path.abspath(self.options['job_dir'])
+        else:
+            self.job_dir = os.getcwd()
+        self.log_tag = None
+        if self.options:
+            self.log_tag = self.options.get('log_tag')
         self.jobname = os.path.splitext(os.path.basename(command_file))[0]
         self.keywords = ConfigObj(self.command_file)
         
+        configure_logging()
         self._setLogger()
-        self._checkInput()
+        self._tagLogger(self)
+        try:
+            self._checkInput()
+        except SettingsError, e:
+            self._exit(str(e))
         self._printStatus()
 
     def _exit(self, message):
@@ -89,36 +202,103 @@ class async_re(object):
     def _setLogger(self):
         self.logger = logging.getLogger("async_re")
 
-    def __getattribute__(self, name):
-        if name == 'replicas_waiting':
-            # Return a list of replica indices of replicas in a wait state.
-            return [k for k in range(self.nreplicas)
-                    if self.status[k]['running_status'] == 'W']
-        elif name == 'states_waiting':
-            # Return a list of state ids of replicas in a wait state.
-            return [self.status[k]['stateid_current']
-                    for k in self.replicas_waiting]
-        elif name == 'replicas_waiting_to_exchange':
-            # Return a list of replica indices of replicas in a wait state that
-            # have ALSO completed at least one cycle.
-            return [k for k in range(self.nreplicas)
-                    if (self.status[k]['running_status'] == 'W' and
-                        self.status[k]['cycle_current'] > 1)]
-        elif name == 'states_waiting_to_exchange':
-            # Return a list of state ids of replicas in a wait state that have
-            # ALSO completed at least one cycle.
-            return [self.status[k]['stateid_current']
-                    for k in self.replicas_waiting_to_exchange]
-        elif name == 'waiting':
-            return len(self.replicas_waiting)
-        elif name == 'replicas_running':
-            # Return a list of replica indices of replicas in a running state.
-            return [k for k in range(self.nreplicas)
-                    if self.status[k]['running_status'] == 'R']
-        elif name == 'running':
-            return len(self.replicas_running)
-        else:
-            return object.__getattribute__(self,name)
+    def _tagLogger(self, component):
+        """
+        Moves the logger of the job or of one of its components to a child
+        logger named after the 'log_tag' option, if given, so that the logs
+        of jobs run in the same process (multi_async_re.py) can be told
+        apart.
+        """
+        if self.log_tag is not None:
+            component.logger = logging.getLogger('%s.%s' %
+                                                 (component.logger.name,
+                                                  self.log_tag))
+
+    def _jobPath(self, filename):
+        """
+        Returns the path of a file of the job, relative names being resolved
+        from the job directory rather than the working directory.
+        """
+        return os.path.join(self.job_dir, filename)
+
+    # Replica running states:
+    #  'W': waiting to be launched (or exchanged)
+    #  'R': running/submitted
+    #  'S': stopped, being checked after completing a cycle
+    #  'E': being exchanged
+    RUNNING_STATES = ('W', 'R', 'S', 'E')
+
+    def _buildStatusIndex(self):
+        """
+        (Re)builds the index of replicas by running state from the status
+        table. Afterwards all running state transitions must go through
+        _setRunningStatus() to keep the index current.
+        """
+        self._replicas_by_status = dict((s, set()) for s in self.RUNNING_STATES)
+        for k in range(self.nreplicas):
+            self._replicas_by_status[self.status[k]['running_status']].add(k)
+        # waiting replicas that have completed at least one cycle; the cycle
+        # of a replica only changes while it is not waiting
+        self._replicas_to_exchange = set(
+            k for k in self._replicas_by_status['W']
+            if self.status[k]['cycle_current'] > 1)
+
+    def _setRunningStatus(self, replica, running_status):
+        """Sets the running state of a replica and updates the index."""
+        old_status = self.status[replica]['running_status']
+        if old_status == running_status:
+            return
+        self._replicas_by_status[old_status].discard(replica)
+        self._replicas_by_status[running_status].add(replica)
+        if old_status == 'W':
+            self._replicas_to_exchange.discard(replica)
+        elif (running_status == 'W' and
+              self.status[replica]['cycle_current'] > 1):
+            self._replicas_to_exchange.add(replica)
+        self.status[replica]['running_status'] = running_status
+        if self.timing is not None:
+            self.timing.transition(replica, old_status, running_status)
+
+    # The replicas_* properties return the sets of the index, in no
+    # particular order. They must not be modified, and must be copied before
+    # changing the running state of their members while iterating over them.
+
+    @property
+    def replicas_waiting(self):
+        # Return the set of replica indices of replicas in a wait state.
+        return self._replicas_by_status['W']
+
+    @property
+    def states_waiting(self):
+        # Return a list of state ids of replicas in a wait state.
+        return [self.status[k]['stateid_current']
+                for k in self.replicas_waiting]
+
+    @property
+    def replicas_waiting_to_exchange(self):
+        # Return the set of replica indices of replicas in a wait state that
+        # have ALSO completed at least one cycle.
+        return self._replicas_to_exchange
+
+    @property
+    def states_waiting_to_exchange(self):
+        # Return a list of state ids of replicas in a wait state that have
+        # ALSO completed at least one cycle.
+        return [self.status[k]['stateid_current']
+                for k in self.replicas_waiting_to_exchange]
+
+    @property
+    def waiting(self):
+        return len(self._replicas_by_status['W'])
+
+    @property
+    def replicas_running(self):
+        # Return the set of replica indices of replicas in a running state.
+        return self._replicas_by_status['R']
+
+    @property
+    def running(self):
+        return len(self._replicas_by_status['R'])
 
     def _printStatus(self):
         """Print a report of the input parameters."""
@@ -131,139 +311,213 @@ class async_re(object):
     def _checkInput(self):
         """
         Check that required parameters are specified. Parse these and other
-        optional settings.
+        optional settings. Malformed settings raise SettingsError.
         """
+        settings = Settings(self.keywords)
+        self.settings = settings
         # Required Options
         #
         # basename for the job
-        self.basename = self.keywords.get('ENGINE_INPUT_BASENAME')
-        if self.basename is None:
-            self._exit('ENGINE_INPUT_BASENAME needs to be specified')
+        self.basename = settings.getString('ENGINE_INPUT_BASENAME',
+                                           required=True)
+        # type of RE job, checked by the RE modules
+        self.re_type = settings.getString('RE_TYPE')
+        # directory of the lib and bin folders of the MD engine (SSH)
+        self.exec_directory = settings.getString('EXEC_DIRECTORY')
 
         #job transport mechanism
-        self.transport_mechanism = self.keywords.get('JOB_TRANSPORT')
-        if self.transport_mechanism is None:
-            self._exit('JOB_TRANSPORT needs to be specified')
-        #only SSH and BOINC are supported for now
-        if self.transport_mechanism != "SSH" and self.transport_mechanism != "BOINC":
+        self.transport_mechanism = settings.getString('JOB_TRANSPORT',
+                                                      required=True)
+        #only SSH and BOINC are supported for now, MOCK simulates jobs
+        if self.transport_mechanism not in ("SSH", "BOINC", "MOCK"):
             self._exit("unknown JOB_TRANSPORT %s" % self.transport_mechanism)
         # reset job transport
         self.transport = None
        # variables required for ssh-based transport
         if self.transport_mechanism == "SSH":
-            if self.keywords.get('NODEFILE') is None:
-                self._exit("NODEFILE needs to be specified")
-            nodefile = self.keywords.get('NODEFILE')
-            """
-	    check the information in the nodefile. there should be six columns in the  
-            nodefile. They are 'node name', 'slot number', 'number of threads', 
-	    'system architect','username', and 'name of the temperary folder'
-	    """
-	    node_info= []
-            try:
-                f = open(nodefile, 'r')
-	        line=f.readline()
-		nodeid = 0
-		while line:
-		    lineID=line.split(",")
-		    node_info.append({})
-		    node_info[nodeid]["node_name"] = str(lineID[0].strip())
-		    node_info[nodeid]["slot_number"] = str(lineID[1].strip())
-		    node_info[nodeid]["threads_number"] = str(lineID[2].strip())
-		    node_info[nodeid]["arch"] = str(lineID[3].strip())
-		    node_info[nodeid]["user_name"] = str(lineID[4].strip())
-		    node_info[nodeid]["tmp_folder"] = str(lineID[5].strip())
-		    #tmp_folder has to be pre-assigned
-		    if node_info[nodeid]["tmp_folder"] == "":
-	   		self._exit('tmp_folder in nodefile needs to be specified')
-		    nodeid += 1
-		    line = f.readline()
-		f.close()
-            except:
-                self._exit("Unable to process nodefile %s" % nodefile)
-                # reset job transport
-                self.transport = None
+            nodefile = settings.getString('NODEFILE', required=True)
             #set the nodes information
-            self.compute_nodes=node_info
+            self.compute_nodes = read_nodefile(self._jobPath(nodefile))
             #Can print out here to check the node information
-            #self.logger.info("compute nodes: %s", ', '.join([n['node_name'] for n in node_info]))
-            
-        # exchange or not, switch added for WCG by Junchao
+            #self.logger.info("compute nodes: %s", ', '.join([n['node_name'] for n in self.compute_nodes]))
+            # choice of the nodes on which replicas are launched, 'random' or
+            # 'fastest' (see placement.py)
+            self.node_placement = settings.getChoice('NODE_PLACEMENT',
+                                                     NodePlacement.POLICIES,
+                                                     'random')
 
-        self.exchange = True
-        if self.keywords.get('EXCHANGE') is None:
-            self.exchange = True
-        elif self.keywords.get('EXCHANGE').lower() == 'yes':
-            self.exchange = True
-        elif self.keywords.get('EXCHANGE').lower() == 'no':
-            self.exchange = False
-        else:
-            self._exit("unknown value for exchange switch %s" % self.exchange)
+        # exchange or not, switch added for WCG by Junchao
+        self.exchange = settings.getFlag('EXCHANGE', True)
 
         # exchange by set or not, switch added for evaluting different REMD scheme
-        self.exchangeBySet = True
-        if self.keywords.get('EXCHANGE_BYSET') is None:
-            self.exchangeBySet = True
-        elif self.keywords.get('EXCHANGE_BYSET').lower() == 'yes':
-            self.exchangeBySet = True
-        elif self.keywords.get('EXCHANGE_BYSET').lower() == 'no':
-            self.exchangeBySet = False
-        else:
-            self._exit("unknown value for exchange by set %s" % self.exchangeBySet)
+        self.exchangeBySet = settings.getFlag('EXCHANGE_BYSET', True)
 
         # exchange method, switch added for evaluting different REMD scheme
-        self.exchangeMethod = 'restrained_gibbs'
-        if self.keywords.get('EXCHANGE_METHOD') is None:
-            self.exchangeMethod = 'restrained_gibbs'
-        elif self.keywords.get('EXCHANGE_METHOD').lower() == 'restrained_gibbs':
-            self.exchangeMethod = 'restrained_gibbs'
-        elif self.keywords.get('EXCHANGE_METHOD').lower() == 'pairwise_metropolis':
-            self.exchangeMethod = 'pairwise_metropolis'
-        else:
-            self._exit("unknown exchange method %s" % self.exchangeMethod)
+        self.exchangeMethod = settings.getChoice(
+            'EXCHANGE_METHOD', ('restrained_gibbs', 'pairwise_metropolis'),
+            'restrained_gibbs')
+
+        # when to exchange among waiting replicas
+        exchange_trigger = settings.getChoice('EXCHANGE_TRIGGER',
+                                              ExchangeTrigger.POLICIES,
+                                              'always')
+        exchange_window_time = settings.getFloat('EXCHANGE_WINDOW_TIME',
+                                                 minimum=0)
+        exchange_window_count = settings.getInt('EXCHANGE_WINDOW_COUNT',
+                                                minimum=1)
+        if exchange_window_time is None and exchange_window_count is None:
+            # If unspecified the batching window is set as 60 secs
+            exchange_window_time = 60.0
+        exchange_min_waiting = settings.getInt('EXCHANGE_MIN_WAITING', 2,
+                                               minimum=2)
+        self.exchange_trigger = ExchangeTrigger(exchange_trigger,
+                                                exchange_window_time,
+                                                exchange_window_count,
+                                                exchange_min_waiting)
+        self._tagLogger(self.exchange_trigger)
 
         # execution time in minutes
-        self.walltime = float(self.keywords.get('WALL_TIME'))
-        if self.walltime is None:
-            self._exit('WALL_TIME (in minutes) needs to be specified')
+        self.walltime = settings.getFloat('WALL_TIME', required=True,
+                                          minimum=0)
 
-        if self.keywords.get('TOTAL_CORES') is None:
-            self._exit('TOTAL_CORES needs to be specified')
-        if self.keywords.get('SUBJOB_CORES') is None:
-            self._exit('SUBJOB_CORES needs to be specified')
+        self.total_cores = settings.getInt('TOTAL_CORES', required=True,
+                                           minimum=1)
+        self.subjob_cores = settings.getInt('SUBJOB_CORES', required=True,
+                                            minimum=1)
+        # number of job slots
+        self.available_slots = self.total_cores / self.subjob_cores
 
         # Optional variables
         #
-        env = self.keywords.get('ENGINE_ENVIRONMENT')
-        if env is not None and env != '':
-            self.engine_environment = env.split(',')
-        else:
-            self.engine_environment = []
+        self.engine_environment = settings.getList('ENGINE_ENVIRONMENT', [])
 
         # number of replicas (may be determined by other means)
-        self.nreplicas = None
+        self.nreplicas = settings.getInt('NREPLICAS', minimum=1)
 
-        if self.keywords.get('NEXCHG_ROUNDS') is not None:
-            self.nexchg_rounds = int(self.keywords.get('NEXCHG_ROUNDS'))
-        else:
-            self.nexchg_rounds = 1
+        self.nexchg_rounds = settings.getInt('NEXCHG_ROUNDS', 1)
 
-        if self.keywords.get('NREPLICAS') is not None:
-            self.nreplicas = int(self.keywords.get('NREPLICAS'))
+        # Gets the wall clock time in minutes for a replica to complete a
+        # cycle. If unspecified it is estimated as 10% of job wall clock time
+        self.replica_run_time = settings.getInt('REPLICA_RUN_TIME',
+                                                int(round(self.walltime/10.)),
+                                                minimum=0)
+        # Time in between cycles in seconds
+        # If unspecified it is set as 30 secs
+        self.cycle_time = settings.getFloat('CYCLE_TIME', 30.0, minimum=0)
+        # Minimum time spent processing the job queue once a replica has
+        # completed, to collect other completions before exchanging.
+        # If unspecified it is set as 1 sec
+        self.min_time = settings.getFloat('MIN_TIME', 1.0, minimum=0)
+
+        # number of journaled replica status records after which the status
+        # journal is compacted into BASENAME.stat (default: 10 per replica)
+        self.status_compact_interval = settings.getInt(
+            'STATUS_COMPACT_INTERVAL', minimum=1)
+        # layout of the replica directories, flat or sharded
+        self.replica_layout = replica_layout(self.keywords, self.job_dir)
+        # archive or delete the files of old cycles during the run, every
+        # RETENTION_INTERVAL seconds (see retention.py)
+        self.retention = settings.getChoice('RETENTION',
+                                            RetentionService.MODES, 'none')
+        self.retention_interval = settings.getFloat('RETENTION_INTERVAL',
+                                                    300.0, minimum=1)
+        self.retention_keep_cycles = settings.getInt('RETENTION_KEEP_CYCLES',
+                                                     2, minimum=1)
+        self.retention_batch = settings.getInt('RETENTION_BATCH', 10,
+                                               minimum=1)
+        self.retention_extensions = settings.getList('RETENTION_EXTENSIONS')
+        self.retention_service = None
         # extfiles variable for 'setupJob'
-        self.extfiles = self.keywords.get('ENGINE_INPUT_EXTFILES')
-        if self.extfiles is not None and self.extfiles != '':
-            self.extfiles = self.extfiles.split(',')
-        else:
-            self.extfiles = None
-        # verbose printing
-        if self.keywords.get('VERBOSE').lower() == 'yes':
-            self.verbose = True
-            if self.logger:
-                self.logger.setLevel(logging.DEBUG)
+        self.extfiles = settings.getList('ENGINE_INPUT_EXTFILES')
+        # how replica directories get the files listed in
+        # ENGINE_INPUT_EXTFILES: 'auto' (clone if possible, else copy),
+        # 'hardlink', 'reflink', 'symlink' or 'copy'
+        self.extfiles_link_mode = settings.getChoice(
+            'EXTFILES_LINK_MODE', ('auto',) + tuple(sorted(_LINK_METHODS)),
+            'auto')
+
+        # number of threads used to prepare replica files in the background
+        # (0 to prepare them in the main thread)
+        self.io_threads = settings.getInt('IO_THREADS', 4, minimum=0)
+        if self.options and self.options.get('io_threads') is not None:
+            self.io_threads = self.options['io_threads']
+        self._io_pool = None
+        # replicas whose input files are being prepared
+        self._pending_inputs = {}
+
+        # formats of the replica state history files: 'binary'
+        # (state.history.bin), 'text' (state.history) or 'both'. Binary
+        # histories are exported to text with state_history.py
+        history_format = settings.getChoice('STATE_HISTORY_FORMAT',
+                                            ('text', 'binary', 'both'),
+                                            'binary')
+        if history_format == 'both':
+            self.state_history_formats = ['text', 'binary']
         else:
-            self.verbose = False
+            self.state_history_formats = [history_format]
+        # time in seconds between flushes of the state history buffers
+        self.state_history_flush_interval = settings.getFloat(
+            'STATE_HISTORY_FLUSH_INTERVAL', 30.0, minimum=0)
+
+        # order in which waiting replicas are launched
+        launch_priority = settings.getChoice('LAUNCH_PRIORITY',
+                                             LaunchPriority.POLICIES,
+                                             'random')
+        self.launch_priority = LaunchPriority(launch_priority, self)
+
+        # tune the scheduling intervals from observed replica cycle times
+        self.adaptive_timing = settings.getFlag('ADAPTIVE_TIMING', False)
+        # scheduling intervals controller, set up by scheduleJobs()
+        self.timing = None
+        # end of run drain planner, set up by scheduleJobs(), and the time in
+        # seconds running replicas are waited for after a SIGTERM
+        self.drain_planner = None
+        self.drain_timeout = settings.getFloat('DRAIN_TIMEOUT', 60.0,
+                                               minimum=0)
+
+        # size of subjob buffer as a fraction of job slots
+        # (TOTAL_CORES/SUBJOB_CORES)
+        self.subjobs_buffer_size = settings.getFloat('SUBJOBS_BUFFER_SIZE',
+                                                     0.5, minimum=0)
+        # tune the subjob buffer and the number of replicas held back for
+        # exchanges from observed slot idle time and exchange acceptance
+        self.subjobs_buffer_autotune = settings.getFlag(
+            'SUBJOBS_BUFFER_AUTOTUNE', False)
+        self.submission = SubmissionBufferTuner(self.available_slots,
+                                                self.subjobs_buffer_size,
+                                                2*int(self.exchange),
+                                                self.subjobs_buffer_autotune)
+        self._tagLogger(self.submission)
+
+        # minimum interval in seconds between rewrites of BASENAME_stat.txt
+        self.status_report_interval = settings.getFloat(
+            'STATUS_REPORT_INTERVAL', 5.0, minimum=0)
+        self._status_report_time = 0.
+        self._status_report_table = None
+
+        # timing histograms and counters, dumped to BASENAME_metrics.json
+        # at most every METRICS_INTERVAL seconds
+        self.metrics = MetricsRegistry()
+        self.metrics_interval = settings.getFloat('METRICS_INTERVAL', 60.0,
+                                                  minimum=0)
+        self._metrics_time = 0.
+
+        # serve the status of the job over HTTP on STATUS_HTTP_HOST (local
+        # only by default) and STATUS_HTTP_PORT, updated at most every
+        # STATUS_HTTP_INTERVAL seconds
+        self.status_http_port = settings.getInt('STATUS_HTTP_PORT',
+                                                minimum=0, maximum=65535)
+        self.status_http_host = settings.getString('STATUS_HTTP_HOST',
+                                                   '127.0.0.1')
+        self.status_http_interval = settings.getFloat('STATUS_HTTP_INTERVAL',
+                                                      1.0, minimum=0)
+        self.status_server = None
+        self._status_publish_time = 0.
 
+        # verbose printing
+        self.verbose = settings.getFlag('VERBOSE', False)
+        if self.verbose and self.logger:
+            self.logger.setLevel(logging.DEBUG)
 
 
     def _linkReplicaFile(self, link_filename, real_filename, repl):
@@ -271,48 +525,131 @@ class async_re(object):
         Link the file at real_filename to the name at link_filename in the
         directory belonging to the given replica. If a file is already linked
         to this name (e.g. from a previous cycle), remove it first.
+
+        Depending on EXTFILES_LINK_MODE the file is hard linked, cloned
+        (reflink), symlinked or copied. In 'auto' mode (the default) a clone
+        is attempted before falling back to a copy. A hard link shares the
+        inode of the original file: a program that rewrites the file in
+        place in one replica directory changes it in the job directory and
+        in all the other replicas, so 'hardlink' must only be set for files
+        that are never modified.
         """
-        os.chdir('r%d'%repl)
         # Check that the file to be linked actually exists.
-        # TODO: This is not robust to absolute path specifications.
-        real_filename = '../%s'%real_filename
+        real_filename = self._jobPath(real_filename)
         if not os.path.exists(real_filename):
             self._exit('No such file: %s'%real_filename)
-        # Make/re-make the symlink.
-        if os.path.exists(link_filename):
+        link_filename = self._replicaPath(repl, link_filename)
+        # Make/re-make the link.
+        if os.path.lexists(link_filename):
             os.remove(link_filename)
-        #os.symlink(real_filename,link_filename)
-        shutil.copy(real_filename,link_filename)
-        os.chdir('..')
+        if self.extfiles_link_mode == 'auto':
+            modes = _AUTO_LINK_MODES
+        else:
+            modes = (self.extfiles_link_mode,)
+        for mode in modes:
+            try:
+                _LINK_METHODS[mode](real_filename,link_filename)
+                return
+            except (IOError, OSError), e:
+                if mode == modes[-1]:
+                    raise
+                # not supported by the filesystem, try next mode
+                if os.path.lexists(link_filename):
+                    os.remove(link_filename)
+
+    def _replicaDir(self, replica):
+        """
+        Returns the directory of a replica in the job directory (see
+        replica_layout.py).
+        """
+        return self.replica_layout.replicaDir(replica)
+
+    def _replicaPath(self, replica, filename):
+        """
+        Returns the path of a file in the directory of a replica.
+        """
+        return self.replica_layout.replicaPath(replica, filename)
+
+    def _setupReplicaDir(self, repl):
+        """
+        Creates the directory of a replica and links in the files listed in
+        ENGINE_INPUT_EXTFILES.
+        """
+        os.mkdir(self._replicaDir(repl))
+        if self.extfiles is not None:
+            for file in self.extfiles:
+                self._linkReplicaFile(file,file,repl)
+
+    def _mapIO(self, func, items):
+        """
+        Calls func(item) for each item using the IO_THREADS thread pool
+        (serially if disabled) and waits for all calls to finish. Returns the
+        list of results. Exits on the first error.
+        """
+        pool = self._ioPool()
+        if pool is None:
+            return [func(item) for item in items]
+        results = pool.map(lambda item: _guarded_call(func, item), items)
+        for item, (result, error) in zip(items, results):
+            if error is not None:
+                self._exit('Error processing %s: %s' % (item, error))
+        return [result for result, error in results]
 
     def setupJob(self):
         """
         If RE_SETUP='yes' creates and populates subdirectories, one for each
-        replica called r0, r1, ..., rN in the working directory. Otherwise
+        replica called r0, r1, ..., rN in the job directory (or in bucket
+        directories, see replica_layout.py). Otherwise
         reads saved state from the ENGINE_BASENAME.stat file if directories
         already exist.
 
         To populate each directory calls _buildInpFile(k) to prepare the MD
-        engine input file for replica k. Also creates soft links to the working
+        engine input file for replica k. Also creates soft links to the job
         directory for the accessory files specified in ENGINE_INPUT_EXTFILES.
         """
 
-        if self.transport_mechanism == "SSH":
+        if self.options and self.options.get('transport') is not None:
+            # transport shared with other jobs (see multi_async_re.py)
+            self.transport = self.options['transport']
+        elif self.transport_mechanism == "SSH":
             from ssh_transport import ssh_transport
             # creates SSH transport
-            self.transport = ssh_transport(self.basename, self.compute_nodes, [ i for i in range(self.nreplicas)])
+            placement = NodePlacement(self.compute_nodes, self.node_placement)
+            self.transport = ssh_transport(self.basename, self.compute_nodes, [ i for i in range(self.nreplicas)], placement)
             #self.transport = ssh_transport(self.basename, self.compute_nodes, self.nreplicas)
         elif self.transport_mechanism == "BOINC":
             from boinc_transport import boinc_transport
 
             # creates BOINC transport
             self.transport = boinc_transport(self.basename, self.keywords, self.nreplicas, self.extfiles)
+        elif self.transport_mechanism == "MOCK":
+            from mock_transport import mock_transport
+
+            # creates simulated transport
+            try:
+                self.transport = mock_transport(self.basename, self.keywords, self.nreplicas, self.available_slots)
+            except SettingsError, e:
+                self._exit(str(e))
         else:
             self._exit("Job transport is not specified.")
+        self.transport.setLaunchPriority(self.launch_priority)
+
+        # status table storage
+        compact_interval = self.status_compact_interval
+        if compact_interval is None:
+            compact_interval = 10*self.nreplicas
+        self.status_journal = StatusJournal(self._jobPath(self.basename),
+                                            compact_interval, _open)
+        self._tagLogger(self.status_journal)
+        # replica state history files
+        self.state_history = StateHistory(self.state_history_formats,
+                                          self.state_history_flush_interval,
+                                          _open)
+        self._tagLogger(self.state_history)
 
         replica_dirs_exist = True
         for k in range(self.nreplicas):
-            repl_dir = 'r%d'%k
+            repl_dir = self._replicaDir(k)
             if not os.path.exists(repl_dir):
                 replica_dirs_exist = False
 
@@ -322,27 +659,31 @@ class async_re(object):
             setup = True
 
         if setup:
-            # create replicas directories r1, r2, etc.
             for k in range(self.nreplicas):
-                repl_dir = 'r%d'%k
+                repl_dir = self._replicaDir(k)
                 if os.path.exists(repl_dir):
                     _exit('Inconsistent set of replica directories found.'
                           ' Remove them to trigger setup.')
-                else:
-                    os.mkdir('r%d'%k)
-            # create links for external files
             if self.extfiles is not None:
                 for file in self.extfiles:
-                    for k in range(self.nreplicas):
-                        self._linkReplicaFile(file,file,k)
+                    if not os.path.exists(self._jobPath(file)):
+                        self._exit('No such file: %s'%file)
+            # create replicas directories r1, r2, etc. and links for
+            # external files
+            for bucket_dir in self.replica_layout.bucketDirs(self.nreplicas):
+                if not os.path.isdir(bucket_dir):
+                    os.mkdir(bucket_dir)
+            self._mapIO(self._setupReplicaDir, range(self.nreplicas))
             # create status table
-            self.status = [{'stateid_current': k, 'running_status': 'W',
+            self.status = [{'stateid_current': k, 'running_status': 'S',
                             'cycle_current': 1} for k in range(self.nreplicas)]
+            self._buildStatusIndex()
             # save status tables
             self._write_status()
             # create input files no. 1
             for k in range(self.nreplicas):
-                self._buildInpFile(k)
+                self._prepareReplica(k)
+            self._collectInpFiles(wait=True)
             self.updateStatus()
         else:
             self._read_status()
@@ -351,172 +692,537 @@ class async_re(object):
                 # restart BOINC workunit id list
                 self.transport.restart()
 
-        self.print_status()
+        self.print_status(force=True)
         #at this point all replicas should be in wait state
-        for k in range(self.nreplicas):
-            if self.status[k]['running_status'] != 'W':
-                _exit('Internal error after restart. Not all jobs are in wait '
-                      'state.')
+        if self.waiting != self.nreplicas:
+            _exit('Internal error after restart. Not all jobs are in wait '
+                  'state.')
+        if self.status_http_port is not None:
+            from status_server import StatusServer
+            try:
+                self.status_server = StatusServer(self.status_http_host,
+                                                  self.status_http_port)
+                self._tagLogger(self.status_server)
+            except Exception, e:
+                self._exit('Unable to start status server on %s:%d: %s'
+                           % (self.status_http_host, self.status_http_port, e))
+            self.logger.info('Serving job status on http://%s:%d/',
+                             *self.status_server.address)
+            self.publish_status(force=True)
 
     def scheduleJobs(self):
-        # Gets the wall clock time for a replica to complete a cycle
-        # If unspecified it is estimated as 10% of job wall clock time
-        replica_run_time = self.keywords.get('REPLICA_RUN_TIME')
-        if self.keywords.get('REPLICA_RUN_TIME') is None:
-            replica_run_time = int(round(self.walltime/10.))
-        else:
-            replica_run_time = int(self.keywords.get('REPLICA_RUN_TIME'))
-        # double it to give time for current running processes
-        # and newly submitted processes to complete
-        replica_run_time *= 2
+        """
+        Runs the RE job until the end of the allocation (WALL_TIME) and waits
+        for the running replicas to complete.
+        """
+        self.startScheduling()
+        self.installSignalHandlers()
+        while self.schedulingActive():
+            self.launchStep()
+            # returns early as soon as the transport reports a completion
+            with self.metrics.timer('ProcessJobQueue'):
+                self.transport.ProcessJobQueue(self.processMinTime(),
+                                               self.timing.cycle_time)
+            self.exchangeStep()
+        self.finishScheduling()
+
+    def startScheduling(self):
+        """
+        Sets up the scheduling intervals and the end time of the RE job.
+        """
+        # double the replica run time to give time for current running
+        # processes and newly submitted processes to complete
+        replica_run_time = 2*self.replica_run_time
+        cycle_time = self.cycle_time
+        min_time = self.min_time
+
+        # If ADAPTIVE_TIMING is set the cycle time and the minimum time are
+        # tuned from the observed replica cycles.
+        self.timing = CycleTimeController(self.nreplicas, cycle_time,
+                                          min_time, self.adaptive_timing)
+        self._tagLogger(self.timing)
 
-        # Time in between cycles in seconds
-        # If unspecified it is set as 30 secs
-        if self.keywords.get('CYCLE_TIME') is None:
-            cycle_time = 30.0
-        else:
-            cycle_time = float(self.keywords.get('CYCLE_TIME'))
+        start_time = time.time()
+        self.end_time = start_time + 60*self.walltime
+        # replicas are launched only if predicted, from their cycle history
+        # once known, to complete this much (plus the average wait between
+        # cycles) ahead of the end of the allocation
+        drain_margin = cycle_time + 10
+        self.drain_planner = DrainPlanner(self.timing, self.end_time,
+                                          60*replica_run_time, drain_margin)
+        self._tagLogger(self.drain_planner)
+        if self.retention != 'none':
+            self.retention_service = RetentionService(
+                self.retention, self.basename, self.replica_layout,
+                self.nreplicas, self._currentCycle,
+                self.retention_interval, self.retention_keep_cycles,
+                self.retention_batch, self.retention_extensions,
+                self.extfiles or (), self.metrics)
+            self._tagLogger(self.retention_service)
+            self.retention_service.start()
+
+    def _currentCycle(self, replica):
+        # retention thread: the files of this cycle and of the last
+        # RETENTION_KEEP_CYCLES before it are kept
+        return self.status[replica]['cycle_current']
+
+    def installSignalHandlers(self):
+        """
+        Drains the job on SIGUSR1 or SIGTERM: no more replicas are launched
+        and, after a SIGTERM, running replicas are waited for at most
+        DRAIN_TIMEOUT seconds. Must be called from the main thread.
+        """
+        signal.signal(signal.SIGUSR1, self._drainSignal)
+        signal.signal(signal.SIGTERM, self._drainSignal)
 
-        if self.keywords.get('MIN_TIME') is None:
-            min_time = 1
+    def _drainSignal(self, signum, frame):
+        if signum == signal.SIGTERM:
+            self.drain_planner.drain('received SIGTERM', self.drain_timeout)
         else:
-            min_time = float(self.keywords.get('MIN_TIME'))
+            self.drain_planner.drain('received signal %d' % signum)
 
+    def schedulingActive(self):
+        """
+        Returns True while there is time left to start new cycles and the
+        job is not draining.
+        """
+        return self.drain_planner.active(xrange(self.nreplicas))
 
-        start_time = time.time()
-        end_time = (start_time + 60*(self.walltime - replica_run_time) -
-                    cycle_time - 10)
-        while time.time() < end_time:
-            # comment out by Junchao to set the minimum time
-            # time.sleep(1)
+    def processMinTime(self):
+        """
+        Returns the time the job transport should keep collecting
+        completions before returning control for exchanges.
+        """
+        return self.exchange_trigger.minTime(self.timing.min_time)
 
-            self.updateStatus()
-            self.print_status()
-            self.launchJobs()
-            self.updateStatus()
-            self.print_status()
+    def launchStep(self):
+        """
+        First half of an iteration of the scheduling loop: updates the
+        status of the replicas and launches waiting ones.
+        """
+        # comment out by Junchao to set the minimum time
+        # time.sleep(1)
 
-            self.transport.ProcessJobQueue(min_time,cycle_time)
+        self.updateStatus()
+        self.print_status()
+        if (self.exchange and self.exchange_trigger.holds and
+            self.running == 0 and
+            self.exchange_trigger.ready(self._exchangePool(), 0)):
+            # no replica can join the exchange pool any more, exchanges the
+            # replicas held in it before launching them
+            with self.metrics.timer('doExchanges'):
+                self.doExchanges()
+        with self.metrics.timer('launchJobs'):
+            self.launchJobs()
+        self.updateStatus()
+        self.print_status()
 
-            self.updateStatus()
-            self.print_status()
-            if self.exchange:
+    def exchangeStep(self):
+        """
+        Second half of an iteration of the scheduling loop, once the job
+        transport has processed its queue: updates the status of the
+        replicas and performs exchanges.
+        """
+        self.updateStatus()
+        self.print_status()
+        if (self.exchange and
+            self.exchange_trigger.ready(self._exchangePool(), self.running)):
+            with self.metrics.timer('doExchanges'):
                 self.doExchanges()
+        self.write_metrics()
+        self.publish_status()
+
+    def finishScheduling(self):
+        """
+        Reports the scheduling statistics, waits for the running replicas to
+        complete and cleans up.
+        """
+        self.timing.report()
+        self.submission.report()
+        if self.exchange:
+            self.exchange_trigger.report()
+        self.drain_planner.report()
         self.updateStatus()
         self.print_status()
-        self.waitJob()
+        self.waitJob(self.timing.cycle_time)
+        self.print_status(force=True)
         self.cleanJob()
 
-    def waitJob(self):
-        # wait until all jobs are complete
-        completed = False
-        while not completed:
+    def waitJob(self, timeout = 30.0):
+        """
+        Waits until all running replicas have completed, or until the
+        deadline of the drain if any. Keeps the transport processing its
+        queue so that replicas still queued are launched, returning at least
+        every timeout seconds, and re-checks only the replicas still running.
+        Replicas still running at the deadline are stopped and restarted when
+        the job is restarted.
+        """
+        self.withdrawQueued()
+        while self.running > 0:
+            deadline = None
+            if self.drain_planner is not None:
+                deadline = self.drain_planner.deadline()
+            maxtime = timeout
+            if deadline is not None:
+                maxtime = min(timeout, deadline - time.time())
+                if maxtime <= 0:
+                    self.transport.terminateJobs(list(self.replicas_running))
+                    self.logger.warning('%d replicas still running at the end '
+                                        'of the drain', self.running)
+                    break
+            self.transport.ProcessJobQueue(0, maxtime)
             self.updateStatus()
-            completed = True
-            for k in range(self.nreplicas):
-                if self.status[k]['running_status'] == "R":
-                    completed = False
-            time.sleep(1)
+            self.write_metrics()
+            self.publish_status()
+        self._collectInpFiles(wait=True)
+
+    def withdrawQueued(self):
+        """
+        Takes back from the transport the queued replicas whose cycle has not
+        started and puts them back to wait, so that no new cycle starts once
+        the job stops launching.
+        """
+        withdrawn = self.transport.cancelQueued(list(self.replicas_running))
+        for k in withdrawn:
+            self._setRunningStatus(k, 'W')
+        if withdrawn:
+            self.logger.info('%d queued replicas withdrawn', len(withdrawn))
 
     def cleanJob(self):
-        return
+        self._collectInpFiles(wait=True)
+        if self._io_pool is not None:
+            self._io_pool.close()
+            self._io_pool.join()
+            self._io_pool = None
+        if self.retention_service is not None:
+            # the final sweep is skipped when the drain is time limited
+            # (SIGTERM)
+            self.retention_service.stop(
+                final=self.drain_planner.deadline() is None)
+            self.retention_service.report()
+            self.retention_service = None
+        self.state_history.close()
+        self.status_journal.compact(self.status)
+        self.status_journal.close()
+        self.write_metrics(force=True)
+        if self.status_server is not None:
+            self.publish_status(force=True)
+            self.status_server.close()
+            self.status_server = None
+
+    def write_metrics(self, force = False):
+        """
+        Writes the timing histograms and counters to BASENAME_metrics.json,
+        no more often than every METRICS_INTERVAL seconds unless force is
+        set.
+        """
+        now = time.time()
+        if not force and now - self._metrics_time < self.metrics_interval:
+            return
+        _write_atomic(self._jobPath('%s_metrics.json'%self.basename),
+                      self.metrics.dumps())
+        self._metrics_time = now
+
+    def _ioPool(self):
+        """
+        Returns the pool of threads used to prepare replica files, or None if
+        files are prepared in the main thread (IO_THREADS = 0).
+        """
+        if self._io_pool is None and self.io_threads > 0:
+            from multiprocessing.pool import ThreadPool
+            self._io_pool = ThreadPool(self.io_threads)
+        return self._io_pool
+
+    def _prepareReplica(self, replica):
+        """
+        Builds the input file of a replica for its current state and cycle in
+        the background. The replica is placed in the wait state by
+        _collectInpFiles() once its input file is ready; until then it must
+        be left in a non-wait state so it is neither launched nor exchanged.
+        """
+        pool = self._ioPool()
+        if pool is None:
+            with self.metrics.timer('buildInpFile'):
+                self._buildInpFile(replica)
+            self._setRunningStatus(replica, 'W')
+        else:
+            self._pending_inputs[replica] = pool.apply_async(
+                _guarded_call, (self._buildReadyInpFile, replica))
+
+    def _buildReadyInpFile(self, replica):
+        # worker thread: builds the input file and wakes up the controller
+        with self.metrics.timer('buildInpFile'):
+            self._buildInpFile(replica)
+        self.transport.notifyReady(replica)
+
+    def _writeStateHistory(self, replica, cycle, stateid, lambd = None,
+                           temperature = None):
+        """
+        Records in the state history of a replica the state it is assigned
+        for a cycle, along with the state parameters that apply to the job.
+        """
+        self.state_history.append(self._replicaDir(replica), cycle, stateid,
+                                  lambd, temperature)
+
+    def _collectInpFiles(self, wait = False):
+        """
+        Places in the wait state the replicas whose input files are ready.
+        If wait is set blocks until all pending input files are ready.
+        """
+        # replicas whose worker has notified that the input file is ready;
+        # their result may be posted a moment after the notification
+        ready = self.transport.readyReplicas()
+        for replica, result in self._pending_inputs.items():
+            if wait or replica in ready or result.ready():
+                value, error = result.get()
+                del self._pending_inputs[replica]
+                if error is not None:
+                    self.metrics.increment('failures')
+                    self._exit('Unable to prepare input file of replica %d: %s'
+                               % (replica, error))
+                self._setRunningStatus(replica, 'W')
 
     def _write_status(self):
         """
-        Pickle the current state of the RE job and write to in BASENAME.stat.
+        Save the current state of the RE job. Replica records that changed
+        since the last call are appended to the BASENAME.stat.journal
+        journal, which is periodically compacted into the BASENAME.stat
+        pickle.
         """
-        status_file = '%s.stat'%self.basename
-        f = _open(status_file,'w')
-        pickle.dump(self.status,f)
-        f.close()
+        with self.metrics.timer('write_status'):
+            self.status_journal.write(self.status)
 
     def _read_status(self):
         """
-        Unpickle and load the current state of the RE job from BASENAME.stat.
+        Load the current state of the RE job from BASENAME.stat and replay
+        the changes recorded in the journal.
         """
-        status_file = '%s.stat'%self.basename
-        f = _open(status_file,'r')
-        self.status = pickle.load(f)
-        f.close()
+        self.status = self.status_journal.load()
+        self._buildStatusIndex()
 
-    def print_status(self):
+    def print_status(self, force = False):
         """
         Writes to BASENAME_stat.txt a text version of the status of the RE job.
         It's fun to follow the progress in real time by doing:
         watch cat BASENAME_stat.txt
+
+        The file is rewritten only when the status table has changed, and no
+        more often than every STATUS_REPORT_INTERVAL seconds unless force is
+        set.
         """
-        log = 'Replica  State  Status  Cycle \n'
-        for k in range(self.nreplicas):
-            log += ('%6d   %5d  %5s  %5d \n'%
-                    (k,self.status[k]['stateid_current'],
-                     self.status[k]['running_status'],
-                     self.status[k]['cycle_current']))
-        log += 'Running = %d\n'%self.running
-        log += 'Waiting = %d\n'%self.waiting
-
-        logfile = '%s_stat.txt'%self.basename
-        ofile = _open(logfile,'w')
-        ofile.write(log)
-        ofile.close()
+        now = time.time()
+        if (not force and
+            now - self._status_report_time < self.status_report_interval):
+            return
+        table = [(record['stateid_current'], record['running_status'],
+                  record['cycle_current']) for record in self.status]
+        if table == self._status_report_table:
+            return
+
+        n = self.nreplicas
+        lines = [None]*(n + 3)
+        lines[0] = self._statusHeader()
+        for k in range(n):
+            lines[k+1] = self._statusLine(k)
+        lines[n+1] = 'Running = %d\n'%self.running
+        lines[n+2] = 'Waiting = %d\n'%self.waiting
+
+        _write_atomic(self._jobPath('%s_stat.txt'%self.basename),
+                      ''.join(lines))
+        self._status_report_time = now
+        self._status_report_table = table
+
+    def publish_status(self, force = False):
+        """
+        Publishes a snapshot of the status of the RE job to the status HTTP
+        server, if any, no more often than every STATUS_HTTP_INTERVAL
+        seconds unless force is set.
+        """
+        if self.status_server is None:
+            return
+        now = time.time()
+        if not force and now - self._status_publish_time < self.status_http_interval:
+            return
+        self.status_server.publish(self._statusSnapshot())
+        self._status_publish_time = now
+
+    def _statusSnapshot(self):
+        """
+        Returns a dictionary with the status table of the RE job and
+        summary figures of its progress.
+        """
+        metrics = self.metrics.snapshot()
+        counters = metrics['counters']
+        replicas = []
+        cycles_completed = 0
+        for k, record in enumerate(self.status):
+            replicas.append({'replica': k,
+                             'stateid_current': record['stateid_current'],
+                             'running_status': record['running_status'],
+                             'cycle_current': record['cycle_current']})
+            cycles_completed += record['cycle_current'] - 1
+        replicas_by_status = dict((status, len(replicas_in_status))
+                                  for status, replicas_in_status
+                                  in self._replicas_by_status.iteritems())
+        if metrics['uptime'] > 0:
+            completion_rate = counters.get('completions', 0)/metrics['uptime']
+        else:
+            completion_rate = 0.
+        cycle_duration = None
+        if self.timing is not None and self.timing.nsamples > 0:
+            cycle_duration = self.timing.runtime_mean
+        exchange_acceptance = None
+        if counters.get('exchanged_replicas', 0) > 0:
+            exchange_acceptance = (counters.get('accepted_swaps', 0)/
+                                   float(counters['exchanged_replicas']))
+        return {'basename': self.basename,
+                'nreplicas': self.nreplicas,
+                'replicas': replicas,
+                'replicas_by_status': replicas_by_status,
+                'running': self.running,
+                'waiting': self.waiting,
+                'slots': self.available_slots,
+                'slot_utilization': (min(self.running, self.available_slots)/
+                                     float(self.available_slots)),
+                'cycles_completed': cycles_completed,
+                'completion_rate': completion_rate,
+                'cycle_duration': cycle_duration,
+                'exchange_acceptance': exchange_acceptance,
+                'metrics': metrics}
+
+    def _statusHeader(self):
+        """Returns the header line of BASENAME_stat.txt"""
+        return 'Replica  State  Status  Cycle \n'
+
+    def _statusLine(self, replica):
+        """Returns the line of BASENAME_stat.txt for a replica"""
+        return ('%6d   %5d  %5s  %5d \n'%
+                (replica,self.status[replica]['stateid_current'],
+                 self.status[replica]['running_status'],
+                 self.status[replica]['cycle_current']))
 
     def updateStatus(self, restart = False):
         """Scan the replicas and update their states."""
-        self.transport.poll() # WFF 2/18/15
-        for k in range(self.nreplicas):
-            self._updateStatus_replica(k,restart)
+        if restart:
+            self._recoverReplicas()
+            return
+        start_time = time.time()
+        # only running replicas can change state
+        replicas = list(self.replicas_running)
+        with self.metrics.timer('transport.poll'):
+            self.transport.poll(replicas) # WFF 2/18/15
+        # completions notified so far, including those raised by the poll,
+        # are all picked up by this scan
+        self.transport.completedReplicas()
+        for k in replicas:
+            self._updateStatus_replica(k)
+        self._collectInpFiles()
+        self._observeSlots()
         self._write_status()
+        self.metrics.observe('updateStatus', time.time() - start_time)
 
-    def _updateStatus_replica(self, replica, restart):
+    def _updateStatus_replica(self, replica):
         """
         Update the status of the specified replica. If it has completed a cycle
         the input file for the next cycle is prepared and the replica is placed
-        in the wait state.
+        in the wait state once it is ready.
         """
         this_cycle = self.status[replica]['cycle_current']
-        if restart:
-            if self.status[replica]['running_status'] == 'R':
+        if self.status[replica]['running_status'] == 'R':
+            if self.transport.isDone(replica,this_cycle):
+                self._setRunningStatus(replica, 'S')
+                #MD engine modules implement ways to check for completion.
+                #by testing existence of output file, etc.
                 if self._hasCompleted(replica,this_cycle):
                     self.status[replica]['cycle_current'] += 1
+                    self.metrics.increment('completions')
                 else:
+                    self.metrics.increment('failures')
                     self.logger.warning('_updateStatus_replica(): restarting replica %s (cycle %s)',
                                         replica, this_cycle)
+                self._prepareReplica(replica)
+
+    def _recoverReplicas(self):
+        """
+        Brings all replicas to the wait state after a restart. Replicas that
+        were running are checked for completion of their cycle, and input
+        files are rebuilt unless the existing ones are up to date. Replicas
+        are processed concurrently on the IO_THREADS pool.
+        """
+        with self.metrics.timer('transport.poll'):
+            self.transport.poll(range(self.nreplicas))
+        outcomes = self._mapIO(self._recoverReplica, range(self.nreplicas))
+        for k in range(self.nreplicas):
+            self._setRunningStatus(k, 'W')
+        self._write_status()
+
+        report = {}
+        for completed, rebuilt in outcomes:
+            report[completed] = report.get(completed, 0) + 1
+            report[rebuilt] = report.get(rebuilt, 0) + 1
+        self.logger.info('Recovery: %d completed cycles recovered, %d '
+                         'replicas restarted, %d input files rebuilt, %d '
+                         'input files reused', report.get('completed', 0),
+                         report.get('restarted', 0), report.get('rebuilt', 0),
+                         report.get('reused', 0))
+
+    def _recoverReplica(self, replica):
+        """
+        Reconciles the status of a replica with its files after a restart.
+        Returns a tuple with the outcome of the completion check
+        ('completed', 'restarted' or None if the replica was not running)
+        and whether the input file was 'rebuilt' or 'reused'.
+        """
+        completed = None
+        this_cycle = self.status[replica]['cycle_current']
+        if self.status[replica]['running_status'] == 'R':
+            if self._hasCompleted(replica,this_cycle):
+                self.status[replica]['cycle_current'] += 1
+                completed = 'completed'
+            else:
+                self.logger.warning('_recoverReplica(): restarting replica %s (cycle %s)',
+                                    replica, this_cycle)
+                completed = 'restarted'
+        if self._inpFileUpToDate(replica):
+            self._reuseInpFile(replica)
+            return (completed, 'reused')
+        with self.metrics.timer('buildInpFile'):
             self._buildInpFile(replica)
-            self.status[replica]['running_status'] = 'W'
-        else:
-            if self.status[replica]['running_status'] == 'R':
-               if self.transport.isDone(replica,this_cycle):
-                    self.status[replica]['running_status'] = 'S'
-                     #MD engine modules implement ways to check for completion.
-                     #by testing existence of output file, etc.
-                    if self._hasCompleted(replica,this_cycle):
-                        self.status[replica]['cycle_current'] += 1
-                    else:
-                        self.logger.warning('_updateStatus_replica(): restarting replica %s (cycle %s)',
-                                            replica, this_cycle)
-                    self._buildInpFile(replica)
-                    self.status[replica]['running_status'] = 'W'
+        return (completed, 'rebuilt')
+
+    def _inpFileUpToDate(self, replica):
+        """
+        Returns True if the input file of a replica for its current state and
+        cycle exists and does not need to be rebuilt. MD engine modules able
+        to tell implement this; by default input files are always rebuilt.
+        """
+        return False
+
+    def _reuseInpFile(self, replica):
+        """
+        Called after a restart when the input file of a replica is reused
+        rather than rebuilt. The state history record written along with
+        the input file may have been lost with the history buffers, MD
+        engine modules that reuse input files append it if it is missing.
+        """
+        return
 
     def _njobs_to_run(self):
-        # size of subjob buffer as a percentage of job slots
-        # (TOTAL_CORES/SUBJOB_CORES)
-        subjobs_buffer_size = self.keywords.get('SUBJOBS_BUFFER_SIZE')
-        if subjobs_buffer_size is None:
-            subjobs_buffer_size = 0.5
-        else:
-            subjobs_buffer_size = float(subjobs_buffer_size)
         # launch new replicas if the number of submitted/running subjobs is
         # less than the number of available slots
-        # (total_cores/subjob_cores) + 50%
-        available_slots = (int(self.keywords.get('TOTAL_CORES')) /
-                           int(self.keywords.get('SUBJOB_CORES')))
-        max_njobs_submittable = int((1.+subjobs_buffer_size)*available_slots)
-        # WFF: added so that jobs without exchange can launch all jobs possible
-        # Will make it so without exchange: waiting - max(0, nreplicas - max_jobs)
-        nlaunch = self.waiting - max(2*int(self.exchange), self.nreplicas - max_njobs_submittable)
+        # (total_cores/subjob_cores) + buffer (50% unless tuned)
+        available_slots = self.available_slots
+        max_njobs_submittable = self.submission.maxSubmitted()
+        # keeps the exchange reserve waiting, and counts the replicas actually
+        # submitted rather than assuming that all those not waiting are: the
+        # replicas whose input files are being built are in the S state
+        nlaunch = min(self.waiting - self.submission.reserve,
+                      max_njobs_submittable - self.running)
         nlaunch = max(0,nlaunch)
         if self.verbose:
             self.logger.debug('available_slots: %d', available_slots)
             self.logger.debug('max job queue size: %d', max_njobs_submittable)
+            self.logger.debug('exchange reserve: %d', self.submission.reserve)
             self.logger.debug('running/submitted subjobs: %d', self.running)
             self.logger.debug('waiting replicas: %d', self.waiting)
             self.logger.debug('replicas to launch: %d', nlaunch)
@@ -524,26 +1230,58 @@ class async_re(object):
 
     def launchJobs(self):
         """
-        Scans the replicas in wait state and randomly launches them
+        Scans the replicas in wait state and launches them in the order set by
+        LAUNCH_PRIORITY (at random by default)
         """
         jobs_to_launch = self._njobs_to_run()
         if jobs_to_launch > 0:
-            wait = self.replicas_waiting
-            random.shuffle(wait)
-            n = min(jobs_to_launch,len(wait))
-            for k in wait[0:n]:
+            waiting = self.replicas_waiting
+            if self.exchange:
+                # replicas held in the exchange pool by EXCHANGE_TRIGGER
+                held = self.exchange_trigger.held(self._exchangePool(),
+                                                  self.running)
+                if held:
+                    waiting = waiting - held
+            wait = self.launch_priority.select(waiting, jobs_to_launch)
+            now = time.time()
+            for k in wait:
+                if (self.drain_planner is not None and
+                    not self.drain_planner.canLaunch(k, now)):
+                    # would not complete before the end of the allocation
+                    if self.drain_planner.skipped(k):
+                        self.metrics.increment('drain_skipped')
+                    continue
                 self.logger.info('Launching replica %d cycle %d', k, self.status[k]['cycle_current'])
                 # the _launchReplica function is implemented by
                 # MD engine modules
                 status = self._launchReplica(k,self.status[k]['cycle_current'])
                 if status != None:
-                    self.status[k]['running_status'] = 'R'
+                    self.launch_priority.launched(k)
+                    self._setRunningStatus(k, 'R')
+                    self.metrics.increment('launches')
+                else:
+                    self.metrics.increment('launch_failures')
+        self._observeSlots()
+
+    def _observeSlots(self):
+        # samples the use of the job slots for SUBJOBS_BUFFER_AUTOTUNE, after
+        # launches and completions
+        self.submission.observe(self.running, self.transport.busyTime())
+
+    def _exchangePool(self):
+        # (replica, cycle) pairs of the waiting replicas that can be
+        # exchanged
+        return [(k, self.status[k]['cycle_current'])
+                for k in self.replicas_waiting_to_exchange]
 
     def doExchanges(self):
         """Perform exchanges among waiting replicas using Gibbs sampling."""
 
-        replicas_to_exchange = self.replicas_waiting_to_exchange
-        states_to_exchange = self.states_waiting_to_exchange
+        # sorted so that the exchanges do not depend on the order of the
+        # index
+        replicas_to_exchange = sorted(self.replicas_waiting_to_exchange)
+        states_to_exchange = [self.status[k]['stateid_current']
+                              for k in replicas_to_exchange]
         nreplicas_to_exchange = len(replicas_to_exchange)
         if nreplicas_to_exchange < 2:
             return 0
@@ -552,10 +1290,12 @@ class async_re(object):
             self.logger.debug('Initiating exchanges amongst %d replicas:', nreplicas_to_exchange)
 
         exchange_start_time = time.time()
+        initial_states = [self.status[k]['stateid_current']
+                          for k in replicas_to_exchange]
         # backtrack cycle of waiting replicas
         for k in replicas_to_exchange:
             self.status[k]['cycle_current'] -= 1
-            self.status[k]['running_status'] = 'E'
+            self._setRunningStatus(k, 'E')
         # Matrix of replica energies in each state.
         # The computeSwapMatrix() function is defined by application
         # classes (Amber/US, Impact/BEDAM, etc.)
@@ -563,59 +1303,19 @@ class async_re(object):
         swap_matrix = self._computeSwapMatrix(replicas_to_exchange,
                                               states_to_exchange)
         matrix_time = time.time() - matrix_start_time
+        self.metrics.observe('computeSwapMatrix', matrix_time)
 
         sampling_start_time = time.time()
         # Perform an exchange for each of the n replicas, m times
-        if self.nexchg_rounds >= 0:
-            mreps = self.nexchg_rounds
-        else:
-            mreps = nreplicas_to_exchange**(-self.nexchg_rounds)
-        for reps in range(mreps):
-            if self.exchangeBySet:
-                for repl_i in replicas_to_exchange:
-                    sid_i = self.status[repl_i]['stateid_current']
-                    curr_states = [self.status[repl_j]['stateid_current']
-                                   for repl_j in replicas_to_exchange]
-                    if self.exchangeMethod == 'restrained_gibbs' :
-                        repl_j = pairwise_independence_sampling(repl_i,sid_i,
-                                                        replicas_to_exchange,
-                                                        curr_states,
-                                                        swap_matrix)
-                    elif self.exchangeMethod == 'pairwise_metropolis':
-                        repl_j = pairwise_metropolis_sampling(repl_i,sid_i,
-                                                        replicas_to_exchange,
-                                                        curr_states,
-                                                        swap_matrix)
-                    else :
-                        self._exit("unknown exchange method %s" % self.exchangeMethod)
-                    if repl_j != repl_i:
-                        sid_i = self.status[repl_i]['stateid_current']
-                        sid_j = self.status[repl_j]['stateid_current']
-                        self.status[repl_i]['stateid_current'] = sid_j
-                        self.status[repl_j]['stateid_current'] = sid_i
-            else:
-                repl_i = choice(replicas_to_exchange)
-                sid_i = self.status[repl_i]['stateid_current']
-                curr_states = [self.status[repl_j]['stateid_current']
-                               for repl_j in replicas_to_exchange]
-                if self.exchangeMethod == 'pairwise_metropolis':
-                    repl_j = pairwise_metropolis_sampling(repl_i,sid_i,
-                                                        replicas_to_exchange,
-                                                        curr_states,
-                                                        swap_matrix)
-                elif self.exchangeMethod == 'restrained_gibbs' :
-                    repl_j = pairwise_independence_sampling(repl_i,sid_i,
-                                                        replicas_to_exchange,
-                                                        curr_states,
-                                                        swap_matrix)
-                else:
-                    self._exit("unknown exchange method %s" % self.exchangeMethod)
-                if repl_j != repl_i:
-                    sid_i = self.status[repl_i]['stateid_current']
-                    sid_j = self.status[repl_j]['stateid_current']
-                    self.status[repl_i]['stateid_current'] = sid_j
-                    self.status[repl_j]['stateid_current'] = sid_i
-
+        # gibbs_sampling needs numpy, loaded only once exchanges take place
+        from gibbs_sampling import exchange_rounds, sample_state_exchanges
+        mreps = exchange_rounds(self.nexchg_rounds, nreplicas_to_exchange)
+        new_states = sample_state_exchanges(replicas_to_exchange, initial_states,
+                                            swap_matrix, mreps,
+                                            self.exchangeBySet,
+                                            self.exchangeMethod)
+        for k, sid in zip(replicas_to_exchange, new_states):
+            self.status[k]['stateid_current'] = sid
 
         # Uncomment to debug Gibbs sampling:
         # Actual and observed populations of state permutations should match.
@@ -624,13 +1324,23 @@ class async_re(object):
         # self._debug_validate_state_populations(replicas_to_exchange,
         #                                        states_to_exchange,U)
         sampling_time = time.time() - sampling_start_time
+        self.metrics.observe('gibbs_sampling', sampling_time)
+        naccepted = 0
+        for k, sid in zip(replicas_to_exchange, initial_states):
+            if self.status[k]['stateid_current'] != sid:
+                naccepted += 1
+        self.submission.exchanged(nreplicas_to_exchange, naccepted)
+        self.metrics.increment('exchanges')
+        self.metrics.increment('exchanged_replicas', nreplicas_to_exchange)
+        self.metrics.increment('accepted_swaps', naccepted)
         # Write new input files.
         for k in replicas_to_exchange:
-            # Create new input files for the next cycle and place replicas back
-            # into "W" (wait) state.
+            # Create new input files for the next cycle, replicas are placed
+            # back into "W" (wait) state once they are ready.
             self.status[k]['cycle_current'] += 1
-            self._buildInpFile(k)
-            self.status[k]['running_status'] = 'W'
+            self._prepareReplica(k)
+        self.exchange_trigger.exchanged([(k, self.status[k]['cycle_current'])
+                                         for k in replicas_to_exchange])
 
         total_time = time.time() - exchange_start_time
 
@@ -706,6 +1416,9 @@ class async_re(object):
         the observed distribution. The similarity of these distributions is
         measured via the Kullback-Liebler divergence.
         """
+        from gibbs_sampling import (state_perm_distribution,
+                                    sample_to_state_perm_distribution,
+                                    state_perm_divergence)
         empirical = sample_to_state_perm_distribution(self.nperm,replicas,
                                                       states)
         exact = state_perm_distribution(replicas,states,U)
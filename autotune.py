@@ -0,0 +1,381 @@
+"""
+Feedback controllers that tune the scheduling parameters of an ASyncRE job
+from the observed behavior of its replicas.
+"""
+import time
+import math
+import logging
+
+class CycleTimeController(object):
+    """
+    Tunes the scheduling intervals of an RE job from the observed wall clock
+    durations of replica cycles and the time replicas spend waiting to be
+    launched.
+
+    The controller is fed the running state transitions of the replicas
+    (see async_re._setRunningStatus()) and maintains exponentially weighted
+    averages of the cycle durations (launch to completion) and of the wait
+    times (ready to launch), as well as the duration of the last cycle of
+    each replica and the time each waiting replica became ready (see
+    LaunchPriority). When adaptive, it derives from them:
+
+    cycle_time: the longest time the controller blocks waiting for
+        replicas to complete, a tenth of the average cycle duration bounded
+        by MIN_TIME and CYCLE_TIME.
+    min_time: the time the controller keeps collecting completions before
+        exchanging, which sets the exchange cadence, a hundredth of the
+        average cycle duration bounded by MIN_TIME and cycle_time/2.
+
+    Until enough cycles have been observed, or if not adaptive, the static
+    settings are used. The cycle durations and wait times also drive the end
+    of run decisions of DrainPlanner, whether adaptive or not.
+    """
+    def __init__(self, nreplicas, cycle_time, min_time, adaptive = True,
+                 min_samples = 5, smoothing = 0.1):
+        # cycle_time, min_time: static settings (CYCLE_TIME and MIN_TIME),
+        #                       in seconds
+        # min_samples: number of cycles to observe before tuning
+        # smoothing: weight of new observations in the running averages
+        self.logger = logging.getLogger("async_re.autotune")
+        self.adaptive = adaptive
+        self.max_cycle_time = cycle_time
+        self.base_min_time = min_time
+        self.min_samples = min_samples
+        self.smoothing = smoothing
+
+        self.cycle_time = cycle_time
+        self.min_time = min_time
+
+        # time at which each replica was last launched/became ready
+        self.launch_time = [None for k in range(nreplicas)]
+        self.ready_time = [None for k in range(nreplicas)]
+        # duration of the last completed cycle of each replica
+        self.last_runtime = [None for k in range(nreplicas)]
+
+        self.nsamples = 0
+        self.runtime_mean = 0.
+        self.runtime_var = 0.
+        self.wait_mean = 0.
+
+    def _average(self, mean, var, x):
+        # exponentially weighted running mean and variance
+        diff = x - mean
+        incr = self.smoothing*diff
+        return (mean + incr, (1. - self.smoothing)*(var + diff*incr))
+
+    def transition(self, replica, old_status, new_status, now = None):
+        """
+        Records a running state transition of a replica.
+        """
+        if now is None:
+            now = time.time()
+        if new_status == 'R':
+            if self.ready_time[replica] is not None:
+                wait = now - self.ready_time[replica]
+                (self.wait_mean, var) = self._average(self.wait_mean, 0., wait)
+            self.launch_time[replica] = now
+        elif old_status == 'R' and new_status == 'W':
+            # withdrawn from the transport queue before it started, keeps
+            # waiting since it was first ready
+            self.launch_time[replica] = None
+            return
+        elif old_status == 'R' and self.launch_time[replica] is not None:
+            runtime = now - self.launch_time[replica]
+            self.last_runtime[replica] = runtime
+            if self.nsamples == 0:
+                self.runtime_mean = runtime
+            else:
+                (self.runtime_mean, self.runtime_var) = self._average(
+                    self.runtime_mean, self.runtime_var, runtime)
+            self.nsamples += 1
+            self.launch_time[replica] = None
+            self._retune()
+        if new_status == 'W' and old_status != 'E':
+            # replicas returning from an exchange keep waiting since they
+            # were first ready
+            self.ready_time[replica] = now
+
+    def tuned(self):
+        """Returns True if the tuned values are in effect."""
+        return self.adaptive and self.nsamples >= self.min_samples
+
+    def _retune(self):
+        if not self.tuned():
+            return
+        self.cycle_time = min(self.max_cycle_time,
+                              max(self.base_min_time, 0.1*self.runtime_mean))
+        self.min_time = min(0.5*self.cycle_time,
+                            max(self.base_min_time, 0.01*self.runtime_mean))
+
+    def report(self):
+        """Logs the current estimates and settings."""
+        self.logger.info("cycle duration: %.1f +/- %.1f s (%d cycles), wait: "
+                         "%.1f s, cycle_time: %.1f s, min_time: %.2f s",
+                         self.runtime_mean, math.sqrt(self.runtime_var),
+                         self.nsamples, self.wait_mean, self.cycle_time,
+                         self.min_time)
+
+class SubmissionBufferTuner(object):
+    """
+    Tunes the number of replicas the controller keeps submitted to the job
+    transport and the number of waiting replicas it holds back for
+    exchanges.
+
+    The controller launches waiting replicas until (1 + buffer) times the
+    number of job slots (TOTAL_CORES/SUBJOB_CORES) are submitted or
+    running, but always holds back at least `reserve` waiting replicas to
+    exchange with. With a static buffer, slots are left idle on pools of
+    heterogeneous nodes where replicas complete at very different rates,
+    while a large buffer leaves few replicas to exchange with.
+
+    The tuner integrates over a window of time the fraction of job slots
+    left idle, from the slot time used by the jobs as recorded by the
+    transport (or, if the transport does not record it, from the number of
+    replicas submitted or running at each launch), and records the fraction of replicas changing state in
+    exchanges (the acceptance). At the end of each window, if adaptive:
+
+    - if slots were idle beyond the tolerance, the buffer is grown and the
+      reserve shrunk to feed the transport more replicas;
+    - otherwise, if exchanges rarely change the states of replicas, the
+      reserve is grown so that more replicas take part in exchanges, and
+      the buffer is shrunk towards its base value.
+    """
+    def __init__(self, slots, buffer_size, reserve, adaptive = True,
+                 window = 60.0, idle_tolerance = 0.05, min_acceptance = 0.2,
+                 max_buffer_size = 2.0, step = 0.1):
+        # slots: number of job slots (TOTAL_CORES/SUBJOB_CORES)
+        # buffer_size: initial size of the submission buffer as a fraction
+        #              of the slots (SUBJOBS_BUFFER_SIZE)
+        # reserve: initial number of waiting replicas held back for exchanges
+        # window: time in seconds over which the behavior is observed
+        #         before retuning
+        # idle_tolerance: fraction of idle slot time considered saturated
+        # min_acceptance: exchange acceptance below which the reserve grows
+        self.logger = logging.getLogger("async_re.autotune")
+        self.slots = slots
+        self.adaptive = adaptive
+        self.window = window
+        self.idle_tolerance = idle_tolerance
+        self.min_acceptance = min_acceptance
+        self.base_buffer_size = buffer_size
+        self.max_buffer_size = max(buffer_size, max_buffer_size)
+        self.step = step
+        self.min_reserve = reserve
+        self.max_reserve = max(reserve, slots)
+
+        self.buffer_size = buffer_size
+        self.reserve = reserve
+
+        self._last_time = None
+        self._last_idle = 0.
+        self._last_busy = None
+        self._window_start = None
+        self._idle_time = 0.
+        self._exchanged = 0
+        self._accepted = 0
+
+    def maxSubmitted(self):
+        """Returns the number of replicas to keep submitted or running."""
+        return int((1. + self.buffer_size)*self.slots)
+
+    def observe(self, running, busy_time = None, now = None):
+        """
+        Records the number of replicas submitted or running and the slot
+        time used so far by their jobs (None if unknown), after launches
+        and on completions.
+        """
+        if now is None:
+            now = time.time()
+        if self._last_time is not None:
+            elapsed = now - self._last_time
+            if busy_time is not None and self._last_busy is not None:
+                self._idle_time += max(0., self.slots*elapsed -
+                                       (busy_time - self._last_busy))/self.slots
+            else:
+                self._idle_time += self._last_idle*elapsed
+        else:
+            self._window_start = now
+        self._last_time = now
+        self._last_busy = busy_time
+        self._last_idle = max(0, self.slots - running)/float(self.slots)
+        if now - self._window_start >= self.window:
+            self._retune(now - self._window_start)
+            self._window_start = now
+            self._idle_time = 0.
+            self._exchanged = 0
+            self._accepted = 0
+
+    def exchanged(self, nreplicas, naccepted):
+        """
+        Records an exchange among nreplicas replicas of which naccepted
+        changed state.
+        """
+        self._exchanged += nreplicas
+        self._accepted += naccepted
+
+    def _retune(self, elapsed):
+        if not self.adaptive or elapsed <= 0:
+            return
+        idle = self._idle_time/elapsed
+        if self._exchanged > 0:
+            acceptance = self._accepted/float(self._exchanged)
+        else:
+            acceptance = None
+        if idle > self.idle_tolerance:
+            self.buffer_size = min(self.max_buffer_size,
+                                   self.buffer_size + self.step)
+            self.reserve = max(self.min_reserve, self.reserve - 1)
+        else:
+            if acceptance is not None and acceptance < self.min_acceptance:
+                self.reserve = min(self.max_reserve, self.reserve + 1)
+            self.buffer_size = max(self.base_buffer_size,
+                                   self.buffer_size - self.step)
+        if acceptance is None:
+            self.logger.debug("slot idle fraction: %.3f, buffer: %.2f, "
+                              "reserve: %d", idle, self.buffer_size,
+                              self.reserve)
+        else:
+            self.logger.debug("slot idle fraction: %.3f, exchange acceptance: "
+                              "%.3f, buffer: %.2f, reserve: %d", idle,
+                              acceptance, self.buffer_size, self.reserve)
+
+    def report(self):
+        """Logs the current settings."""
+        self.logger.info("submission buffer: %.2f (%d jobs), exchange "
+                         "reserve: %d", self.buffer_size,
+                         self.maxSubmitted(), self.reserve)
+
+class DrainPlanner(object):
+    """
+    Decides which replicas may still be launched as the end of the
+    allocation (WALL_TIME) approaches, and when the job drains.
+
+    The duration of the next cycle of a replica is predicted from the cycle
+    history recorded by a CycleTimeController: the duration of the last
+    cycle of the replica (or the average duration if the replica has not
+    completed a cycle yet) plus nsigma standard deviations. A replica is
+    launched only if it is predicted to complete `margin` seconds, plus the
+    average time replicas wait between cycles, before the end of the
+    allocation: the last cycles completed still wait to be exchanged or
+    collected as the job winds down. Until enough cycles have been observed
+    the static estimate (twice REPLICA_RUN_TIME) and the static margin are
+    used for all replicas. Predictions do not depend on ADAPTIVE_TIMING,
+    which only tunes the scheduling intervals.
+
+    The job drains, that is it stops launching replicas and waits for the
+    running ones to complete, once no replica can complete in time or when
+    a drain is requested, e.g. on SIGUSR1. A drain requested with a timeout,
+    e.g. on SIGTERM, waits for the running replicas only up to the timeout;
+    replicas still running are restarted when the job is restarted.
+    """
+    def __init__(self, timing, end_time, static_runtime, margin,
+                 nsigma = 2., min_samples = 5):
+        # timing: CycleTimeController recording the replica cycles
+        # end_time: end of the allocation (time.time() scale)
+        # static_runtime: cycle duration in seconds assumed until enough
+        #                 cycles have been observed
+        # margin: time in seconds needed to wind down after the last cycle
+        # min_samples: number of cycles to observe before predicting
+        self.logger = logging.getLogger("async_re.autotune")
+        self.timing = timing
+        self.end_time = end_time
+        self.static_runtime = static_runtime
+        self.margin = margin
+        self.nsigma = nsigma
+        self.min_samples = min_samples
+
+        self.draining = False
+        self.reason = None
+        # time after which the drain stops waiting for running replicas
+        self.drain_deadline = None
+        # replicas not launched since they would not complete in time
+        self._skipped = set()
+        self.nskipped = 0
+
+    def predict(self, replica):
+        """
+        Returns the predicted duration in seconds of the next cycle of a
+        replica.
+        """
+        timing = self.timing
+        if timing.nsamples < self.min_samples:
+            return self.static_runtime
+        runtime = timing.last_runtime[replica]
+        if runtime is None:
+            runtime = timing.runtime_mean
+        return runtime + self.nsigma*math.sqrt(timing.runtime_var)
+
+    def windDown(self):
+        """
+        Returns the time in seconds the job needs after the completion of
+        the last cycle launched.
+        """
+        if self.timing.nsamples < self.min_samples:
+            return self.margin
+        return self.margin + self.timing.wait_mean
+
+    def canLaunch(self, replica, now = None):
+        """
+        Returns True if a replica launched now is predicted to complete in
+        time.
+        """
+        if self.draining:
+            return False
+        if now is None:
+            now = time.time()
+        return (now + self.predict(replica) + self.windDown() <=
+                self.end_time)
+
+    def skipped(self, replica):
+        """
+        Records that a waiting replica was not launched. Returns True the
+        first time a replica is skipped, so that each replica is counted
+        once however many times it is considered for launch.
+        """
+        if replica in self._skipped:
+            return False
+        self._skipped.add(replica)
+        self.nskipped += 1
+        return True
+
+    def active(self, replicas, now = None):
+        """
+        Returns True while some of the given replicas can still be launched
+        and complete in time. Otherwise starts draining.
+        """
+        if self.draining:
+            return False
+        if now is None:
+            now = time.time()
+        for k in replicas:
+            if self.canLaunch(k, now):
+                return True
+        self.drain("no replica can complete a cycle before the end of the "
+                   "allocation")
+        return False
+
+    def drain(self, reason, timeout = None):
+        """
+        Starts draining. If timeout is given, running replicas are waited for
+        for at most timeout seconds from now.
+        """
+        if not self.draining:
+            self.logger.info("draining: %s", reason)
+            self.draining = True
+            self.reason = reason
+        if timeout is not None:
+            deadline = time.time() + timeout
+            if self.drain_deadline is None or deadline < self.drain_deadline:
+                self.drain_deadline = deadline
+
+    def deadline(self):
+        """
+        Returns the time after which running replicas are no longer waited
+        for, or None to wait for all of them.
+        """
+        return self.drain_deadline
+
+    def report(self):
+        """Logs the state of the drain."""
+        self.logger.info("drain: %s, %d replicas not launched", self.reason,
+                         self.nskipped)
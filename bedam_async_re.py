@@ -14,7 +14,7 @@ class bedam_async_re_job(impact_job):
     def _checkInput(self):
         async_re._checkInput(self)
         #make sure BEDAM is wanted
-        if self.keywords.get('RE_TYPE') != 'BEDAM':
+        if self.re_type != 'BEDAM':
             self._exit("RE_TYPE is not BEDAM")
         #BEDAM runs with IMPACT
         if self.keywords.get('ENGINE') != 'IMPACT':
@@ -45,39 +45,22 @@ class bedam_async_re_job(impact_job):
 #            self.stateparams.append(st)
 #        return len(self.stateparams)
 
-    def _buildInpFile(self, replica):
+    def _inpFileParameters(self, replica):
         """
-        Builds input file for a BEDAM replica based on template input file
-        BASENAME.inp for the specified replica at lambda=lambda[stateid] for the
-        specified cycle.
+        Returns the template values of the input file of a BEDAM replica, at
+        lambda=lambda[stateid] for the current cycle, and its state
+        parameters (lambda, temperature).
         """
-        basename = self.basename
         stateid = self.status[replica]['stateid_current']
         cycle = self.status[replica]['cycle_current']
-
-        template = "%s.inp" % basename
-        inpfile = "r%d/%s_%d.inp" % (replica, basename, cycle)
         lambd = self.lambdas[stateid]
-        # read template buffer
-        tfile = self._openfile(template, "r")
-        tbuffer = tfile.read()
-        tfile.close()
-        # make modifications
-        tbuffer = tbuffer.replace("@n@",str(cycle))
-        tbuffer = tbuffer.replace("@nm1@",str(cycle-1))
-        tbuffer = tbuffer.replace("@lambda@",lambd)
-        tbuffer = tbuffer.replace("@jobname@",basename)
-        tbuffer = tbuffer.replace("@replica@",str(replica))
-        tbuffer = tbuffer.replace("@cycle@",str(cycle))
-        # write out
-        ofile = self._openfile(inpfile, "w")
-        ofile.write(tbuffer)
-        ofile.close()
-
-        # update the history status file
-        ofile = self._openfile("r%d/state.history" % replica, "a")
-        ofile.write("%d %d %s\n" % (cycle, stateid, lambd))
-        ofile.close()
+        values = {'n': cycle,
+                  'nm1': cycle-1,
+                  'lambda': lambd,
+                  'jobname': self.basename,
+                  'replica': replica,
+                  'cycle': cycle}
+        return (values, lambd, None)
 
 
     def _doExchange_pair(self,repl_a,repl_b):
@@ -98,7 +81,7 @@ class bedam_async_re_job(impact_job):
         du = float(u_b) - float(u_a)
         delta = -dl*du
 
-        if self.keywords.get('VERBOSE') == "yes":
+        if self.verbose:
             self.logger.info("Pair Info")
             self.logger.info("%d %s %s", repl_a, lambda_a, u_a)
             self.logger.info("%d %s %s", repl_b, lambda_b, u_b)
@@ -108,22 +91,22 @@ class bedam_async_re_job(impact_job):
         if math.exp(-self.bedam_beta*delta) > csi:
             status_func = lambda val: self.status[val]['stateid_current']
 
-            if self.keywords.get('VERBOSE') == "yes":
-                self.logger.info("Accepted %f %f", math.exp(-self.bedam_beta*delta, csi))
+            if self.verbose:
+                self.logger.info("Accepted %f %f", math.exp(-self.bedam_beta*delta), csi)
                 self.logger.info("%s %s", status_func(repl_a), status_func(repl_b))
             self.status[repl_a]['stateid_current'] = sid_b
             self.status[repl_b]['stateid_current'] = sid_a
-            if self.keywords.get('VERBOSE') == "yes":
+            if self.verbose:
                 self.logger.info("%s %s", status_func(repl_a), status_func(repl_b))
         else:
-            if self.keywords.get('VERBOSE') == "yes":
-                self.logger.info("Rejected %f %f", math.exp(-self.bedam_beta*delta, csi))
+            if self.verbose:
+                self.logger.info("Rejected %f %f", math.exp(-self.bedam_beta*delta), csi)
 
     def _extractLast_BindingEnergy(self,repl,cycle):
         """
         Extracts binding energy from Impact output
         """
-        output_file = "r%s/%s_%d.out" % (repl,self.basename,cycle)
+        output_file = self._replicaPath(repl, "%s_%d.out" % (self.basename,cycle))
         datai = self._getImpactData(output_file)
         nf = len(datai[0])
         nr = len(datai)
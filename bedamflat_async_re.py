@@ -18,7 +18,7 @@ class bedamflat_async_re_job(bedamtempt_async_re_job):
         """
         Extracts binding energy from Impact output
         """
-        output_file = "r%s/%s_%d.out" % (repl,self.basename,cycle)
+        output_file = self._replicaPath(repl, "%s_%d.out" % (self.basename,cycle))
         datai = self._getImpactData(output_file)
         nf = len(datai[0])
         nr = len(datai)
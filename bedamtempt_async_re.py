@@ -13,7 +13,7 @@ class bedamtempt_async_re_job(bedam_async_re_job):
     def _checkInput(self):
         async_re._checkInput(self)
         #make sure BEDAM + TEMPERATURE is wanted
-        if self.keywords.get('RE_TYPE') != 'BEDAMTEMPT':
+        if self.re_type != 'BEDAMTEMPT':
             self._exit("RE_TYPE is not BEDAMTEMPT")
         #BEDAM runs with IMPACT
         if self.keywords.get('ENGINE') != 'IMPACT':
@@ -49,39 +49,21 @@ class bedamtempt_async_re_job(bedam_async_re_job):
         return len(self.stateparams)
 
 
-    def _buildInpFile(self, replica):
+    def _inpFileParameters(self, replica):
         """
-        Builds input file for a BEDAM replica based on template input file
-        BASENAME.inp for the specified replica at lambda=lambda[stateid] for the
-        specified cycle.
+        Returns the template values of the input file of a BEDAM replica, at
+        the lambda and temperature of its state for the current cycle, and
+        its state parameters (lambda, temperature).
         """
-        basename = self.basename
         stateid = self.status[replica]['stateid_current']
         cycle = self.status[replica]['cycle_current']
-
-        template = "%s.inp" % basename
-        inpfile = "r%d/%s_%d.inp" % (replica, basename, cycle)
-
         lambd = self.stateparams[stateid]['lambda']
         temperature = self.stateparams[stateid]['temperature']
-        # read template buffer
-        tfile = self._openfile(template, "r")
-        tbuffer = tfile.read()
-        tfile.close()
-        # make modifications
-        tbuffer = tbuffer.replace("@n@",str(cycle))
-        tbuffer = tbuffer.replace("@nm1@",str(cycle-1))
-        tbuffer = tbuffer.replace("@lambda@",lambd)
-        tbuffer = tbuffer.replace("@temperature@",temperature)
-        # write out
-        ofile = self._openfile(inpfile, "w")
-        ofile.write(tbuffer)
-        ofile.close()
-
-        # update the history status file
-        ofile = self._openfile("r%d/state.history" % replica, "a")
-        ofile.write("%d %d %s %s\n" % (cycle, stateid, lambd, temperature))
-        ofile.close()
+        values = {'n': cycle,
+                  'nm1': cycle-1,
+                  'lambda': lambd,
+                  'temperature': temperature}
+        return (values, lambd, temperature)
 
     def _doExchange_pair(self,repl_a,repl_b):
         """
@@ -121,7 +103,7 @@ class bedamtempt_async_re_job(bedam_async_re_job):
         dh = h_b - h_a
         delta = -dl*du - db*dh
 
-        if self.keywords.get('VERBOSE') == "yes":
+        if self.verbose:
             self.logger.info("Pair Info")
             self.logger.info("%d %f %f %f %f", repl_a, lambda_a, u_a, beta_a, h_a)
             self.logger.info("%d %f %f %f %f", repl_b, lambda_b, u_b, beta_b, h_b)
@@ -131,22 +113,22 @@ class bedamtempt_async_re_job(bedam_async_re_job):
         if math.exp(-delta) > csi:
             status_func = lambda val: self.status[val]['stateid_current']
 
-            if self.keywords.get('VERBOSE') == "yes":
+            if self.verbose:
                 self.logger.info("Accepted %f %f", math.exp(-delta), csi)
                 self.logger.info("%s %s", status_func(repl_a), status_func(repl_b))
             self.status[repl_a]['stateid_current'] = sid_b
             self.status[repl_b]['stateid_current'] = sid_a
-            if self.keywords.get('VERBOSE') == "yes":
+            if self.verbose:
                 self.logger.info("%s %s", status_func(repl_a), status_func(repl_b))
         else:
-            if self.keywords.get('VERBOSE') == "yes":
+            if self.verbose:
                 self.logger.info("Rejected %f %f", math.exp(-delta), csi)
 
     def _extractLast_lambda_BindingEnergy_TotalEnergy(self,repl,cycle):
         """
         Extracts binding energy from Impact output
         """
-        output_file = "r%s/%s_%d.out" % (repl,self.basename,cycle)
+        output_file = self._replicaPath(repl, "%s_%d.out" % (self.basename,cycle))
         datai = self._getImpactData(output_file)
         nf = len(datai[0])
         nr = len(datai)
@@ -158,25 +140,18 @@ class bedamtempt_async_re_job(bedam_async_re_job):
         # (lambda, binding energy, total energy)
         return (datai[nr-1][nf-2],datai[nr-1][nf-1],datai[nr-1][2])
 
-    def print_status(self):
+    def _statusHeader(self):
         """
-        Writes to BASENAME_stat.txt a text version of the status of the RE job
-
-        It's fun to follow the progress in real time by doing:
+        Returns the header line of BASENAME_stat.txt
+        """
+        return "Replica  State  Lambda Temperature Status  Cycle \n"
 
-        watch cat BASENAME_stat.txt
+    def _statusLine(self, replica):
+        """
+        Returns the line of BASENAME_stat.txt for a replica
         """
-        logfile = "%s_stat.txt" % self.basename
-        ofile = self._openfile(logfile,"w")
-        log = "Replica  State  Lambda Temperature Status  Cycle \n"
-        for k in range(self.nreplicas):
-            stateid = self.status[k]['stateid_current']
-            log += "%6d   %5d  %s %s %5s  %5d \n" % (k, stateid, self.stateparams[stateid]['lambda'], self.stateparams[stateid]['temperature'], self.status[k]['running_status'], self.status[k]['cycle_current'])
-        log += "Running = %d\n" % self.running
-        log += "Waiting = %d\n" % self.waiting
-
-        ofile.write(log)
-        ofile.close()
+        stateid = self.status[replica]['stateid_current']
+        return "%6d   %5d  %s %s %5s  %5d \n" % (replica, stateid, self.stateparams[stateid]['lambda'], self.stateparams[stateid]['temperature'], self.status[replica]['running_status'], self.status[replica]['cycle_current'])
 
     def _getPot(self,repl,cycle):
         (lmb, u, etot) = self._extractLast_lambda_BindingEnergy_TotalEnergy(repl,cycle)
@@ -46,7 +46,7 @@ class bedamtempt_schedule_job(bedamtempt_async_re_job):
         async_re._checkInput(self)
 
         #make sure BEDAM + TEMPERATURE is wanted
-        if self.keywords.get('RE_TYPE') != 'BEDAMTEMPT':
+        if self.re_type != 'BEDAMTEMPT':
             self._exit("RE_TYPE is not BEDAMTEMPT")
         #BEDAM runs with IMPACT
         if self.keywords.get('ENGINE') != 'IMPACT':
@@ -100,43 +100,53 @@ class bedamtempt_schedule_job(bedamtempt_async_re_job):
                 self.stateparams.append(st)
         return len(self.stateparams)
 
-    def _buildInpFile(self, replica):
+    def _scheduledLambda(self, cycle):
         """
-        Builds input file for a BEDAM replica based on template input file
-        BASENAME.inp for the specified replica at lambda=lambda[stateid] for the
-        specified cycle.
+        Returns the lambda of the schedule for a cycle.
+        """
+        #remember that cycle numbering starts at 1
+        lambd_idx = ((cycle-1) / self.sched_interval) % len(self.lambda_sched)
+        return self.lambda_sched[lambd_idx]
+
+    def _inpFileParameters(self, replica):
+        """
+        Returns the template values of the input file of a BEDAM replica, at
+        the scheduled lambda for the current cycle and the temperature of its
+        state, and its state parameters (lambda, temperature). Runs in the
+        IO threads: the state parameters, shared by all replicas, are only
+        read.
         """
-        basename = self.basename
         stateid = self.status[replica]['stateid_current']
         cycle = self.status[replica]['cycle_current']
 
-        template = "%s.inp" % basename
-        inpfile = "r%d/%s_%d.inp" % (replica, basename, cycle)
-
-        #remember that cycle numbering starts at 1
-        lambd_idx = ((cycle-1) / self.sched_interval) % len(self.lambda_sched)
-        lambd = self.lambda_sched[lambd_idx]
-        self.stateparams[stateid]['lambda'] = lambd
+        lambd = self._scheduledLambda(cycle)
         temperature = self.stateparams[stateid]['temperature']
 
-        # read template buffer
-        tfile = self._openfile(template, "r")
-        tbuffer = tfile.read()
-        tfile.close()
-        # make modifications
-        tbuffer = tbuffer.replace("@n@",str(cycle))
-        tbuffer = tbuffer.replace("@nm1@",str(cycle-1))
-        tbuffer = tbuffer.replace("@lambda@",lambd)
-        tbuffer = tbuffer.replace("@temperature@",temperature)
-        # write out
-        ofile = self._openfile(inpfile, "w")
-        ofile.write(tbuffer)
-        ofile.close()
-
-        # update the history status file
-        ofile = self._openfile("r%d/state.history" % replica, "a")
-        ofile.write("%d %d %s %s\n" % (cycle, stateid, lambd, temperature))
-        ofile.close()
+        values = {'n': cycle,
+                  'nm1': cycle-1,
+                  'lambda': lambd,
+                  'temperature': temperature}
+        return (values, lambd, temperature)
+
+    def _statusLine(self, replica):
+        """
+        Returns the line of BASENAME_stat.txt for a replica, with the
+        scheduled lambda of its current cycle
+        """
+        stateid = self.status[replica]['stateid_current']
+        cycle = self.status[replica]['cycle_current']
+        return "%6d   %5d  %s %s %5s  %5d \n" % (replica, stateid, self._scheduledLambda(cycle), self.stateparams[stateid]['temperature'], self.status[replica]['running_status'], cycle)
+
+    def _getPar(self,repl):
+        # the lambda of a state is the scheduled lambda of the replica in it;
+        # during exchanges cycle_current is backtracked to the cycle just
+        # completed and states are exchanged for the next one
+        sid = self.status[repl]['stateid_current']
+        lmb = float(self._scheduledLambda(self.status[repl]['cycle_current'] + 1))
+        tempt = float(self.stateparams[sid]['temperature'])
+        kb = 0.0019872041
+        beta = 1./(kb*tempt)
+        return (beta,lmb)
 
 if __name__ == '__main__':
 
@@ -0,0 +1,186 @@
+"""
+Benchmark of the exchange step of ASyncRE.
+
+Times the two parts of async_re.doExchanges() on synthetic swap matrices:
+
+ matrix: building a swap matrix of the size of the whole job (nstates by
+     nstates lists, as done by impact_async_re._computeSwapMatrix()) and
+     filling in the energies of the waiting replicas;
+ sampling: gibbs_sampling.sample_state_exchanges() among the waiting
+     replicas for the number of rounds set by NEXCHG_ROUNDS (negative values
+     mean nwaiting**(-NEXCHG_ROUNDS) rounds);
+
+for each combination of exchange method, exchange by set or not, number of
+waiting replicas, number of states and NEXCHG_ROUNDS. Random numbers are
+seeded so that runs are reproducible.
+
+Usage:
+
+python benchmarks/exchange_bench.py --json new.json --compare old.json
+
+Results are written in JSON format with --json; --compare prints the ratios
+of the timings to those of an earlier run for the cases found in both.
+Cases whose number of sampling steps exceeds --max-steps are skipped.
+"""
+import os
+import sys
+import time
+import json
+import random
+import platform
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+import numpy
+from gibbs_sampling import exchange_rounds, sample_state_exchanges
+
+def _ints(option, opt, value, parser):
+    setattr(parser.values, option.dest, [int(v) for v in value.split(',')])
+
+def _strings(option, opt, value, parser):
+    setattr(parser.values, option.dest, value.split(','))
+
+def synthetic_swap_matrix(replicas, states, nstates):
+    """
+    Returns a swap matrix with the reduced energies of the given replicas
+    in the given states: replica energies are drawn from a normal
+    distribution and scaled by an inverse temperature which grows with the
+    state id, as in a temperature or lambda ladder.
+    """
+    U = [[0. for j in range(nstates)] for i in range(nstates)]
+    pot = [random.gauss(0., 10.) for k in replicas]
+    for i, repl in enumerate(replicas):
+        for sid in states:
+            U[sid][repl] = (1. + float(sid)/nstates)*pot[i]
+    return U
+
+def run_case(method, by_set, nwaiting, nstates, nexchg_rounds, repeats):
+    """
+    Times the exchange step for a case. Returns a dictionary with the best
+    times over repeats.
+    """
+    nrounds = exchange_rounds(nexchg_rounds, nwaiting)
+    matrix_times = []
+    sampling_times = []
+    naccepted = 0
+    for r in range(repeats):
+        replicas = sorted(random.sample(range(nstates), nwaiting))
+        states = random.sample(range(nstates), nwaiting)
+
+        start_time = time.time()
+        U = synthetic_swap_matrix(replicas, states, nstates)
+        matrix_times.append(time.time() - start_time)
+
+        start_time = time.time()
+        new_states = sample_state_exchanges(replicas, states, U, nrounds,
+                                            by_set, method)
+        sampling_times.append(time.time() - start_time)
+        naccepted += sum(1 for a, b in zip(states, new_states) if a != b)
+
+    if by_set:
+        nsteps = nrounds*nwaiting
+    else:
+        nsteps = nrounds
+    sampling_time = min(sampling_times)
+    return {'method': method, 'by_set': by_set, 'nwaiting': nwaiting,
+            'nstates': nstates, 'nexchg_rounds': nexchg_rounds,
+            'nrounds': nrounds, 'nsteps': nsteps, 'repeats': repeats,
+            'matrix_time': min(matrix_times),
+            'sampling_time': sampling_time,
+            'total_time': min(matrix_times) + sampling_time,
+            'time_per_step': sampling_time/nsteps if nsteps > 0 else None,
+            'acceptance': naccepted/float(nwaiting*repeats)}
+
+def case_key(result):
+    return (result['method'], result['by_set'], result['nwaiting'],
+            result['nstates'], result['nexchg_rounds'])
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('--methods', type='string', action='callback',
+                      callback=_strings,
+                      default=['restrained_gibbs', 'pairwise_metropolis'],
+                      help='comma separated exchange methods')
+    parser.add_option('--by-set', type='string', action='callback',
+                      callback=_strings, default=['yes', 'no'],
+                      help='comma separated EXCHANGE_BYSET values')
+    parser.add_option('--waiting', type='string', action='callback',
+                      callback=_ints, default=[4, 8, 16, 32, 64, 128],
+                      help='comma separated numbers of waiting replicas')
+    parser.add_option('--states', type='string', action='callback',
+                      callback=_ints, default=[128, 512],
+                      help='comma separated numbers of states (and replicas)')
+    parser.add_option('--rounds', type='string', action='callback',
+                      callback=_ints, default=[1, 10, -1, -2],
+                      help='comma separated NEXCHG_ROUNDS values')
+    parser.add_option('--repeats', type='int', default=5,
+                      help='repetitions of each case, the best time is kept '
+                      '[default: %default]')
+    parser.add_option('--max-steps', type='int', default=200000,
+                      help='skip cases with more sampling steps '
+                      '[default: %default]')
+    parser.add_option('--seed', type='int', default=1,
+                      help='random number seed [default: %default]')
+    parser.add_option('--json', metavar='FILE',
+                      help='write the results in JSON format to FILE')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare with the results of an earlier run')
+    (options, args) = parser.parse_args()
+
+    baseline = {}
+    if options.compare:
+        f = open(options.compare, 'r')
+        for result in json.load(f)['results']:
+            baseline[case_key(result)] = result
+        f.close()
+
+    print ('%-20s %3s %7s %7s %7s %9s %11s %11s %11s %7s' %
+           ('method', 'set', 'waiting', 'states', 'rounds', 'steps',
+            'matrix s', 'sampling s', 'us/step', 'ratio'))
+    results = []
+    for method in options.methods:
+        for by_set in options.by_set:
+            by_set = by_set.lower() == 'yes'
+            for nstates in options.states:
+                for nwaiting in options.waiting:
+                    if nwaiting > nstates or nwaiting < 2:
+                        continue
+                    for nexchg_rounds in options.rounds:
+                        nrounds = exchange_rounds(nexchg_rounds, nwaiting)
+                        nsteps = nrounds*nwaiting if by_set else nrounds
+                        if nsteps > options.max_steps:
+                            continue
+                        # reseeds for each case so that cases are
+                        # reproducible independently of the selection
+                        random.seed(options.seed)
+                        numpy.random.seed(options.seed)
+                        result = run_case(method, by_set, nwaiting, nstates,
+                                          nexchg_rounds, options.repeats)
+                        results.append(result)
+                        ratio = ''
+                        old = baseline.get(case_key(result))
+                        if old is not None and old['total_time'] > 0:
+                            ratio = '%7.2f' % (result['total_time']/
+                                               old['total_time'])
+                        per_step = result['time_per_step']
+                        print ('%-20s %3s %7d %7d %7d %9d %11.6f %11.6f %11s %7s' %
+                               (method, 'yes' if by_set else 'no', nwaiting,
+                                nstates, nexchg_rounds, nsteps,
+                                result['matrix_time'], result['sampling_time'],
+                                '%.2f' % (1e6*per_step) if per_step else '-',
+                                ratio))
+                        sys.stdout.flush()
+
+    if options.json:
+        f = open(options.json, 'w')
+        json.dump({'benchmark': 'exchange',
+                   'python': platform.python_version(),
+                   'numpy': numpy.__version__,
+                   'seed': options.seed,
+                   'results': results}, f, sort_keys=True, indent=1)
+        f.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Scale benchmark of the ASyncRE controller.
+
+Runs async_re.scheduleJobs() on a simulated RE job (JOB_TRANSPORT = 'MOCK',
+see mock_transport.py) for a range of numbers of replicas and reports, for
+each, the CPU time used by the controller per replica cycle, the exchange
+latency and the peak memory use. Jobs are simulated, so all the CPU time is
+spent by the controller: as the number of replicas grows the cycle
+throughput stops tracking the number of slots once the control loop becomes
+the bottleneck.
+
+Usage:
+
+python benchmarks/scheduler_bench.py --replicas 10,100,1000,10000,100000 \
+    --slots 100 --runtime 1 --duration 60 --json bench.json
+
+Each number of replicas is run in a separate process in a scratch directory.
+"""
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import logging
+import tempfile
+import resource
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from async_re import async_re
+from log_config import configure_logging
+
+class mock_job(async_re):
+    """
+    RE job with NREPLICAS replicas and states and no files, run through the
+    simulated job transport
+    """
+    def _checkInput(self):
+        async_re._checkInput(self)
+        if self.keywords.get('NREPLICAS') is None:
+            self._exit("NREPLICAS needs to be specified")
+        self.nreplicas = int(self.keywords.get('NREPLICAS'))
+
+    def _launchReplica(self, replica, cycle):
+        return self.transport.launchJob(replica, None)
+
+    def _hasCompleted(self, replica, cycle):
+        return True
+
+    def _buildInpFile(self, replica):
+        pass
+
+    def _computeSwapMatrix(self, replicas, states):
+        # reduced energies beta_s*u_i of the waiting replicas in the states
+        # of the waiting replicas, with beta_s growing with the state id and
+        # u_i drawn at random
+        U = dict((sid, {}) for sid in states)
+        beta = 10./self.nreplicas
+        for repl in replicas:
+            u = random.gauss(0., 1.)
+            for sid in states:
+                U[sid][repl] = beta*sid*u
+        return U
+
+CONTROL_FILE = """\
+JOB_TRANSPORT = 'MOCK'
+RE_TYPE = 'MOCK'
+ENGINE_INPUT_BASENAME = 'bench'
+NREPLICAS = %(nreplicas)d
+TOTAL_CORES = %(slots)d
+SUBJOB_CORES = 1
+MOCK_RUNTIME = %(runtime)f
+MOCK_RUNTIME_DISTRIBUTION = '%(distribution)s'
+MOCK_SEED = %(seed)d
+WALL_TIME = %(wall_time)f
+REPLICA_RUN_TIME = 0
+CYCLE_TIME = %(cycle_time)f
+MIN_TIME = %(min_time)f
+EXCHANGE_TRIGGER = '%(exchange_trigger)s'
+VERBOSE = 'no'
+"""
+
+def run(nreplicas, options):
+    """
+    Runs a simulated job with nreplicas replicas in a scratch directory
+    and returns its figures.
+    """
+    workdir = tempfile.mkdtemp(prefix='asyncre_bench_')
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        settings = {'nreplicas': nreplicas, 'slots': options.slots,
+                    'runtime': options.runtime,
+                    'distribution': options.distribution,
+                    'seed': options.seed, 'cycle_time': options.cycle_time,
+                    'min_time': options.min_time,
+                    'exchange_trigger': options.exchange_trigger,
+                    # stop launching after options.duration seconds
+                    'wall_time': (options.duration + options.cycle_time +
+                                  10.)/60.}
+        f = open('bench.cntl', 'w')
+        f.write(CONTROL_FILE % settings)
+        f.close()
+        random.seed(options.seed)
+        configure_logging()
+        logging.getLogger('async_re').setLevel(logging.WARNING)
+
+        start_time = time.time()
+        rx = mock_job('bench.cntl', options=None)
+        rx.setupJob()
+        setup_time = time.time() - start_time
+
+        cpu_start = os.times()
+        start_time = time.time()
+        rx.scheduleJobs()
+        run_time = time.time() - start_time
+        cpu_end = os.times()
+        cpu_time = (cpu_end[0] - cpu_start[0]) + (cpu_end[1] - cpu_start[1])
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, True)
+
+    metrics = rx.metrics.snapshot()
+    cycles = metrics['counters'].get('completions', 0)
+    trigger = rx.exchange_trigger
+    timers = metrics['timers']
+    def mean_time(name):
+        if name in timers:
+            return timers[name]['mean']
+        return None
+    result = {
+        'nreplicas': nreplicas,
+        'slots': options.slots,
+        'runtime': options.runtime,
+        'setup_time': setup_time,
+        'run_time': run_time,
+        'cycles': cycles,
+        'cycles_per_second': cycles/run_time,
+        'ideal_cycles_per_second': min(nreplicas, options.slots)/options.runtime,
+        'cpu_time': cpu_time,
+        'cpu_per_cycle': cpu_time/cycles if cycles > 0 else None,
+        'exchanges': trigger.nexchanges,
+        'exchange_pool_size': (trigger.pool_size_total/float(trigger.nexchanges)
+                               if trigger.nexchanges > 0 else None),
+        'exchange_latency': (trigger.latency_total/trigger.nlatency
+                             if trigger.nlatency > 0 else None),
+        'exchange_time': mean_time('doExchanges'),
+        'update_status_time': mean_time('updateStatus'),
+        'launch_time': mean_time('launchJobs'),
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.,
+        'timers': timers}
+    return result
+
+def _format(value, fmt):
+    if value is None:
+        return '%10s' % '-'
+    return fmt % value
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('--replicas', default='10,100,1000,10000',
+                      help='comma separated numbers of replicas '
+                      '[default: %default]')
+    parser.add_option('--slots', type='int', default=100,
+                      help='number of simulated job slots [default: %default]')
+    parser.add_option('--runtime', type='float', default=1.0,
+                      help='average simulated runtime of a cycle in seconds '
+                      '[default: %default]')
+    parser.add_option('--distribution', default='exponential',
+                      help='distribution of simulated runtimes '
+                      '[default: %default]')
+    parser.add_option('--duration', type='float', default=30.0,
+                      help='time in seconds during which cycles are launched '
+                      '[default: %default]')
+    parser.add_option('--cycle-time', type='float', default=5.0,
+                      help='CYCLE_TIME setting [default: %default]')
+    parser.add_option('--min-time', type='float', default=0.1,
+                      help='MIN_TIME setting [default: %default]')
+    parser.add_option('--exchange-trigger', default='always',
+                      help='EXCHANGE_TRIGGER setting [default: %default]')
+    parser.add_option('--seed', type='int', default=1,
+                      help='random number seed [default: %default]')
+    parser.add_option('--json', metavar='FILE',
+                      help='write the results in JSON format to FILE')
+    parser.add_option('--single', action='store_true',
+                      help=SUPPRESS_HELP)
+    (options, args) = parser.parse_args()
+
+    replica_counts = [int(n) for n in options.replicas.split(',')]
+
+    if options.single:
+        # child process: runs one job and writes the results to stdout
+        print json.dumps(run(replica_counts[0], options))
+        return
+
+    results = []
+    header = ('%10s %10s %10s %10s %10s %10s %10s %10s' %
+              ('replicas', 'cycles/s', 'ideal', 'cpu/cycle', 'exch lat',
+               'exch time', 'rss MB', 'setup s'))
+    print header
+    for n in replica_counts:
+        argv = [sys.executable, os.path.abspath(__file__), '--single',
+                '--replicas', str(n), '--slots', str(options.slots),
+                '--runtime', repr(options.runtime),
+                '--distribution', options.distribution,
+                '--duration', repr(options.duration),
+                '--cycle-time', repr(options.cycle_time),
+                '--min-time', repr(options.min_time),
+                '--exchange-trigger', options.exchange_trigger,
+                '--seed', str(options.seed)]
+        output = subprocess.check_output(argv)
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print ('%10d %s %s %s %s %s %s %s' %
+               (n, _format(result['cycles_per_second'], '%10.2f'),
+                _format(result['ideal_cycles_per_second'], '%10.2f'),
+                _format(result['cpu_per_cycle'], '%10.5f'),
+                _format(result['exchange_latency'], '%10.4f'),
+                _format(result['exchange_time'], '%10.5f'),
+                _format(result['max_rss_mb'], '%10.1f'),
+                _format(result['setup_time'], '%10.2f')))
+        sys.stdout.flush()
+
+    if options.json:
+        f = open(options.json, 'w')
+        json.dump({'benchmark': 'scheduler', 'results': results}, f,
+                  sort_keys=True, indent=1)
+        f.close()
+
+if __name__ == '__main__':
+    main()
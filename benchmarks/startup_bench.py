@@ -0,0 +1,157 @@
+"""
+Startup time benchmark of ASyncRE.
+
+Times, each in a fresh Python process, the import of ASyncRE modules and the
+setup of a small simulated RE job (JOB_TRANSPORT = 'MOCK', see
+benchmarks/scheduler_bench.py), and reports which heavy dependencies
+(numpy, paramiko, scp, MySQLdb, ...) each of them loads. Short helper
+invocations (status queries, restarts) pay these costs every time.
+
+Usage:
+
+python benchmarks/startup_bench.py --json new.json --compare old.json
+
+Results are written in JSON format with --json; --compare prints the ratios
+of the timings to those of an earlier run for the cases found in both.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, os.pardir))
+
+# modules whose import is reported
+HEAVY_MODULES = ('numpy', 'paramiko', 'scp', 'MySQLdb', 'logging.config',
+                 'multiprocessing.pool', 'BaseHTTPServer')
+
+DEFAULT_CASES = ('async_re', 'date_async_re', 'bedam_async_re',
+                 'tempt_async_re', 'ssh_transport', 'boinc_transport',
+                 'mock_transport', 'multi_async_re', 'setup')
+
+CONTROL_FILE = """\
+JOB_TRANSPORT = 'MOCK'
+RE_TYPE = 'MOCK'
+ENGINE_INPUT_BASENAME = 'bench'
+NREPLICAS = 10
+TOTAL_CORES = 10
+SUBJOB_CORES = 1
+WALL_TIME = 1
+VERBOSE = 'no'
+"""
+
+def run_case(case):
+    """
+    Runs a case in the current process and returns its figures. Cases are
+    module names, imported, or 'setup', the setup of a simulated job.
+    """
+    start_time = time.time()
+    if case == 'setup':
+        import shutil
+        import logging
+        import tempfile
+        from scheduler_bench import mock_job
+        from log_config import configure_logging
+        workdir = tempfile.mkdtemp(prefix='asyncre_startup_')
+        cwd = os.getcwd()
+        try:
+            os.chdir(workdir)
+            f = open('bench.cntl', 'w')
+            f.write(CONTROL_FILE)
+            f.close()
+            configure_logging()
+            logging.getLogger('async_re').setLevel(logging.WARNING)
+            rx = mock_job('bench.cntl', options=None)
+            rx.setupJob()
+            rx.cleanJob()
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, True)
+    else:
+        __import__(case)
+    elapsed = time.time() - start_time
+    return {'case': case, 'time': elapsed,
+            'loaded': [m for m in HEAVY_MODULES if sys.modules.get(m)]}
+
+def run_process(case):
+    """
+    Runs a case in a new Python process. Returns its figures with the
+    wall clock time of the whole process.
+    """
+    argv = [sys.executable, os.path.abspath(__file__), '--single', case]
+    start_time = time.time()
+    output = subprocess.check_output(argv)
+    process_time = time.time() - start_time
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_time'] = process_time
+    return result
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('--cases', default=','.join(DEFAULT_CASES),
+                      help='comma separated modules to import, or setup '
+                      '[default: %default]')
+    parser.add_option('--repeats', type='int', default=5,
+                      help='repetitions of each case, the best time is kept '
+                      '[default: %default]')
+    parser.add_option('--json', metavar='FILE',
+                      help='write the results in JSON format to FILE')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare with the results of an earlier run')
+    parser.add_option('--single', metavar='CASE', help=SUPPRESS_HELP)
+    (options, args) = parser.parse_args()
+
+    if options.single:
+        # child process: runs one case and writes the results to stdout
+        print json.dumps(run_case(options.single))
+        return
+
+    baseline = {}
+    if options.compare:
+        f = open(options.compare, 'r')
+        for result in json.load(f)['results']:
+            baseline[result['case']] = result
+        f.close()
+
+    print '%-18s %10s %10s %7s  %s' % ('case', 'time ms', 'process ms',
+                                       'ratio', 'heavy modules loaded')
+    results = []
+    for case in options.cases.split(','):
+        runs = []
+        for r in range(options.repeats):
+            try:
+                runs.append(run_process(case))
+            except subprocess.CalledProcessError:
+                break
+        if not runs:
+            # e.g. missing optional dependency of a transport
+            print '%-18s %10s' % (case, 'failed')
+            continue
+        result = {'case': case, 'repeats': len(runs),
+                  'time': min(run['time'] for run in runs),
+                  'process_time': min(run['process_time'] for run in runs),
+                  'loaded': runs[0]['loaded']}
+        results.append(result)
+        ratio = ''
+        old = baseline.get(case)
+        if old is not None and old['time'] > 0:
+            ratio = '%7.2f' % (result['time']/old['time'])
+        print '%-18s %10.1f %10.1f %7s  %s' % (case, 1e3*result['time'],
+                                               1e3*result['process_time'],
+                                               ratio,
+                                               ' '.join(result['loaded']))
+        sys.stdout.flush()
+
+    if options.json:
+        f = open(options.json, 'w')
+        json.dump({'benchmark': 'startup',
+                   'python': platform.python_version(),
+                   'results': results}, f, sort_keys=True, indent=1)
+        f.close()
+
+if __name__ == '__main__':
+    main()
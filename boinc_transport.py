@@ -6,14 +6,11 @@ import sys
 import time
 import re
 import pickle
-import MySQLdb
 import logging
 import subprocess
 
 from transport import Transport
 
-operational_error = MySQLdb.OperationalError
-
 class boinc_transport(Transport):
     """
     Class to launch and monitor jobs through a BOINC project
@@ -55,6 +52,14 @@ class boinc_transport(Transport):
         self.db_user = keywords.get('BOINC_DATABASE_USER')
         self.db_pwd = keywords.get('BOINC_DATABASE_PASSWORD')
 
+        # interval (in seconds) at which ProcessJobQueue() polls the BOINC
+        # db for completed workunits. If unspecified the db is polled only
+        # once per cycle by the controller
+        if keywords.get('BOINC_POLL_TIME') is None:
+            self.poll_time = None
+        else:
+            self.poll_time = float(keywords.get('BOINC_POLL_TIME'))
+
         # stage files
         if files_to_stage is not None:
             for file in files_to_stage:
@@ -135,19 +140,26 @@ Enqueues a job based on provided job info.
 
         return 1
 
-    def poll(self, error_wait=10, timeout=86400):
+    def poll(self, replicas=None, error_wait=10, timeout=86400):
         self.logger.info("Polling BOINC DB")
 
-        wuids = self.replica_status.keys()
+        if replicas is None:
+            wuids = self.replica_status.keys()
+        else:
+            # only the workunits of the given replicas
+            wuids = [self.replica_to_wuid[k] for k in replicas
+                     if self.replica_to_wuid[k] in self.replica_status]
         wuid_strings = map(str, wuids)
         if not wuids:
             self.logger.info("Polling BOINC DB complete! Didn't find any wuids, though")
             return
 
+        # MySQLdb is only needed to poll the BOINC database
+        import MySQLdb
         try:
             self.boinc_db = MySQLdb.connect(user=self.db_user, passwd=self.db_pwd,
                                             db=self.db_name)
-        except operational_error as e:
+        except MySQLdb.OperationalError as e:
             #self.logger.warning("poll(): Received operational error %d: %s.", e.errno, e.strerror)
             self.logger.warning("poll(): Received MySQLDB error.")
             self.logger.warning("poll(): Trying one more time in %ds.", error_wait)
@@ -166,6 +178,9 @@ Enqueues a job based on provided job info.
 
         cur.execute(sql_command, wuid_strings)
 
+        polled = set(wuids)
+        was_done = set(wuid for wuid in wuids if self.replica_status[wuid])
+
         updated = set()
         for wuid, status in cur.fetchall():
             self.replica_status[wuid] = (status == 5)
@@ -193,6 +208,12 @@ Enqueues a job based on provided job info.
         self.boinc_db.close()
         self.logger.info("Polling BOINC DB complete!")
 
+        # emits completion events for newly completed workunits
+        for replica, wuid in enumerate(self.replica_to_wuid):
+            if wuid in polled and wuid not in was_done:
+                if self.replica_status[wuid]:
+                    self.notifyCompletion(replica)
+
         #2015/09/09 WFF
         #check to see if boinc.stat has been changed recently
         curtime = time.mktime(time.localtime())
@@ -203,9 +224,23 @@ Enqueues a job based on provided job info.
 
     def ProcessJobQueue(self, mintime, maxtime):
         """
-with boinc there's no queue to process. Just wait until maxtime
+with boinc there's no queue to process. Just wait until maxtime, or, if
+BOINC_POLL_TIME is set, until the db reports a completed workunit (but not
+less than mintime).
         """
-        time.sleep(maxtime)
+        start_time = time.time()
+        if self.poll_time is None:
+            self.waitCompletion(maxtime)
+        else:
+            usetime = 0
+            while usetime < maxtime:
+                if self.waitCompletion(min(self.poll_time, maxtime - usetime)):
+                    break
+                self.poll()
+                usetime = time.time() - start_time
+        usetime = time.time() - start_time
+        if usetime < mintime:
+            time.sleep(mintime - usetime)
 
     def isDone(self,replica,cycle):
         """
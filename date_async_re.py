@@ -17,11 +17,11 @@ class date_job(async_re):
             "input_file": "",
             "output_file": "sj-stdout-"+str(replica)+"-"+str(cycle)+".txt",
             "error_file": "sj-stderr-"+str(replica)+"-"+str(cycle)+".txt",
-            "working_directory":os.getcwd()+"/r"+str(replica),
+            "working_directory":self._replicaDir(replica),
         }
 
-        if self.keywords.get('VERBOSE') == "yes":
-            print "Launching %s in directory %s cycle %d" % ("/bin/date",os.getcwd()+"/r"+str(replica),cycle)
+        if self.verbose:
+            print "Launching %s in directory %s cycle %d" % ("/bin/date",self._replicaDir(replica),cycle)
 
         status = self.transport.launchJob(replica, job_info)
 
@@ -33,7 +33,7 @@ class date_async_re_job(date_job,async_re):
     def _checkInput(self):
         async_re._checkInput(self)
         #make sure DATE is wanted
-        if self.keywords.get('RE_TYPE') != 'DATE':
+        if self.re_type != 'DATE':
             self._exit("RE_TYPE is not DATE")
         #number of replicas
         if self.keywords.get('NREPLICAS') is None:
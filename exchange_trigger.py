@@ -0,0 +1,173 @@
+"""
+Policies deciding when the controller performs exchanges among the waiting
+replicas.
+
+Exchanging as soon as replicas complete minimizes the time replicas wait
+before being relaunched, but each exchange then involves few replicas and
+mixes states poorly. Waiting for more replicas to join the exchange pool
+improves mixing at the cost of latency. Policies (EXCHANGE_TRIGGER keyword):
+
+ always: exchange at every iteration of the scheduling loop among the
+     replicas waiting at that time (the default).
+ immediate: stop collecting completions as soon as a replica completes
+     and exchange as soon as a replica joins the pool.
+ window: batch replicas joining the pool until EXCHANGE_WINDOW_TIME
+     seconds have passed since the last exchange or EXCHANGE_WINDOW_COUNT
+     replicas have joined, whichever comes first.
+ threshold: exchange once at least EXCHANGE_MIN_WAITING replicas are
+     waiting.
+
+With the window and threshold policies the replicas that join the pool are
+held back from launch until they have taken part in an exchange, so that
+the pool can grow; the controller otherwise relaunches waiting replicas
+down to the exchange reserve at every iteration. Once no replica is running
+no more replicas can join the pool: the controller then exchanges the
+replicas of the pool whatever the policy, and launches them.
+
+The trigger keeps metrics of the exchanges it lets through: the number of
+exchanges and of deferred ones, the average size of the exchange pool and
+the average time replicas spent in the pool before their first exchange.
+"""
+import time
+import logging
+
+class ExchangeTrigger(object):
+    """
+    Decides when to exchange among the waiting replicas
+    """
+    POLICIES = ('always', 'immediate', 'window', 'threshold')
+
+    def __init__(self, policy, window_time = None, window_count = None,
+                 min_waiting = 2):
+        # policy: one of POLICIES
+        # window_time: batching window in seconds (window policy)
+        # window_count: number of replicas joining the pool that closes the
+        #               batching window (window policy)
+        # min_waiting: size of the pool that triggers an exchange (threshold
+        #              policy)
+        if policy not in self.POLICIES:
+            raise ValueError("unknown exchange trigger policy %s" % policy)
+        self.logger = logging.getLogger("async_re.exchange_trigger")
+        self.policy = policy
+        self.window_time = window_time
+        self.window_count = window_count
+        self.min_waiting = max(2, min_waiting)
+        # whether replicas of the pool are held back from launch
+        self.holds = policy in ('window', 'threshold')
+
+        self._last_exchange = None
+        # (cycle, time) at which each replica in the pool that has not taken
+        # part in an exchange yet joined it
+        self._joined = {}
+        # cycle at which each replica last took part in an exchange
+        self._exchanged = {}
+        self._arrivals = 0
+
+        # metrics
+        self.nexchanges = 0
+        self.ndeferred = 0
+        self.pool_size_total = 0
+        self.latency_total = 0.
+        self.nlatency = 0
+
+    def minTime(self, min_time):
+        """
+        Returns the time the job transport should keep collecting
+        completions before returning, given the MIN_TIME setting.
+        """
+        if self.policy == 'immediate':
+            return 0.
+        return min_time
+
+    def _pending(self, pool):
+        # replicas of the pool that have not taken part in an exchange at
+        # their current cycle
+        return [(k, cycle) for k, cycle in pool
+                if self._exchanged.get(k) != cycle]
+
+    def held(self, pool, running):
+        """
+        Returns the set of replicas of the pool, a list of (replica, cycle)
+        pairs of the waiting replicas that can be exchanged, to hold back
+        from launch. running is the number of replicas running.
+        """
+        if not self.holds or running == 0:
+            return set()
+        return set(k for k, cycle in self._pending(pool))
+
+    def ready(self, pool, running = None, now = None):
+        """
+        Returns True if an exchange should be performed among the pool of
+        waiting replicas, a list of (replica, cycle) pairs. running is the
+        number of replicas running, if known.
+        """
+        if now is None:
+            now = time.time()
+        if self._last_exchange is None:
+            self._last_exchange = now
+        pending = self._pending(pool)
+        joined = {}
+        arrivals = 0
+        for k, cycle in pending:
+            entry = self._joined.get(k)
+            if entry is None or entry[0] != cycle:
+                entry = (cycle, now)
+                arrivals += 1
+            joined[k] = entry
+        self._joined = joined
+        self._arrivals += arrivals
+
+        npool = len(pool)
+        if npool < 2:
+            return False
+        if running == 0:
+            # no more replicas can join the pool, exchanges it unless all
+            # its members have already been exchanged at their cycle
+            return len(pending) > 0
+        if self.policy == 'immediate':
+            trigger = self._arrivals > 0
+        elif self.policy == 'window':
+            trigger = ((self.window_time is not None and
+                        now - self._last_exchange >= self.window_time) or
+                       (self.window_count is not None and
+                        self._arrivals >= self.window_count))
+        elif self.policy == 'threshold':
+            trigger = npool >= self.min_waiting
+        else:
+            trigger = True
+        if not trigger:
+            self.ndeferred += 1
+        return trigger
+
+    def exchanged(self, pool, now = None):
+        """
+        Records an exchange among the pool of replicas, a list of (replica,
+        cycle) pairs.
+        """
+        if now is None:
+            now = time.time()
+        self.nexchanges += 1
+        self.pool_size_total += len(pool)
+        for k, cycle in pool:
+            entry = self._joined.pop(k, None)
+            if entry is not None and entry[0] == cycle:
+                self.latency_total += now - entry[1]
+                self.nlatency += 1
+            self._exchanged[k] = cycle
+        self._last_exchange = now
+        self._arrivals = 0
+
+    def report(self):
+        """Logs the exchange metrics."""
+        if self.nexchanges > 0:
+            pool_size = self.pool_size_total/float(self.nexchanges)
+        else:
+            pool_size = 0.
+        if self.nlatency > 0:
+            latency = self.latency_total/self.nlatency
+        else:
+            latency = 0.
+        self.logger.info("exchange trigger %s: %d exchanges, %d deferred, "
+                         "average pool size: %.1f, average latency: %.1f s",
+                         self.policy, self.nexchanges, self.ndeferred,
+                         pool_size, latency)
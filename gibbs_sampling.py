@@ -114,6 +114,49 @@ def pairwise_independence_sampling(repl_i, sid_i, replicas, states, U):
               'list of waiting replicas?'%i)
     return replicas[weighted_choice(zip(range(nreplicas),ps))]
 
+def exchange_rounds(nexchg_rounds, nreplicas):
+    """
+    Return the number of exchange rounds performed among nreplicas replicas
+    given the NEXCHG_ROUNDS setting: nexchg_rounds if non-negative, otherwise
+    nreplicas**(-nexchg_rounds).
+    """
+    if nexchg_rounds >= 0:
+        return nexchg_rounds
+    return nreplicas**(-nexchg_rounds)
+
+def sample_state_exchanges(replicas, states, U, nrounds, by_set=True,
+                           method='restrained_gibbs'):
+    """
+    Return the states of the replicas after nrounds rounds of exchanges.
+
+    states[i] is the state currently occupied by replicas[i] and U is the
+    "swap matrix" (see pairwise_independence_sampling). In each round, if
+    by_set is True, each replica in turn attempts an exchange with another
+    replica; otherwise a single replica chosen at random does. Partners are
+    drawn with pairwise_independence_sampling ('restrained_gibbs' method) or
+    pairwise_metropolis_sampling ('pairwise_metropolis' method).
+    """
+    if method == 'restrained_gibbs':
+        sampling = pairwise_independence_sampling
+    elif method == 'pairwise_metropolis':
+        sampling = pairwise_metropolis_sampling
+    else:
+        raise ValueError('unknown exchange method %s' % method)
+    states = list(states)
+    position = dict((repl, i) for i, repl in enumerate(replicas))
+    for reps in range(nrounds):
+        if by_set:
+            attempts = replicas
+        else:
+            attempts = [choice(replicas)]
+        for repl_i in attempts:
+            i = position[repl_i]
+            repl_j = sampling(repl_i, states[i], replicas, states, U)
+            if repl_j != repl_i:
+                j = position[repl_j]
+                states[i], states[j] = states[j], states[i]
+    return states
+
 def state_perm_distribution(replicas, states, swap_matrix):
     """
     Return the distribution of state permutations of a set of replicas (and 
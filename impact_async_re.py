@@ -4,12 +4,78 @@ import random
 import math
 import logging
 from async_re import async_re
+from input_template import InputTemplate
 
 class impact_job(async_re):
 
     def _setLogger(self):
         self.logger = logging.getLogger("async_re.impact_async_re")
 
+    def _inputTemplate(self):
+        """
+        Returns the template of the IMPACT input file, BASENAME.inp. It is
+        read once and cached; it is re-read only if the file is modified.
+        """
+        template = getattr(self, '_input_template', None)
+        if template is None:
+            template = InputTemplate(self._jobPath("%s.inp" % self.basename),
+                                     self._openfile)
+            self._input_template = template
+        return template
+
+    def _inpFileName(self, replica, cycle):
+        return self._replicaPath(replica, "%s_%d.inp" % (self.basename, cycle))
+
+    def _buildInpFile(self, replica):
+        """
+        Builds the input file of a replica for its current state and cycle
+        from the template input file BASENAME.inp, with the values returned
+        by the _inpFileParameters() method of the RE module, and records the
+        state in the state history of the replica.
+        """
+        stateid = self.status[replica]['stateid_current']
+        cycle = self.status[replica]['cycle_current']
+        (values, lambd, temperature) = self._inpFileParameters(replica)
+        # fill in template
+        tbuffer = self._inputTemplate().render(values)
+        # write out
+        ofile = self._openfile(self._inpFileName(replica, cycle), "w")
+        ofile.write(tbuffer)
+        ofile.close()
+
+        # update the history status file
+        self._writeStateHistory(replica, cycle, stateid, lambd=lambd,
+                                temperature=temperature)
+
+    def _inpFileUpToDate(self, replica):
+        """
+        Returns True if the input file of a replica for its current state and
+        cycle exists and matches the template.
+        """
+        inpfile = self._inpFileName(replica,
+                                    self.status[replica]['cycle_current'])
+        if not os.path.exists(inpfile):
+            return False
+        (values, lambd, temperature) = self._inpFileParameters(replica)
+        ifile = self._openfile(inpfile, "r")
+        buffer = ifile.read()
+        ifile.close()
+        return buffer == self._inputTemplate().render(values)
+
+    def _reuseInpFile(self, replica):
+        """
+        Appends the record of the reused input file of a replica to its
+        state history if it was lost in a crash (the history is buffered).
+        """
+        stateid = self.status[replica]['stateid_current']
+        cycle = self.status[replica]['cycle_current']
+        if (self.state_history.lastRecord(self._replicaDir(replica)) ==
+            (cycle, stateid)):
+            return
+        (values, lambd, temperature) = self._inpFileParameters(replica)
+        self._writeStateHistory(replica, cycle, stateid, lambd=lambd,
+                                temperature=temperature)
+
     def _launchReplica(self,replica,cycle): 
         """
         Launches a Impact sub-job
@@ -20,8 +86,8 @@ class impact_job(async_re):
         
         
         if self.transport_mechanism != "SSH":
-            executable = os.getcwd() + "/runimpact"
-            working_directory = os.getcwd() + "/r" + str(replica)
+            executable = self._jobPath("runimpact")
+            working_directory = self._replicaDir(replica)
             job_info = {"executable": executable,
                         "input_file": input_file,
                         "output_file": log_file,
@@ -29,13 +95,13 @@ class impact_job(async_re):
                         "working_directory": working_directory,
                         "cycle": cycle}
             #delete failed file if present
-            failed_file = "r%s/%s_%d.failed" % (str(replica),self.basename,cycle)
+            failed_file = self._replicaPath(replica, "%s_%d.failed" % (self.basename,cycle))
             if os.path.exists(failed_file):
                 os.remove(failed_file)
         
         else:
             rstfile_p = "%s_%d.rst" % (self.basename,cycle-1)
-            local_working_directory = os.getcwd() + "/r" + str(replica)
+            local_working_directory = self._replicaDir(replica)
             remote_replica_dir = "%s_r%d_c%d" % (self.basename, replica, cycle)
             executable = "./runimpact"
 
@@ -53,10 +119,10 @@ class impact_job(async_re):
             # detect which kind of architecture the node use, then choosing
             # different library files and binary files in different lib and bin
             # folders
-            if self.keywords.get('EXEC_DIRECTORY'):
-                exec_directory = self.keywords.get('EXEC_DIRECTORY')
+            if self.exec_directory:
+                exec_directory = self.exec_directory
             else:
-                exec_directory = os.getcwd()
+                exec_directory = self.job_dir
 
             job_info["exec_directory"]=exec_directory
 
@@ -73,25 +139,25 @@ class impact_job(async_re):
             output_file = "%s_%d.out" % (self.basename, cycle)
             rstfile = "%s_%d.rst" % (self.basename, cycle)
 
-            if self.keywords.get('RE_TYPE') == 'TEMPT':
+            if self.re_type == 'TEMPT':
                 dmsfile = "%s_%d.dms" % (self.basename, cycle)
-            elif self.keywords.get('RE_TYPE') == 'BEDAMTEMPT':
+            elif self.re_type == 'BEDAMTEMPT':
                 rcptfile="%s_rcpt_%d.dms" % (self.basename,cycle)
                 ligfile="%s_lig_%d.dms" % (self.basename,cycle)    
             job_output_files.append(output_file)
             job_output_files.append(rstfile)
-            if self.keywords.get('RE_TYPE') == 'TEMPT':
+            if self.re_type == 'TEMPT':
                 job_output_files.append(dmsfile)
-            elif self.keywords.get('RE_TYPE') == 'BEDAMTEMPT':
+            elif self.re_type == 'BEDAMTEMPT':
                 job_output_files.append(rcptfile)
                 job_output_files.append(ligfile)
 
             job_info["job_input_files"] = job_input_files;
             job_info["job_output_files"] = job_output_files;
 
-        if self.keywords.get('VERBOSE') == "yes":
+        if self.verbose:
             msg = "_launchReplica(): Launching %s %s in directory %s cycle %d"
-            if self.transport_mechanism is not 'SSH':
+            if self.transport_mechanism != 'SSH':
                 self.logger.info(msg, executable, input_file, working_directory, cycle)
             else:
                 self.logger.info(msg, executable, input_file, local_working_directory, cycle)
@@ -144,10 +210,10 @@ class impact_job(async_re):
         """
         Returns true if an IMPACT replica has successfully completed a cycle.
         """
-        rstfile = "r%d/%s_%d.rst" % (replica, self.basename,cycle)
-        rstfile_p = "r%d/%s_%d.rst" % (replica, self.basename,cycle-1)
-        output_file = "r%s/%s_%d.out" % (replica,self.basename,cycle)
-        failed_file = "r%s/%s_%d.failed" % (replica,self.basename,cycle)
+        rstfile = self._replicaPath(replica, "%s_%d.rst" % (self.basename,cycle))
+        rstfile_p = self._replicaPath(replica, "%s_%d.rst" % (self.basename,cycle-1))
+        output_file = self._replicaPath(replica, "%s_%d.out" % (self.basename,cycle))
+        failed_file = self._replicaPath(replica, "%s_%d.failed" % (self.basename,cycle))
 
         if os.path.exists(failed_file):
             return False
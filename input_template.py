@@ -0,0 +1,57 @@
+"""
+Cached templates of MD engine input files.
+
+Input files are generated from a template, typically BASENAME.inp, in which
+placeholders of the form @name@ (@n@, @nm1@, @lambda@, @temperature@, ...)
+are substituted with replica and cycle specific values. InputTemplate reads
+the template once, splits it at the placeholders and renders all of them in
+a single pass. The template is re-read if its modification time changes.
+"""
+import os
+import re
+import threading
+
+class InputTemplate(object):
+    """
+    Template of an MD engine input file with @name@ placeholders
+    """
+    placeholder = re.compile(r'@(\w+)@')
+
+    def __init__(self, filename, opener=open):
+        # filename: name of the template file
+        # opener: function used to open files, open(name, mode)
+        self.filename = filename
+        self._open = opener
+        self._lock = threading.Lock()
+        self._mtime = None
+        # template text split at the placeholders: even items are literal
+        # text, odd items are placeholder names
+        self._parts = None
+
+    def _load(self):
+        """Reads and splits the template if it changed since last read."""
+        mtime = os.stat(self.filename).st_mtime
+        with self._lock:
+            if self._parts is None or mtime != self._mtime:
+                f = self._open(self.filename, "r")
+                buffer = f.read()
+                f.close()
+                self._parts = tuple(self.placeholder.split(buffer))
+                self._mtime = mtime
+            return self._parts
+
+    def render(self, values):
+        """
+        Returns the text of the template with placeholders substituted with
+        the corresponding items of the values dictionary, e.g. {'n': '3'}
+        substitutes @n@ with 3. Placeholders not in values are left as they
+        are.
+        """
+        parts = list(self._load())
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            if name in values:
+                parts[i] = str(values[name])
+            else:
+                parts[i] = '@%s@' % name
+        return ''.join(parts)
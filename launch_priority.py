@@ -0,0 +1,63 @@
+"""
+Launch priority policies for replicas waiting to be launched.
+
+The controller uses a LaunchPriority object to choose which of the waiting
+replicas to launch, and job transports that queue jobs (SSH) use it to order
+their queues. Policies (LAUNCH_PRIORITY keyword):
+
+ random: replicas are picked at random (the default).
+ least_cycles: replicas that have completed the fewest cycles first, to
+     keep the progress of replicas balanced.
+ longest_waiting: replicas that have been waiting the longest first.
+ state_coverage: replicas in the states that have been simulated the
+     fewest times first.
+
+Lower keys mean higher priority; ties are broken at random.
+"""
+import heapq
+import random
+
+class LaunchPriority(object):
+    """
+    Orders replicas for launching according to a policy
+    """
+    POLICIES = ('random', 'least_cycles', 'longest_waiting', 'state_coverage')
+
+    def __init__(self, policy, job):
+        # policy: one of POLICIES
+        # job: the async_re job whose replicas are launched
+        if policy not in self.POLICIES:
+            raise ValueError("unknown launch priority policy %s" % policy)
+        self.policy = policy
+        self.job = job
+        # number of cycles launched in each state
+        self.state_launches = {}
+
+    def key(self, replica):
+        """Returns the priority key of a replica, lower keys go first."""
+        if self.policy == 'least_cycles':
+            return self.job.status[replica]['cycle_current']
+        elif self.policy == 'longest_waiting':
+            timing = self.job.timing
+            if timing is None or timing.ready_time[replica] is None:
+                return 0.
+            return timing.ready_time[replica]
+        elif self.policy == 'state_coverage':
+            stateid = self.job.status[replica]['stateid_current']
+            return self.state_launches.get(stateid, 0)
+        else:
+            return 0
+
+    def select(self, replicas, n):
+        """
+        Returns the n replicas with the highest priority among the given
+        ones, in order of priority.
+        """
+        heap = [(self.key(k), random.random(), k) for k in replicas]
+        heapq.heapify(heap)
+        return [heapq.heappop(heap)[2] for i in range(min(n, len(heap)))]
+
+    def launched(self, replica):
+        """Records that a replica has been launched in its current state."""
+        stateid = self.job.status[replica]['stateid_current']
+        self.state_launches[stateid] = self.state_launches.get(stateid, 0) + 1
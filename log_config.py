@@ -0,0 +1,29 @@
+"""
+Configuration of the loggers of ASyncRE.
+
+The 'async_re' loggers are configured from utils/logging.conf the first time
+configure_logging() is called, typically when the first RE job or job
+transport is created, rather than when modules are imported.
+"""
+import os
+import threading
+
+_lock = threading.Lock()
+_configured = False
+
+def configure_logging(conf_file = None):
+    """
+    Configures logging from conf_file (utils/logging.conf by default).
+    Only the first call has an effect, so that the levels set afterwards
+    (e.g. for VERBOSE) are kept.
+    """
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        import logging.config
+        if conf_file is None:
+            conf_file = os.path.join(os.path.dirname(__file__),
+                                     "utils/logging.conf")
+        logging.config.fileConfig(conf_file, disable_existing_loggers=False)
+        _configured = True
@@ -0,0 +1,123 @@
+"""
+Lightweight instrumentation of the ASyncRE controller.
+
+MetricsRegistry collects timing histograms of the phases of the control loop
+(updateStatus, transport.poll, launchJobs, ...) and counters of events
+(launches, completions, exchanges, failures). They are dumped to
+BASENAME_metrics.json, e.g.:
+
+{"counters": {"launches": 120, "completions": 112, ...},
+ "timers": {"updateStatus": {"count": 300, "sum": 1.2, "min": 0.001,
+                             "max": 0.05, "mean": 0.004,
+                             "buckets": [[0.001, 12], [0.002, 80], ...,
+                                         ["+Inf", 300]]}, ...},
+ "time": 1445012345.6, "uptime": 3600.2}
+
+Histogram buckets are cumulative: each holds the number of observations
+less than or equal to its upper bound, in seconds.
+"""
+import time
+import json
+import threading
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = tuple(float('%de%d' % (m, e)) for e in range(-4, 4) for m in (1, 2, 5))
+
+class _Histogram(object):
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.
+        self.min = None
+        self.max = None
+        self.buckets = [0]*len(BUCKETS)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+
+    def snapshot(self):
+        buckets = []
+        cumulative = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            cumulative += n
+            buckets.append([bound, cumulative])
+        buckets.append(['+Inf', self.count])
+        if self.count > 0:
+            mean = self.sum/self.count
+        else:
+            mean = 0.
+        return {'count': self.count, 'sum': self.sum, 'min': self.min,
+                'max': self.max, 'mean': mean, 'buckets': buckets}
+
+class _Timer(object):
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.registry.observe(self.name, time.time() - self.start)
+        return False
+
+class MetricsRegistry(object):
+    """
+    Timing histograms and counters of an RE job
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+        self.start_time = time.time()
+
+    def timer(self, name):
+        """
+        Returns a context manager recording the time spent in its block in
+        the histogram name, e.g.
+
+        with self.metrics.timer('launchJobs'):
+            ...
+        """
+        return _Timer(self, name)
+
+    def observe(self, name, seconds):
+        """Records a duration in seconds in the histogram name."""
+        with self._lock:
+            histogram = self._timers.get(name)
+            if histogram is None:
+                histogram = self._timers[name] = _Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, n = 1):
+        """Adds n to the counter name."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def counter(self, name):
+        """Returns the value of the counter name."""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        """Returns the metrics as a dictionary."""
+        now = time.time()
+        with self._lock:
+            timers = dict((name, histogram.snapshot())
+                          for name, histogram in self._timers.iteritems())
+            counters = dict(self._counters)
+        return {'counters': counters, 'timers': timers, 'time': now,
+                'uptime': now - self.start_time}
+
+    def dumps(self):
+        """Returns the metrics in JSON format."""
+        return json.dumps(self.snapshot(), sort_keys=True, indent=1)
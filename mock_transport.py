@@ -0,0 +1,180 @@
+"""
+Simulated job transport for AsyncRE
+
+Jobs are not run: each launched job occupies one of a fixed number of slots
+for a runtime drawn from a distribution and is then reported as done. No
+processes are spawned and no files are read or written, so that the
+controller can be exercised and benchmarked in isolation at any scale
+(see benchmarks/scheduler_bench.py).
+
+Settings (JOB_TRANSPORT = 'MOCK'):
+
+ MOCK_SLOTS: number of jobs run at the same time, by default
+     TOTAL_CORES/SUBJOB_CORES.
+ MOCK_RUNTIME: average runtime of a job in seconds (default 1).
+ MOCK_RUNTIME_DISTRIBUTION: 'exponential' (the default), 'lognormal',
+     'uniform' or 'constant'.
+ MOCK_RUNTIME_SPREAD: standard deviation of the runtimes relative to the
+     average for the lognormal and uniform distributions (default 0.5).
+ MOCK_SEED: seed of the random number generator of the runtimes.
+"""
+import math
+import time
+import heapq
+import random
+import logging
+
+from transport import Transport
+from settings import Settings, SettingsError
+
+class mock_transport(Transport):
+    """
+    Class to simulate the execution of jobs on a pool of slots
+    """
+    DISTRIBUTIONS = ('exponential', 'lognormal', 'uniform', 'constant')
+
+    def __init__(self, jobname, keywords, nreplicas, slots):
+        # jobname: identifies current asyncRE job
+        # slots: default number of slots (TOTAL_CORES/SUBJOB_CORES)
+        Transport.__init__(self)
+        self.logger = logging.getLogger("async_re.mock_transport")
+
+        self.jobname = jobname
+        # malformed settings raise SettingsError
+        settings = Settings(keywords)
+        self.nslots = settings.getInt('MOCK_SLOTS', slots, minimum=1)
+        self.runtime = settings.getFloat('MOCK_RUNTIME', 1.0, minimum=0)
+        if self.runtime <= 0:
+            raise SettingsError("MOCK_RUNTIME needs to be positive, got %s" %
+                                self.runtime)
+        self.distribution = settings.getChoice('MOCK_RUNTIME_DISTRIBUTION',
+                                               self.DISTRIBUTIONS,
+                                               'exponential')
+        self.spread = settings.getFloat('MOCK_RUNTIME_SPREAD', 0.5, minimum=0)
+        self.random = random.Random()
+        seed = settings.getInt('MOCK_SEED')
+        if seed is not None:
+            self.random.seed(seed)
+
+        # priority queue (heap) of jobs waiting for a slot, as in the SSH
+        # transport: items are (priority key, sequence number, replica)
+        self.jobqueue = []
+        self.jobseq = 0
+        # heap of (end time, replica) of the running jobs
+        self.running = []
+        # replicas whose job is queued or running
+        self.busy = set()
+
+    def _drawRuntime(self):
+        if self.distribution == 'exponential':
+            return self.random.expovariate(1./self.runtime)
+        elif self.distribution == 'lognormal':
+            sigma2 = math.log(1. + self.spread**2)
+            mu = math.log(self.runtime) - 0.5*sigma2
+            return self.random.lognormvariate(mu, math.sqrt(sigma2))
+        elif self.distribution == 'uniform':
+            width = math.sqrt(3.)*self.spread*self.runtime
+            return max(0., self.random.uniform(self.runtime - width,
+                                               self.runtime + width))
+        else:
+            return self.runtime
+
+    def launchJob(self, replica, job_info):
+        """
+        Enqueues a job. job_info is ignored.
+        """
+        if self.launch_priority is None:
+            priority = 0
+        else:
+            priority = self.launch_priority.key(replica)
+        heapq.heappush(self.jobqueue, (priority, self.jobseq, replica))
+        self.jobseq += 1
+        self.busy.add(replica)
+        return len(self.jobqueue)
+
+    def cancelQueued(self, replicas=None):
+        """
+        Removes from the queue the jobs of the given replicas (all if None)
+        that have not been started. Returns the set of replicas whose jobs
+        were removed.
+        """
+        removed = set()
+        queue = []
+        for item in self.jobqueue:
+            replica = item[2]
+            if replicas is None or replica in replicas:
+                self.busy.discard(replica)
+                removed.add(replica)
+            else:
+                queue.append(item)
+        if removed:
+            heapq.heapify(queue)
+            self.jobqueue = queue
+        return removed
+
+    def _update(self, now = None):
+        """
+        Retires the jobs that have reached their end time and starts queued
+        jobs on the slots freed. Returns the number of jobs started.
+        """
+        if now is None:
+            now = time.time()
+        while self.running and self.running[0][0] <= now:
+            (end_time, replica) = heapq.heappop(self.running)
+            self._jobEnded(replica, end_time)
+            self.busy.discard(replica)
+            self.notifyCompletion(replica)
+        nstarted = 0
+        while self.jobqueue and len(self.running) < self.nslots:
+            (priority, seq, replica) = heapq.heappop(self.jobqueue)
+            heapq.heappush(self.running, (now + self._drawRuntime(), replica))
+            self._jobStarted(replica, now)
+            nstarted += 1
+        return nstarted
+
+    def poll(self, replicas=None):
+        self._update()
+
+    def ProcessJobQueue(self, mintime, maxtime):
+        """
+        Starts queued jobs on free slots. Returns as soon as a job has
+        completed and at least mintime has elapsed, or after maxtime.
+        """
+        start_time = time.time()
+        njobs_launched = self._update(start_time)
+        completed = False
+        while True:
+            now = time.time()
+            usetime = now - start_time
+            completed = completed or self._completion_event.is_set()
+            if usetime >= maxtime or (completed and usetime >= mintime):
+                break
+            # blocks until a job completes; once one has, waits only up to
+            # mintime to collect further completions
+            if completed:
+                timeout = mintime - usetime
+            else:
+                timeout = maxtime - usetime
+            if self.running:
+                timeout = min(timeout, max(0., self.running[0][0] - now))
+            if completed:
+                time.sleep(timeout)
+            else:
+                self.waitCompletion(timeout)
+            njobs_launched += self._update()
+        return njobs_launched
+
+    def waitCompletion(self, timeout):
+        # jobs complete only when the simulation is advanced, wakes up at the
+        # end time of the next job to complete
+        if self.running and not self._completion_event.is_set():
+            timeout = min(timeout, max(0., self.running[0][0] - time.time()))
+        Transport.waitCompletion(self, timeout)
+        self._update()
+        return self._completion_event.is_set()
+
+    def isDone(self, replica, cycle):
+        """
+        Checks if a replica completed a run. cycle is ignored.
+        """
+        return replica not in self.busy
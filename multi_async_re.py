@@ -0,0 +1,381 @@
+"""
+Runs several ASyncRE jobs in one process on a shared pool of nodes.
+
+Rather than giving each job its own static slice of the nodes, the jobs
+listed in a campaign control file share one job transport. Replicas of all
+jobs are queued to the shared transport, which launches them on whichever
+node becomes free first, so that the slots one job leaves idle (e.g. while
+it is waiting to exchange) are used by the others.
+
+Campaign control file:
+
+ JOBS: comma separated list of the control files of the jobs, relative
+     to the directory of the campaign control file. The files of each job
+     are in the directory of its control file.
+ JOB_TRANSPORT: 'SSH' or 'MOCK', the transport shared by the jobs.
+ NODEFILE: nodefile of the shared pool of nodes ('SSH' transport),
+     relative to the directory of the campaign control file.
+ NODE_PLACEMENT: 'random' or 'fastest', placement of the replicas on the
+     nodes ('SSH' transport, see placement.py).
+ TOTAL_CORES, SUBJOB_CORES, MOCK_*: size of the pool of slots and
+     settings of the 'MOCK' transport.
+ VERBOSE: 'yes' or 'no'.
+
+The control file of each job may set JOB_WEIGHT (1 by default), its fair
+share weight. Queued replicas are launched by weighted fair queueing, so
+that jobs with replicas to run share the slots in proportion to their
+weights; replicas of the same job follow the LAUNCH_PRIORITY of the job.
+
+Jobs keep their own WALL_TIME, exchange settings, status files, etc.
+SIGUSR1 and SIGTERM drain all the jobs (see async_re.installSignalHandlers()).
+Replica ids are translated between the jobs and the shared transport, and
+remote replica directories are prefixed by the job number so that jobs
+with the same ENGINE_INPUT_BASENAME do not collide on the nodes.
+The loggers of each job are suffixed by its job number as well, e.g.
+async_re.autotune.job1.
+
+Usage:
+
+python multi_async_re.py campaign.cntl
+"""
+import os
+import sys
+import time
+import signal
+import logging
+
+from configobj import ConfigObj
+
+from async_re import read_nodefile
+from transport import Transport
+from placement import NodePlacement
+from settings import Settings, SettingsError
+from log_config import configure_logging
+
+# job classes by RE_TYPE
+JOB_CLASSES = {
+    'BEDAM': ('bedam_async_re', 'bedam_async_re_job'),
+    'BEDAMTEMPT': ('bedamtempt_async_re', 'bedamtempt_async_re_job'),
+    'TEMPT': ('tempt_async_re', 'tempt_async_re_job'),
+    'DATE': ('date_async_re', 'date_async_re_job') }
+
+class job_transport(Transport):
+    """
+    View of a transport shared by several jobs as seen by one of them:
+    translates the replica ids of the job to ids of the shared transport
+    """
+    def __init__(self, shared, offset, nreplicas, tag):
+        # shared: the shared transport
+        # offset: id in the shared transport of replica 0 of the job
+        # tag: prefix of the remote replica directories of the job
+        Transport.__init__(self)
+        self.shared = shared
+        self.offset = offset
+        self.nreplicas = nreplicas
+        self.tag = tag
+        self._shared_ids = None
+
+    def _sharedIds(self, replicas=None):
+        # ids in the shared transport of the given replicas (all those of
+        # the job if None); notifications of the other jobs are left to them
+        if replicas is not None:
+            return frozenset(self.offset + k for k in replicas)
+        if self._shared_ids is None:
+            self._shared_ids = frozenset(range(self.offset,
+                                               self.offset + self.nreplicas))
+        return self._shared_ids
+
+    def launchJob(self, replica, job_info):
+        if job_info is not None and job_info.get('remote_replica_dir'):
+            job_info['remote_replica_dir'] = '%s_%s' % (
+                self.tag, job_info['remote_replica_dir'])
+        return self.shared.launchJob(self.offset + replica, job_info)
+
+    def poll(self, replicas=None):
+        if replicas is None:
+            replicas = range(self.nreplicas)
+        self.shared.poll([self.offset + k for k in replicas])
+
+    def ProcessJobQueue(self, mintime, maxtime):
+        return self.shared.ProcessJobQueue(mintime, maxtime)
+
+    def isDone(self, replica, cycle):
+        return self.shared.isDone(self.offset + replica, cycle)
+
+    def cancelQueued(self, replicas=None):
+        return set(k - self.offset
+                   for k in self.shared.cancelQueued(self._sharedIds(replicas)))
+
+    def terminateJobs(self, replicas=None):
+        return set(k - self.offset
+                   for k in self.shared.terminateJobs(self._sharedIds(replicas)))
+
+    def busyTime(self, replicas=None):
+        return self.shared.busyTime(self._sharedIds(replicas))
+
+    def notifyCompletion(self, replica):
+        self.shared.notifyCompletion(self.offset + replica)
+
+    def notifyReady(self, replica):
+        self.shared.notifyReady(self.offset + replica)
+
+    def readyReplicas(self, replicas=None):
+        return set(k - self.offset
+                   for k in self.shared.readyReplicas(
+                       self._sharedIds(replicas)))
+
+    def waitCompletion(self, timeout):
+        return self.shared.waitCompletion(timeout)
+
+    def completedReplicas(self, replicas=None):
+        # the wake up event stays set while completions of the other jobs
+        # are pending
+        return set(k - self.offset
+                   for k in self.shared.completedReplicas(
+                       self._sharedIds(replicas)))
+
+class FairShare(object):
+    """
+    Launch priority of the replicas queued to the shared transport, by
+    weighted fair queueing: each job advances its own virtual clock by
+    1/JOB_WEIGHT for each replica it queues, and queued replicas are
+    launched in order of the virtual time at which they were queued.
+    """
+    def __init__(self, jobs):
+        # jobs: list of (job, offset, weight)
+        self.jobs = jobs
+        # virtual clock of each job
+        self.tags = [0. for job in jobs]
+
+    def _job(self, replica):
+        for j, (job, offset, weight) in enumerate(self.jobs):
+            if offset <= replica < offset + job.nreplicas:
+                return j
+        raise ValueError("unknown replica id %d" % replica)
+
+    def key(self, replica):
+        """
+        Returns the priority key of a replica being queued. Called once for
+        each replica queued.
+        """
+        j = self._job(replica)
+        (job, offset, weight) = self.jobs[j]
+        # a job that had nothing queued or running does not get credit for
+        # the time it was idle: its clock catches up with the least advanced
+        # clock of the busy jobs
+        start = self.tags[j]
+        if job.running == 0:
+            busy = [self.tags[i] for i, (other, o, w) in enumerate(self.jobs)
+                    if i != j and other.running > 0]
+            if busy:
+                start = max(start, min(busy))
+        self.tags[j] = start + 1./weight
+        if job.launch_priority is None:
+            job_key = 0
+        else:
+            job_key = job.launch_priority.key(replica - offset)
+        return (start, job_key)
+
+class multi_async_re(object):
+    """
+    Class to run several RE jobs on a shared job transport
+    """
+    def __init__(self, command_file):
+        self.command_file = command_file
+        self.keywords = ConfigObj(self.command_file)
+        configure_logging()
+        self.logger = logging.getLogger("async_re.multi_async_re")
+        try:
+            self._checkInput()
+        except SettingsError, e:
+            self._exit(str(e))
+
+        self.jobs = []
+        self.weights = []
+        self.transport = None
+
+    def _checkInput(self):
+        """
+        Parses the settings of the campaign control file. Malformed settings
+        raise SettingsError.
+        """
+        settings = Settings(self.keywords)
+        self.verbose = settings.getFlag('VERBOSE')
+        if self.verbose:
+            self.logger.setLevel(logging.DEBUG)
+
+        job_files = settings.getList('JOBS', required=True)
+        # files are relative to the directory of the campaign control file
+        campaign_dir = os.path.dirname(os.path.abspath(self.command_file))
+        self.job_files = [os.path.join(campaign_dir, f)
+                          for f in job_files if f]
+
+        self.transport_mechanism = settings.getString('JOB_TRANSPORT',
+                                                      required=True)
+        if self.transport_mechanism not in ("SSH", "MOCK"):
+            self._exit("unknown JOB_TRANSPORT %s for a shared transport"
+                       % self.transport_mechanism)
+        if self.transport_mechanism == "SSH":
+            nodefile = settings.getString('NODEFILE', required=True)
+            self.compute_nodes = read_nodefile(os.path.join(campaign_dir,
+                                                            nodefile))
+            self.node_placement = settings.getChoice('NODE_PLACEMENT',
+                                                     NodePlacement.POLICIES,
+                                                     'random')
+        else:
+            # size of the pool of simulated slots
+            total_cores = settings.getInt('TOTAL_CORES', 1, minimum=1)
+            subjob_cores = settings.getInt('SUBJOB_CORES', 1, minimum=1)
+            self.slots = max(1, total_cores/subjob_cores)
+
+    def _exit(self, message):
+        print message
+        sys.stdout.flush()
+        sys.exit(1)
+
+    def _jobClass(self, job_file):
+        keywords = ConfigObj(job_file)
+        re_type = keywords.get('RE_TYPE')
+        if re_type not in JOB_CLASSES:
+            self._exit("unsupported RE_TYPE %s in %s" % (re_type, job_file))
+        module_name, class_name = JOB_CLASSES[re_type]
+        module = __import__(module_name)
+        return getattr(module, class_name)
+
+    def setupJobs(self):
+        """
+        Creates the jobs and the shared transport, then sets up each job.
+        """
+        # the shared transport needs the total number of replicas, jobs are
+        # created first and handed their view of the transport afterwards
+        offsets = []
+        nreplicas = 0
+        proxies = []
+        for k, job_file in enumerate(self.job_files):
+            job_dir = os.path.dirname(job_file)
+            job_class = self._jobClass(job_file)
+            proxy = job_transport(None, nreplicas, 0, 'job%d' % k)
+            # jobs resolve their files from their directory, not from the
+            # working directory they share, and log to loggers of their own
+            options = {'transport': proxy, 'job_dir': job_dir,
+                       'log_tag': 'job%d' % k}
+            job = job_class(job_file, options)
+            if job.transport_mechanism != self.transport_mechanism:
+                self._exit("JOB_TRANSPORT of %s does not match %s"
+                           % (job_file, self.transport_mechanism))
+            proxy.nreplicas = job.nreplicas
+            try:
+                weight = job.settings.getFloat('JOB_WEIGHT', 1.0)
+            except SettingsError, e:
+                self._exit("%s in %s" % (e, job_file))
+            if weight <= 0:
+                self._exit("JOB_WEIGHT of %s needs to be positive" % job_file)
+            self.jobs.append(job)
+            self.weights.append(weight)
+            offsets.append(nreplicas)
+            proxies.append(proxy)
+            nreplicas += job.nreplicas
+
+        if self.transport_mechanism == "SSH":
+            from ssh_transport import ssh_transport
+            placement = NodePlacement(self.compute_nodes,
+                                      self.node_placement)
+            self.transport = ssh_transport('multi', self.compute_nodes,
+                                           range(nreplicas), placement)
+        else:
+            from mock_transport import mock_transport
+            try:
+                self.transport = mock_transport('multi', self.keywords,
+                                                nreplicas, self.slots)
+            except SettingsError, e:
+                self._exit(str(e))
+        for proxy in proxies:
+            proxy.shared = self.transport
+        self.transport.setLaunchPriority(FairShare(
+            zip(self.jobs, offsets, self.weights)))
+
+        for k, job in enumerate(self.jobs):
+            self.logger.info("Setting up job %s (%d replicas, weight %g)",
+                             self.job_files[k], job.nreplicas, self.weights[k])
+            job.setupJob()
+
+    def scheduleJobs(self):
+        """
+        Runs the jobs until the end of their allocations. At each step
+        every job launches its waiting replicas, the shared transport
+        processes its queue, and every job performs its exchanges.
+        """
+        njobs = len(self.jobs)
+        for job in self.jobs:
+            job.startScheduling()
+        signal.signal(signal.SIGUSR1, self._drainSignal)
+        signal.signal(signal.SIGTERM, self._drainSignal)
+
+        while True:
+            active = [k for k in range(njobs)
+                      if self.jobs[k].schedulingActive()]
+            if not active:
+                break
+            for k in range(njobs):
+                if k in active:
+                    self.jobs[k].launchStep()
+                else:
+                    self.jobs[k].updateStatus()
+            mintime = min(self.jobs[k].processMinTime() for k in active)
+            maxtime = min(self.jobs[k].timing.cycle_time for k in active)
+            self.transport.ProcessJobQueue(mintime, maxtime)
+            for k in active:
+                self.jobs[k].exchangeStep()
+
+        # replicas queued to the shared transport but not started are put
+        # back to wait, keeps processing the queue until the running ones
+        # have completed or the drain deadline (after a SIGTERM) has passed
+        for job in self.jobs:
+            job.withdrawQueued()
+        while sum(job.running for job in self.jobs) > 0:
+            maxtime = min(job.timing.cycle_time for job in self.jobs)
+            deadlines = [job.drain_planner.deadline() for job in self.jobs
+                         if job.drain_planner.deadline() is not None]
+            if deadlines:
+                maxtime = min(maxtime, min(deadlines) - time.time())
+                if maxtime <= 0:
+                    break
+            self.transport.ProcessJobQueue(0, maxtime)
+            for job in self.jobs:
+                job.updateStatus()
+                job.write_metrics()
+                job.publish_status()
+
+        for job in self.jobs:
+            job.finishScheduling()
+
+    def _drainSignal(self, signum, frame):
+        for job in self.jobs:
+            job._drainSignal(signum, frame)
+
+if __name__ == '__main__':
+
+    # Parse arguments:
+    usage = "%prog <ConfigFile>"
+
+    if len(sys.argv) != 2:
+        print "Please specify ONE input file"
+        sys.exit(1)
+
+    commandFile = sys.argv[1]
+
+    print ""
+    print "===================================="
+    print "Multi-job Asynchronous Replica Exchange "
+    print "===================================="
+    print ""
+    print "Started at: " + str(time.asctime())
+    print "Input file:", commandFile
+    print ""
+    sys.stdout.flush()
+
+    rx = multi_async_re(commandFile)
+
+    rx.setupJobs()
+
+    rx.scheduleJobs()
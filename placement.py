@@ -0,0 +1,101 @@
+"""
+Placement of replicas on the nodes of the SSH transport.
+
+The nodes (slots) listed in the NODEFILE can be very different, e.g. Xeon
+hosts alongside MIC coprocessors, with different numbers of threads. With
+NODE_PLACEMENT = 'fastest' the transport keeps an estimate of the
+throughput of each node and launches the replica at the top of its queue,
+the most urgent according to LAUNCH_PRIORITY (e.g. the one that has
+completed the fewest cycles with 'least_cycles'), on the fastest free node.
+With 'random' (the default) free nodes are picked at random.
+
+The throughput of a node (cycles per second) is an exponentially weighted
+average of the inverse of the durations of the cycles it ran. Nodes that
+have not run a cycle yet are tried first, so that every node gets measured,
+in order of an estimate from their number of threads (threads_number column)
+times the average throughput per thread of the observed nodes of the same
+architecture (arch column), or of all the observed nodes.
+"""
+import random
+import threading
+
+class NodePlacement(object):
+    """
+    Chooses the nodes on which to launch replicas
+    """
+    POLICIES = ('random', 'fastest')
+
+    def __init__(self, compute_nodes, policy = 'random', smoothing = 0.3):
+        # compute_nodes: list of nodes as read from the NODEFILE
+        # policy: one of POLICIES
+        # smoothing: weight of new observations in the throughput averages
+        if policy not in self.POLICIES:
+            raise ValueError("unknown node placement policy %s" % policy)
+        self.policy = policy
+        self.smoothing = smoothing
+        self.threads = []
+        self.arch = []
+        for node in compute_nodes:
+            try:
+                threads = max(1, int(node["threads_number"]))
+            except (KeyError, ValueError):
+                threads = 1
+            self.threads.append(threads)
+            self.arch.append(node.get("arch", ""))
+        self._lock = threading.Lock()
+        # observed throughput of each node in cycles per second
+        self.rate = [None for node in compute_nodes]
+
+    def record(self, node, runtime):
+        """Records that a node ran a cycle in runtime seconds."""
+        if runtime <= 0:
+            return
+        with self._lock:
+            rate = 1./runtime
+            if self.rate[node] is None:
+                self.rate[node] = rate
+            else:
+                self.rate[node] += self.smoothing*(rate - self.rate[node])
+
+    def estimate(self, node):
+        """
+        Returns the estimated throughput of a node. Before any cycle has
+        been observed only the relative order of the estimates is
+        meaningful.
+        """
+        with self._lock:
+            if self.rate[node] is not None:
+                return self.rate[node]
+            same_arch = [self.rate[i]/self.threads[i]
+                         for i in range(len(self.rate))
+                         if self.rate[i] is not None and
+                         self.arch[i] == self.arch[node]]
+            if same_arch:
+                per_thread = sum(same_arch)/len(same_arch)
+            else:
+                observed = [self.rate[i]/self.threads[i]
+                            for i in range(len(self.rate))
+                            if self.rate[i] is not None]
+                if observed:
+                    per_thread = sum(observed)/len(observed)
+                else:
+                    per_thread = 1.
+            return per_thread*self.threads[node]
+
+    def select(self, nodes):
+        """
+        Returns the node on which to launch the next replica among the given
+        free nodes, or None if there are none.
+        """
+        if not nodes:
+            return None
+        if self.policy == 'random':
+            return random.choice(nodes)
+        best = None
+        best_key = None
+        for node in random.sample(nodes, len(nodes)):
+            key = (self.rate[node] is None, self.estimate(node))
+            if best is None or key > best_key:
+                best = node
+                best_key = key
+        return best
@@ -0,0 +1,89 @@
+"""
+Layout of the replica directories of an RE job.
+
+Every file of a replica lives in its directory, given by ReplicaLayout:
+
+ REPLICA_DIR_LAYOUT = 'flat' (the default): r0, r1, ..., rN in the job
+     directory.
+ REPLICA_DIR_LAYOUT = 'sharded': replica directories are spread over
+     REPLICA_DIR_BUCKETS (100 by default) bucket directories, replica k
+     being in bucket k % REPLICA_DIR_BUCKETS, e.g. rb07/r1207. This keeps
+     the number of entries of each directory small with very large numbers
+     of replicas, which matters on parallel filesystems such as Lustre.
+
+The layout of a job cannot be changed once its replica directories have
+been created. The analysis scripts in utils find the replica directories
+with either layout, the shell scripts through utils/replica_dir.sh.
+"""
+import os
+
+from settings import Settings
+
+class ReplicaLayout(object):
+    """
+    Resolves the paths of the replica directories
+    """
+    LAYOUTS = ('flat', 'sharded')
+
+    def __init__(self, layout = 'flat', nbuckets = 100, root = None):
+        # layout: one of LAYOUTS
+        # nbuckets: number of bucket directories of the 'sharded' layout
+        # root: directory of the job, paths are relative to the working
+        #       directory if None
+        if layout not in self.LAYOUTS:
+            raise ValueError("unknown replica directory layout %s" % layout)
+        self.layout = layout
+        self.nbuckets = nbuckets
+        self.root = root
+        self._bucket_format = 'rb%%0%dd' % max(2, len(str(nbuckets - 1)))
+
+    def _path(self, name):
+        if self.root is None:
+            return name
+        return os.path.join(self.root, name)
+
+    def bucketDir(self, replica):
+        """
+        Returns the bucket directory of a replica, None with the 'flat'
+        layout.
+        """
+        if self.layout == 'flat':
+            return None
+        return self._path(self._bucket_format % (replica % self.nbuckets))
+
+    def bucketDirs(self, nreplicas):
+        """
+        Returns the bucket directories used by nreplicas replicas.
+        """
+        if self.layout == 'flat':
+            return []
+        return [self._path(self._bucket_format % b)
+                for b in range(min(nreplicas, self.nbuckets))]
+
+    def replicaDir(self, replica):
+        """
+        Returns the directory of a replica in the job directory (relative to
+        the working directory if no root was given).
+        """
+        if self.layout == 'flat':
+            return self._path('r%d' % replica)
+        return self._path('%s/r%d' % (self._bucket_format %
+                                      (replica % self.nbuckets), replica))
+
+    def replicaPath(self, replica, filename):
+        """
+        Returns the path of a file of a replica.
+        """
+        return '%s/%s' % (self.replicaDir(replica), filename)
+
+def replica_layout(keywords, root = None):
+    """
+    Returns the ReplicaLayout set by the keywords of a control file, rooted
+    at the job directory root if given. Raises settings.SettingsError for
+    malformed settings.
+    """
+    settings = Settings(keywords)
+    layout = settings.getChoice('REPLICA_DIR_LAYOUT', ReplicaLayout.LAYOUTS,
+                                'flat')
+    nbuckets = settings.getInt('REPLICA_DIR_BUCKETS', 100, minimum=1)
+    return ReplicaLayout(layout, nbuckets, root)
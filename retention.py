@@ -0,0 +1,228 @@
+"""
+Retention of the files of old cycles while an RE job runs.
+
+Every cycle of a replica leaves its input, restart and output files
+(BASENAME_<cycle>.inp, BASENAME_<cycle>.rst, BASENAME_<cycle>.out,
+BASENAME_lig_<cycle>.dms, ...) in the replica directory, and long runs with
+many replicas exhaust the inode or disk quota. With RETENTION set the
+controller disposes of the files of old cycles in a background thread, every
+RETENTION_INTERVAL seconds (300 by default) and once more at the end of the
+run:
+
+ RETENTION = 'none' (the default): files are kept.
+ RETENTION = 'archive': files are moved to compressed tar archives in the
+     replica directory, BASENAME_archive_<first>-<last>.tar.gz, each holding
+     at least RETENTION_BATCH (10 by default) cycles, except for the last
+     one written at the end of the run.
+ RETENTION = 'prune': files are deleted.
+
+The files of the last RETENTION_KEEP_CYCLES (2 by default, at least 1)
+completed cycles of a replica are kept, along with those of the cycle it is
+running or about to run: the MD engine modules read them to check the
+completion of a cycle (_hasCompleted()), to compute exchange energies and
+to build the next input file. RETENTION_EXTENSIONS restricts the files
+disposed of to a comma separated list of extensions, e.g. 'rst,inp' to
+keep the output files for analysis. Files listed in ENGINE_INPUT_EXTFILES
+are never touched.
+
+Archives are written under a temporary name and renamed before the archived
+files are deleted, so that files are never lost if the job is killed.
+"""
+import os
+import re
+import time
+import logging
+import threading
+
+class RetentionService(object):
+    """
+    Archives or deletes the files of the old cycles of the replicas in a
+    background thread
+    """
+    MODES = ('none', 'archive', 'prune')
+
+    def __init__(self, mode, basename, layout, nreplicas, current_cycle,
+                 interval = 300., keep_cycles = 2, batch = 10,
+                 extensions = None, exclude = (), metrics = None):
+        # mode: one of MODES
+        # layout: ReplicaLayout of the job, rooted at the job directory
+        # current_cycle: function returning the cycle a replica is running
+        #                or about to run
+        # extensions: extensions of the files disposed of, None for all
+        # exclude: names of files never disposed of
+        # metrics: MetricsRegistry counting the files disposed of
+        if mode not in self.MODES:
+            raise ValueError("unknown retention mode %s" % mode)
+        self.logger = logging.getLogger("async_re.retention")
+        self.mode = mode
+        self.basename = basename
+        self.layout = layout
+        self.nreplicas = nreplicas
+        self.current_cycle = current_cycle
+        self.interval = interval
+        self.keep_cycles = keep_cycles
+        self.batch = batch
+        if extensions is not None:
+            extensions = set(e.lstrip('.') for e in extensions)
+        self.extensions = extensions
+        self.exclude = set(os.path.basename(f) for f in exclude)
+        self.metrics = metrics
+        # BASENAME_<cycle>.<ext> and BASENAME_<tag>_<cycle>.<ext>
+        self._cycle_file = re.compile(r'^%s_(?:[A-Za-z]\w*_)?(\d+)\.(\w+)$'
+                                      % re.escape(basename))
+
+        self._stop = threading.Event()
+        self._thread = None
+        self.nfiles = 0
+        self.nbytes = 0
+        self.narchives = 0
+        self.nerrors = 0
+
+    def start(self):
+        """Starts the background thread."""
+        if self.mode == 'none' or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name='retention')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, final = True):
+        """
+        Stops the background thread. If final is set disposes of all the
+        files of old cycles, regardless of RETENTION_BATCH.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if final:
+            self.sweep(force=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception, e:
+                # keeps going, the next sweep may succeed
+                self.nerrors += 1
+                self.logger.warning("retention sweep failed: %s", e)
+
+    def _oldFiles(self, replica_dir, keep_from):
+        # returns the files of the cycles before keep_from by cycle
+        cycles = {}
+        for name in os.listdir(replica_dir):
+            match = self._cycle_file.match(name)
+            if match is None or name in self.exclude:
+                continue
+            cycle = int(match.group(1))
+            if cycle >= keep_from:
+                continue
+            if (self.extensions is not None and
+                match.group(2) not in self.extensions):
+                continue
+            path = os.path.join(replica_dir, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                cycles.setdefault(cycle, []).append(name)
+        return cycles
+
+    def sweep(self, force = False):
+        """
+        Disposes of the files of the old cycles of all the replicas. Returns
+        the number of files disposed of.
+        """
+        if self.mode == 'none':
+            return 0
+        start_time = time.time()
+        nfiles = 0
+        for k in range(self.nreplicas):
+            if self._stop.is_set() and not force:
+                break
+            replica_dir = self.layout.replicaDir(k)
+            keep_from = self.current_cycle(k) - self.keep_cycles
+            try:
+                cycles = self._oldFiles(replica_dir, keep_from)
+            except OSError, e:
+                self.nerrors += 1
+                self.logger.warning("Unable to scan %s: %s", replica_dir, e)
+                continue
+            if not cycles:
+                continue
+            if self.mode == 'archive':
+                if len(cycles) < self.batch and not force:
+                    continue
+                nfiles += self._archive(replica_dir, cycles)
+            else:
+                nfiles += self._prune(replica_dir, cycles)
+        if self.metrics is not None:
+            self.metrics.observe('retention', time.time() - start_time)
+        return nfiles
+
+    def _remove(self, replica_dir, names):
+        nfiles = 0
+        nbytes = 0
+        for name in names:
+            path = os.path.join(replica_dir, name)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError, e:
+                self.nerrors += 1
+                self.logger.warning("Unable to remove %s: %s", path, e)
+                continue
+            nfiles += 1
+            nbytes += size
+        self.nfiles += nfiles
+        self.nbytes += nbytes
+        if self.metrics is not None:
+            self.metrics.increment('retention_files', nfiles)
+        return nfiles, nbytes
+
+    def _prune(self, replica_dir, cycles):
+        names = [name for cycle in sorted(cycles) for name in cycles[cycle]]
+        return self._remove(replica_dir, names)[0]
+
+    def _archive(self, replica_dir, cycles):
+        import tarfile
+        first = min(cycles)
+        last = max(cycles)
+        archive = os.path.join(replica_dir, '%s_archive_%d-%d.tar.gz'
+                               % (self.basename, first, last))
+        tmp_archive = archive + '.tmp'
+        names = [name for cycle in sorted(cycles)
+                 for name in sorted(cycles[cycle])]
+        try:
+            tar = tarfile.open(tmp_archive, 'w:gz')
+            try:
+                for name in names:
+                    tar.add(os.path.join(replica_dir, name), arcname=name)
+            finally:
+                tar.close()
+            os.rename(tmp_archive, archive)
+        except (IOError, OSError, tarfile.TarError), e:
+            self.nerrors += 1
+            self.logger.warning("Unable to write %s: %s", archive, e)
+            if os.path.exists(tmp_archive):
+                os.remove(tmp_archive)
+            return 0
+        nfiles = self._remove(replica_dir, names)[0]
+        self.nbytes -= os.path.getsize(archive)
+        self.narchives += 1
+        if self.metrics is not None:
+            self.metrics.increment('retention_archives')
+        return nfiles
+
+    def report(self):
+        """Logs the files disposed of."""
+        if self.mode == 'none':
+            return
+        if self.mode == 'archive':
+            self.logger.info("retention: %d files archived into %d archives, "
+                             "%.1f MB freed, %d errors", self.nfiles,
+                             self.narchives, self.nbytes/1048576.,
+                             self.nerrors)
+        else:
+            self.logger.info("retention: %d files removed, %.1f MB freed, "
+                             "%d errors", self.nfiles, self.nbytes/1048576.,
+                             self.nerrors)
@@ -0,0 +1,107 @@
+"""
+Typed access to the keywords of the control file.
+
+Keywords are read by the RE job once, when the control file is checked
+(async_re._checkInput()), and stored in attributes of the job of the right
+type (e.g. self.total_cores, self.verbose, self.re_type) so that the control
+loop does not look up and convert strings over and over. Malformed values
+raise SettingsError, with a message naming the keyword, as soon as they are
+read rather than when they are first used.
+"""
+
+class SettingsError(ValueError):
+    """
+    Raised for missing or malformed keywords
+    """
+    pass
+
+class Settings(object):
+    """
+    Parses and validates the keywords of a control file (a ConfigObj or a
+    dictionary)
+    """
+    def __init__(self, keywords):
+        self.keywords = keywords
+
+    def _value(self, name, required):
+        value = self.keywords.get(name)
+        if isinstance(value, basestring):
+            value = value.strip()
+            if value == '':
+                value = None
+        if value is None and required:
+            raise SettingsError("%s needs to be specified" % name)
+        return value
+
+    def _number(self, name, convert, type_name, default, required, minimum,
+                maximum):
+        value = self._value(name, required)
+        if value is None:
+            return default
+        try:
+            value = convert(value)
+        except (TypeError, ValueError):
+            raise SettingsError("%s needs to be %s, got %s" %
+                                (name, type_name, self.keywords.get(name)))
+        if minimum is not None and value < minimum:
+            raise SettingsError("%s needs to be at least %s, got %s" %
+                                (name, minimum, value))
+        if maximum is not None and value > maximum:
+            raise SettingsError("%s needs to be at most %s, got %s" %
+                                (name, maximum, value))
+        return value
+
+    def getString(self, name, default = None, required = False):
+        """Returns the value of a keyword as a string."""
+        value = self._value(name, required)
+        if value is None:
+            return default
+        return value
+
+    def getInt(self, name, default = None, required = False, minimum = None,
+               maximum = None):
+        """Returns the value of a keyword as an integer."""
+        return self._number(name, int, 'an integer', default, required,
+                            minimum, maximum)
+
+    def getFloat(self, name, default = None, required = False,
+                 minimum = None, maximum = None):
+        """Returns the value of a keyword as a float."""
+        return self._number(name, float, 'a number', default, required,
+                            minimum, maximum)
+
+    def getFlag(self, name, default = False):
+        """Returns the value of a 'yes' or 'no' keyword as a boolean."""
+        value = self._value(name, False)
+        if value is None:
+            return default
+        if value.lower() == 'yes':
+            return True
+        if value.lower() == 'no':
+            return False
+        raise SettingsError("%s needs to be 'yes' or 'no', got %s" %
+                            (name, value))
+
+    def getChoice(self, name, choices, default = None):
+        """
+        Returns the value of a keyword, in lower case, which must be one of
+        choices.
+        """
+        value = self._value(name, False)
+        if value is None:
+            return default
+        if value.lower() not in choices:
+            raise SettingsError("unknown %s %s, expected one of %s" %
+                                (name, value, ', '.join(choices)))
+        return value.lower()
+
+    def getList(self, name, default = None, required = False):
+        """
+        Returns the value of a comma separated keyword as a list of strings.
+        """
+        value = self._value(name, required)
+        if value is None:
+            return default
+        if isinstance(value, basestring):
+            value = value.split(',')
+        return [v.strip() for v in value]
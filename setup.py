@@ -25,7 +25,7 @@ from async_re import __version__ as VERSION
 
 NAME = 'async_re'
 
-MODULES = 'async_re', 'date_async_re', 'impact_async_re', 'bedam_async_re', 'bedamtempt_async_re', 'tempt_async_re', 'gibbs_sampling', 'ssh_transport', 'boinc_transport'
+MODULES = 'async_re', 'date_async_re', 'impact_async_re', 'bedam_async_re', 'bedamtempt_async_re', 'tempt_async_re', 'gibbs_sampling', 'ssh_transport', 'boinc_transport', 'transport', 'status_journal', 'input_template', 'state_history', 'autotune', 'launch_priority', 'exchange_trigger', 'metrics', 'status_server', 'mock_transport', 'multi_async_re', 'placement', 'log_config', 'settings', 'replica_layout', 'retention'
 
 REQUIRES = 'configobj', 'numpy', 'paramiko', 'scp'
 
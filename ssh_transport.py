@@ -5,25 +5,31 @@ import os
 import re
 import sys
 import time
-import random
-import paramiko
+import threading
 import multiprocessing as mp
+import heapq
 import logging
 import Queue
-import scp
 
 from transport import Transport # WFF - 2/18/15
+from placement import NodePlacement
 
 class ssh_transport(Transport):
     """
     Class to launch and monitor jobs on a set of nodes via ssh (paramiko)
     """
-    def __init__(self, jobname, compute_nodes, replicas): #changed on 12/1/14
+    def __init__(self, jobname, compute_nodes, replicas, placement = None): #changed on 12/1/14
         # jobname: identifies current asyncRE job
         # compute_nodes: list of names of nodes in the pool
         # nreplicas: number of replicas, 0 ... nreplicas-1
+        # placement: NodePlacement choosing the nodes of the jobs, at
+        #   random if None
         Transport.__init__(self) #WFF - 2/18/15
         self.logger = logging.getLogger("async_re.ssh_transport") #WFF - 3/2/15
+        # paramiko and scp are loaded with the transport rather than with
+        # the module, before the job processes are forked so that they
+        # inherit them
+        import paramiko, scp
 
         # names of compute nodes (slots)
         self.compute_nodes = compute_nodes #changed on 12/1/14
@@ -41,9 +47,17 @@ class ssh_transport(Transport):
         # None = no information about where the replica is running
         self.replica_to_job = [ None for k in replicas ]
 
-        # implements a queue of jobs from which to draw the next job
-        # to launch
-        self.jobqueue = Queue.Queue()
+        # implements a priority queue (heap) of jobs from which to draw the
+        # next job to launch. Items are (priority key, sequence number,
+        # replica) so that jobs with the same priority are launched in order
+        self.jobqueue = []
+        self.jobseq = 0
+
+        # chooses the free node on which to launch the job on top of the
+        # queue
+        if placement is None:
+            placement = NodePlacement(self.compute_nodes)
+        self.placement = placement
 
     def _clear_resource(self, replica):
         # frees up the node running a replica identified by replica id
@@ -72,15 +86,15 @@ class ssh_transport(Transport):
         return nodeid
 
     def _availableNode(self):
-        #returns a node at random among available nodes
+        #returns the node chosen by the placement policy among available nodes
         available = [node for node in range(self.nprocs)
                      if self.node_status[node] == None]
         if available == None or len(available) == 0:
             return None
-        random.shuffle(available)
-        return available[0]
+        return self.placement.select(available)
 
     def _launchCmd(self, command, job):
+        import paramiko, scp
         ssh = paramiko.SSHClient()
         ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         ssh.connect(job['nodename']) 
@@ -161,12 +175,21 @@ class ssh_transport(Transport):
         job['error_queue'] = error_queue
         job['command'] = command
         job['process_handle'] = None
+        # set by the watcher thread when the process has exited
+        job['exited'] = False
+        # set when the process is terminated, it then leaves no output
+        job['terminated'] = False
 
         self.replica_to_job[replica] = job
 
-        self.jobqueue.put(replica)
+        if self.launch_priority is None:
+            priority = 0
+        else:
+            priority = self.launch_priority.key(replica)
+        heapq.heappush(self.jobqueue, (priority, self.jobseq, replica))
+        self.jobseq += 1
 
-        return self.jobqueue.qsize()
+        return len(self.jobqueue)
 
     #intel coprocessor setup
     def ModifyCommand(self,job, command):
@@ -188,25 +211,84 @@ class ssh_transport(Transport):
         #self.logger.info(new_command) #can print new_command here to check the command
         return new_command
     
+    def _watchJob(self, replica, job):
+        """
+        Waits for the process running a replica to exit, records its runtime
+        on the node and posts a completion notification. Runs in a daemon
+        thread, one per job. Once the job is launched only the watcher
+        touches its process, the controller relies on job['exited'].
+        """
+        process = job['process_handle']
+        process.join()
+        self._jobEnded(replica)
+        if process.exitcode == 0:
+            self.placement.record(job['nodeid'],
+                                  time.time() - job['launch_time'])
+        job['exited'] = True
+        self.notifyCompletion(replica)
+
+    def cancelQueued(self, replicas=None):
+        """
+        Removes from the queue the jobs of the given replicas (all if None)
+        that have not been launched on a node yet. Returns the set of
+        replicas whose jobs were removed.
+        """
+        removed = set()
+        queue = []
+        for item in self.jobqueue:
+            replica = item[2]
+            if replicas is None or replica in replicas:
+                job = self.replica_to_job[replica]
+                job['output_queue'].close()
+                job['error_queue'].close()
+                self.replica_to_job[replica] = None
+                removed.add(replica)
+            else:
+                queue.append(item)
+        if removed:
+            heapq.heapify(queue)
+            self.jobqueue = queue
+        return removed
+
+    def terminateJobs(self, replicas=None):
+        """
+        Terminates the processes of the launched jobs of the given replicas
+        (all if None) that have not exited, which would otherwise keep the
+        interpreter from exiting until the remote jobs end. Returns the set
+        of replicas whose processes were terminated.
+        """
+        stopped = set()
+        for replica, job in enumerate(self.replica_to_job):
+            if job is None or job['process_handle'] is None or job['exited']:
+                continue
+            if replicas is not None and replica not in replicas:
+                continue
+            job['terminated'] = True
+            job['process_handle'].terminate()
+            stopped.add(replica)
+        return stopped
+
     def ProcessJobQueue(self, mintime, maxtime):
         """
         Launches jobs waiting in the queue.
-        It will scan free nodes and job queue up to maxtime.
-        If the queue becomes empty, it will still block until maxtime is elapsed.
+        It will scan free nodes and job queue up to maxtime. As soon as a
+        replica completes, and after at least mintime has elapsed, it returns
+        so that the controller can exchange and relaunch it. Jobs still in the
+        queue are launched on the nodes freed in the meantime.
         """
         njobs_launched = 0
-        usetime = 0
-        nreplicas = len(self.replica_to_job)
+        start_time = time.time()
+        completed = False
 
-        while usetime < maxtime:
+        while True:
 
             # find an available node
             node = self._availableNode()
 
-            while (not self.jobqueue.empty()) and (not node == None):
+            while self.jobqueue and (not node == None):
 
                 # grabs job on top of the queue
-                replica = self.jobqueue.get()
+                (priority, seq, replica) = heapq.heappop(self.jobqueue)
                 job = self.replica_to_job[replica]
                
                 # assign job to available node
@@ -245,10 +327,18 @@ class ssh_transport(Transport):
 
                 # launches job
                 processid = mp.Process(target=self._launchCmd, args=(command, job))
+                job['launch_time'] = time.time()
                 processid.start()
+                self._jobStarted(replica, job['launch_time'])
 
                 job['process_handle'] = processid
 
+                # watches the job to be notified as soon as it exits
+                watcher = threading.Thread(target=self._watchJob,
+                                           args=(replica, job))
+                watcher.daemon = True
+                watcher.start()
+
                 # connects node to replica
                 self.replica_to_job[replica] = job
                 self.node_status[node] = replica
@@ -257,14 +347,21 @@ class ssh_transport(Transport):
                 njobs_launched += 1
                 node = self._availableNode()
 
-            # waits mintime second and rescans job queue
-            time.sleep(mintime)
-
-            # updates set of free nodes by checking for replicas that have exited
-            for repl in range(nreplicas):
-                self.isDone(repl,0)
+            usetime = time.time() - start_time
+            if usetime >= maxtime or (completed and usetime >= mintime):
+                break
 
-            usetime += mintime
+            # blocks until a replica exits; once one has, waits only up
+            # to mintime to collect further completions
+            if completed:
+                timeout = mintime - usetime
+            else:
+                timeout = maxtime - usetime
+            if self.waitCompletion(timeout):
+                # frees the nodes of the replicas that have exited
+                for repl in self.completedReplicas():
+                    self.isDone(repl,0)
+                completed = True
 
         return njobs_launched
 
@@ -283,26 +380,26 @@ class ssh_transport(Transport):
             # if job has been removed we assume that the replica is done
             return True
         else:
-            process = job['process_handle']
-            if process == None:
-                done = False
-            else:
-                done = not process.is_alive()
+            # the process is waited for by its watcher thread only, two
+            # threads waiting for the same child would race
+            done = job['exited']
             if done:
                 # disconnects replica from job and node
                 self._clear_resource(replica)
 
-                # attempt to remove item from queues
-                try:
-                    # wait 30sec, if not raise Queue.Empty exception
-                    # this could also be modified to use .get(block=False)
-                    # which is equivalent to timeout=0
-                    self.logger.info("%s", job['output_queue'].get(timeout=30))
-                    self.logger.info("%s", job['error_queue'].get(timeout=30))
-                # if the queues timeout, raises a Queue.Empty Exception
-                # note this is not a mp.Queue exception; it's from the Queue lib
-                except Queue.Empty:
-                    self.logger.warn("Error removing items from ssh process communication queues for r%s", replica)
+                # attempt to remove item from queues, a terminated process
+                # leaves none
+                if not job['terminated']:
+                    try:
+                        # wait 30sec, if not raise Queue.Empty exception
+                        # this could also be modified to use .get(block=False)
+                        # which is equivalent to timeout=0
+                        self.logger.info("%s", job['output_queue'].get(timeout=30))
+                        self.logger.info("%s", job['error_queue'].get(timeout=30))
+                    # if the queues timeout, raises a Queue.Empty Exception
+                    # note this is not a mp.Queue exception; it's from the Queue lib
+                    except Queue.Empty:
+                        self.logger.warn("Error removing items from ssh process communication queues for r%s", replica)
 
                 job['output_queue'].close()
                 job['error_queue'].close()
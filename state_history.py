@@ -0,0 +1,181 @@
+"""
+Buffered storage of the state history of replicas.
+
+Every time an input file is built for a replica, the cycle and the state
+assigned to it are recorded in the replica directory. Records are buffered
+in memory and flushed periodically by a background thread (and on close),
+rather than opening and closing the history files once per replica per
+cycle.
+
+Two formats are supported:
+
+ - text: rN/state.history, one line per cycle with the cycle, the state id
+   and the state parameters, as written by earlier versions of ASyncRE.
+ - binary: rN/state.history.bin, fixed-size little-endian records with
+   fields (cycle, stateid, lambda, temperature) which load directly into a
+   NumPy structured array with load_state_history(). Parameters which do
+   not apply to a job (e.g. the temperature in BEDAM jobs) are stored as
+   NaN.
+
+Jobs write the binary format only unless STATE_HISTORY_FORMAT is 'text' or
+'both'. Binary histories are exported to the text format with
+export_state_history(), or from the command line:
+
+python state_history.py r0/state.history.bin [r1/state.history.bin ...]
+
+which writes r0/state.history, r1/state.history, ...
+"""
+import os
+import struct
+import logging
+import threading
+
+# layout of the records of state.history.bin
+HISTORY_RECORD = struct.Struct('<iidd')
+HISTORY_DTYPE = [('cycle', '<i4'), ('stateid', '<i4'),
+                 ('lambda', '<f8'), ('temperature', '<f8')]
+
+def load_state_history(filename):
+    """
+    Loads a binary state history file into a NumPy structured array with
+    fields 'cycle', 'stateid', 'lambda' and 'temperature'. A record left
+    incomplete by a crash is ignored.
+    """
+    import numpy
+    nrecords = os.path.getsize(filename) // HISTORY_RECORD.size
+    return numpy.fromfile(filename, dtype=numpy.dtype(HISTORY_DTYPE),
+                          count=nrecords)
+
+def export_state_history(filename, textfile):
+    """
+    Writes a binary state history file in the text format of
+    state.history.
+    """
+    f = open(textfile, 'w')
+    for cycle, stateid, lambd, temperature in load_state_history(filename):
+        fields = ['%d' % cycle, '%d' % stateid]
+        for par in (lambd, temperature):
+            if par == par:
+                fields.append('%s' % par)
+        f.write(' '.join(fields) + '\n')
+    f.close()
+
+class StateHistory(object):
+    """
+    Buffered writer of the state histories of the replicas
+    """
+    def __init__(self, formats, flush_interval, opener=open):
+        # formats: list of formats to write, 'text' and/or 'binary'
+        # flush_interval: time in seconds between flushes of the buffers
+        # opener: function used to open files, open(name, mode)
+        self.logger = logging.getLogger("async_re.state_history")
+        self.formats = formats
+        self.flush_interval = flush_interval
+        self._open = opener
+        self._lock = threading.Lock()
+        # buffered records by replica directory
+        self._buffers = {}
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flushPeriodically)
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def append(self, replica_dir, cycle, stateid, lambd=None,
+               temperature=None):
+        """
+        Records the state of a replica for a cycle. lambd and temperature
+        are the state parameters that apply to the job, as strings.
+        """
+        with self._lock:
+            self._buffers.setdefault(replica_dir, []).append(
+                (cycle, stateid, lambd, temperature))
+
+    def lastRecord(self, replica_dir):
+        """
+        Returns the (cycle, stateid) of the last record of the history of a
+        replica, buffered or written, or None if there is none.
+        """
+        with self._lock:
+            records = self._buffers.get(replica_dir)
+            if records:
+                return records[-1][:2]
+        if 'binary' in self.formats:
+            filename = os.path.join(replica_dir, 'state.history.bin')
+            if not os.path.exists(filename):
+                return None
+            # a record left incomplete by a crash is ignored
+            nrecords = os.path.getsize(filename) // HISTORY_RECORD.size
+            if nrecords == 0:
+                return None
+            f = self._open(filename, 'rb')
+            f.seek((nrecords - 1)*HISTORY_RECORD.size)
+            record = HISTORY_RECORD.unpack(f.read(HISTORY_RECORD.size))
+            f.close()
+            return record[:2]
+        filename = os.path.join(replica_dir, 'state.history')
+        if not os.path.exists(filename):
+            return None
+        f = self._open(filename, 'r')
+        lines = [line for line in f.read().splitlines() if line.strip()]
+        f.close()
+        if not lines:
+            return None
+        fields = lines[-1].split()
+        try:
+            return (int(fields[0]), int(fields[1]))
+        except (IndexError, ValueError):
+            return None
+
+    def flush(self):
+        """Writes out all buffered records."""
+        with self._lock:
+            buffers = self._buffers
+            self._buffers = {}
+        for replica_dir, records in buffers.iteritems():
+            if 'text' in self.formats:
+                lines = []
+                for cycle, stateid, lambd, temperature in records:
+                    fields = ['%d' % cycle, '%d' % stateid]
+                    for par in (lambd, temperature):
+                        if par is not None:
+                            fields.append(par)
+                    lines.append(' '.join(fields) + '\n')
+                f = self._open(os.path.join(replica_dir, 'state.history'), 'a')
+                f.write(''.join(lines))
+                f.close()
+            if 'binary' in self.formats:
+                data = []
+                for cycle, stateid, lambd, temperature in records:
+                    data.append(HISTORY_RECORD.pack(
+                        cycle, stateid,
+                        float('nan') if lambd is None else float(lambd),
+                        float('nan') if temperature is None else float(temperature)))
+                f = self._open(os.path.join(replica_dir, 'state.history.bin'), 'ab')
+                f.write(''.join(data))
+                f.close()
+
+    def _flushPeriodically(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except (Exception, SystemExit), e:
+                self.logger.error("Unable to write state history: %s", e)
+
+    def close(self):
+        """Stops the periodic flushes and writes out all buffered records."""
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+
+if __name__ == '__main__':
+
+    import sys
+
+    if len(sys.argv) < 2:
+        print "Please specify the binary state history files to export"
+        sys.exit(1)
+
+    for filename in sys.argv[1:]:
+        textfile = os.path.join(os.path.dirname(filename), 'state.history')
+        export_state_history(filename, textfile)
+        print "Exported %s to %s" % (filename, textfile)
@@ -0,0 +1,121 @@
+"""
+Journaled storage of the status table of an ASyncRE job.
+
+The status table (one record per replica) used to be pickled as a whole to
+BASENAME.stat every time the controller updated it, even when nothing had
+changed. StatusJournal instead appends only the records that changed since
+the last write to a write-ahead journal, BASENAME.stat.journal, and
+periodically compacts the journal into a full snapshot written to
+BASENAME.stat in the same format as before.
+
+On restart the snapshot is loaded and the journal is replayed on top of it.
+Journal entries hold complete replica records, so replaying them is
+idempotent, and an entry torn by a crash in the middle of a write is simply
+discarded.
+"""
+import os
+import pickle
+import logging
+
+class StatusJournal(object):
+    """
+    Write-ahead journal of the status table of an RE job
+    """
+    def __init__(self, basename, compact_interval, opener=open):
+        # basename: ENGINE_INPUT_BASENAME of the job, prefixed by the job
+        #           directory
+        # compact_interval: number of journaled records after which the
+        #                   journal is compacted into a new snapshot
+        # opener: function used to open files, open(name, mode)
+        self.logger = logging.getLogger("async_re.status_journal")
+        self.snapshot_file = '%s.stat' % basename
+        self.journal_file = '%s.stat.journal' % basename
+        self.compact_interval = compact_interval
+        self._open = opener
+        # copy of the status table as last persisted
+        self._persisted = None
+        # open journal file and number of records it holds
+        self._journal = None
+        self._nrecords = 0
+
+    def _copy(self, status):
+        return [dict(record) for record in status]
+
+    def write(self, status):
+        """
+        Persists the status table, appending to the journal only the records
+        that changed since the last write.
+        """
+        if self._persisted is None or len(self._persisted) != len(status):
+            self.compact(status)
+            return
+        changed = [(k, dict(record)) for k, record in enumerate(status)
+                   if record != self._persisted[k]]
+        if not changed:
+            return
+        if self._nrecords + len(changed) > self.compact_interval:
+            self.compact(status)
+            return
+        if self._journal is None:
+            self._journal = self._open(self.journal_file, 'ab')
+        pickle.dump(changed, self._journal, pickle.HIGHEST_PROTOCOL)
+        self._journal.flush()
+        self._nrecords += len(changed)
+        for k, record in changed:
+            self._persisted[k] = record
+
+    def compact(self, status):
+        """
+        Writes a full snapshot of the status table and empties the journal.
+        The snapshot is written to a temporary file and renamed into place so
+        that an existing snapshot is never left half-written.
+        """
+        tmp_file = '%s.tmp' % self.snapshot_file
+        f = self._open(tmp_file, 'w')
+        pickle.dump(status, f)
+        f.close()
+        os.rename(tmp_file, self.snapshot_file)
+        # a crash before this point leaves a journal whose records are all
+        # already contained in the snapshot
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = self._open(self.journal_file, 'wb')
+        self._nrecords = 0
+        self._persisted = self._copy(status)
+
+    def load(self):
+        """
+        Loads the status table from the last snapshot and replays the
+        journal on top of it. Returns the status table.
+        """
+        f = self._open(self.snapshot_file, 'r')
+        status = pickle.load(f)
+        f.close()
+        nrecords = 0
+        if os.path.exists(self.journal_file):
+            f = self._open(self.journal_file, 'rb')
+            while True:
+                try:
+                    changed = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    # torn entry at the end of the journal
+                    self.logger.warning("Discarding incomplete entry at the "
+                                        "end of %s", self.journal_file)
+                    break
+                for k, record in changed:
+                    status[k] = record
+                nrecords += len(changed)
+            f.close()
+        if nrecords > 0:
+            self.logger.info("Replayed %d status records from %s", nrecords,
+                             self.journal_file)
+        # starts from a clean snapshot
+        self.compact(status)
+        return status
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
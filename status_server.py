@@ -0,0 +1,134 @@
+"""
+HTTP endpoint serving the live status of a running ASyncRE job.
+
+When STATUS_HTTP_PORT is set the controller runs a small HTTP server in a
+background thread, bound to STATUS_HTTP_HOST (127.0.0.1 by default). The
+controller periodically publishes a snapshot of its status, which the server
+renders on request:
+
+ /status (or /): the snapshot in JSON format, with the replica status
+     table, cycle rates, slot utilization, exchange acceptance and the
+     timing histograms and counters of the controller.
+ /metrics: the same figures, except the replica table, in the Prometheus
+     text exposition format.
+
+Requests are served from the last published snapshot and never touch the
+controller state or the filesystem.
+"""
+import json
+import logging
+import threading
+import BaseHTTPServer
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (key, labels[key]) for key in sorted(labels))
+
+def prometheus_text(snapshot):
+    """Renders a status snapshot in the Prometheus text format."""
+    lines = []
+    def metric(name, kind, help, samples):
+        lines.append('# HELP asyncre_%s %s' % (name, help))
+        lines.append('# TYPE asyncre_%s %s' % (name, kind))
+        for suffix, labels, value in samples:
+            if value is None:
+                continue
+            if labels:
+                lines.append('asyncre_%s%s{%s} %r' % (name, suffix, labels,
+                                                     float(value)))
+            else:
+                lines.append('asyncre_%s%s %r' % (name, suffix, float(value)))
+
+    metric('replicas', 'gauge', 'Number of replicas by running status.',
+           [('', _labels(status=status), n)
+            for status, n in sorted(snapshot['replicas_by_status'].items())])
+    metric('slots', 'gauge', 'Number of job slots.',
+           [('', None, snapshot['slots'])])
+    metric('slot_utilization', 'gauge',
+           'Fraction of job slots with a replica submitted or running.',
+           [('', None, snapshot['slot_utilization'])])
+    metric('cycles_completed', 'gauge',
+           'Number of cycles completed by all replicas.',
+           [('', None, snapshot['cycles_completed'])])
+    metric('completion_rate', 'gauge',
+           'Replica cycles completed per second since the controller started.',
+           [('', None, snapshot['completion_rate'])])
+    metric('cycle_duration_seconds', 'gauge',
+           'Average wall clock duration of replica cycles.',
+           [('', None, snapshot['cycle_duration'])])
+    metric('exchange_acceptance', 'gauge',
+           'Fraction of exchanged replicas that changed state.',
+           [('', None, snapshot['exchange_acceptance'])])
+    metric('uptime_seconds', 'gauge', 'Time since the controller started.',
+           [('', None, snapshot['metrics']['uptime'])])
+    metric('events_total', 'counter', 'Number of controller events.',
+           [('', _labels(event=name), n) for name, n
+            in sorted(snapshot['metrics']['counters'].items())])
+    samples = []
+    for phase, histogram in sorted(snapshot['metrics']['timers'].items()):
+        for bound, n in histogram['buckets']:
+            samples.append(('_bucket', _labels(phase=phase, le=bound), n))
+        samples.append(('_sum', _labels(phase=phase), histogram['sum']))
+        samples.append(('_count', _labels(phase=phase), histogram['count']))
+    metric('phase_seconds', 'histogram',
+           'Time spent in the phases of the control loop.', samples)
+    return '\n'.join(lines) + '\n'
+
+class _StatusRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        snapshot = self.server.status_server.snapshot()
+        if snapshot is None:
+            self.send_error(503, 'Status not available yet')
+            return
+        if path in ('', '/status'):
+            body = json.dumps(snapshot, sort_keys=True)
+            content_type = 'application/json'
+        elif path == '/metrics':
+            body = prometheus_text(snapshot)
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.status_server.logger.debug(format, *args)
+
+class StatusServer(object):
+    """
+    HTTP server of the status snapshots of an RE job
+    """
+    def __init__(self, host, port):
+        # host, port: address to bind to, port 0 picks a free port
+        self.logger = logging.getLogger("async_re.status_server")
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._httpd = BaseHTTPServer.HTTPServer((host, port),
+                                                _StatusRequestHandler)
+        self._httpd.status_server = self
+        self.address = self._httpd.server_address
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def publish(self, snapshot):
+        """
+        Makes snapshot, a dictionary which is not modified afterwards, the
+        status served to clients.
+        """
+        with self._lock:
+            self._snapshot = snapshot
+
+    def snapshot(self):
+        with self._lock:
+            return self._snapshot
+
+    def close(self):
+        """Stops serving."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
@@ -0,0 +1,81 @@
+"""
+Tests of the end of run decisions of DrainPlanner (autotune.py).
+
+python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from autotune import CycleTimeController, DrainPlanner
+
+def record_cycles(timing, replica, runtimes, start = 0.):
+    # records cycles of the given durations, relaunched right away
+    now = start
+    for runtime in runtimes:
+        timing.transition(replica, 'W', 'R', now)
+        now += runtime
+        timing.transition(replica, 'R', 'S', now)
+        timing.transition(replica, 'S', 'W', now)
+    return now
+
+class DrainPlannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.timing = CycleTimeController(4, 5., 0.1, adaptive=False)
+
+    def test_static_estimate(self):
+        planner = DrainPlanner(self.timing, 1000., 100., 10., min_samples=3)
+        self.assertEqual(planner.predict(0), 100.)
+        self.assertTrue(planner.canLaunch(0, now=890.))
+        self.assertFalse(planner.canLaunch(0, now=891.))
+
+    def test_cycle_history(self):
+        planner = DrainPlanner(self.timing, 1000., 100., 10., min_samples=3)
+        record_cycles(self.timing, 0, [20., 20.])
+        self.assertEqual(planner.predict(0), 100.)
+        record_cycles(self.timing, 1, [20.])
+        # history in use once min_samples cycles are seen, whether timing
+        # is adaptive or not
+        self.assertAlmostEqual(planner.predict(0), 20.)
+        # replicas that have not completed a cycle get the average
+        self.assertAlmostEqual(planner.predict(2), 20.)
+        self.assertTrue(planner.canLaunch(0, now=970.))
+        self.assertFalse(planner.canLaunch(0, now=971.))
+
+    def test_active_and_drain(self):
+        planner = DrainPlanner(self.timing, 1000., 100., 10.)
+        self.assertTrue(planner.active([0, 1], now=500.))
+        self.assertFalse(planner.draining)
+        self.assertFalse(planner.active([0, 1], now=950.))
+        self.assertTrue(planner.draining)
+        self.assertTrue(planner.reason)
+        # no replica is launched once draining
+        self.assertFalse(planner.canLaunch(0, now=0.))
+        self.assertFalse(planner.active([0, 1], now=0.))
+        self.assertEqual(planner.deadline(), None)
+
+    def test_requested_drain(self):
+        planner = DrainPlanner(self.timing, 1000., 100., 10.)
+        planner.drain('SIGUSR1')
+        self.assertFalse(planner.active([0], now=0.))
+        self.assertEqual(planner.deadline(), None)
+        planner.drain('SIGTERM', timeout=30.)
+        deadline = planner.deadline()
+        self.assertTrue(deadline is not None)
+        # a later request does not extend the deadline
+        planner.drain('SIGTERM', timeout=60.)
+        self.assertEqual(planner.deadline(), deadline)
+
+    def test_skipped_once(self):
+        planner = DrainPlanner(self.timing, 1000., 100., 10.)
+        self.assertTrue(planner.skipped(0))
+        self.assertFalse(planner.skipped(0))
+        self.assertTrue(planner.skipped(1))
+        self.assertEqual(planner.nskipped, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Tests of the exchange trigger policies (exchange_trigger.py).
+
+python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from exchange_trigger import ExchangeTrigger
+
+class ExchangeTriggerTest(unittest.TestCase):
+
+    def test_always(self):
+        trigger = ExchangeTrigger('always')
+        self.assertFalse(trigger.holds)
+        pool = [(0, 1), (1, 1)]
+        self.assertEqual(trigger.held(pool, 4), set())
+        self.assertTrue(trigger.ready(pool, 4, now=0.))
+        # fewer than two replicas cannot exchange
+        self.assertFalse(trigger.ready([(0, 1)], 4, now=0.))
+
+    def test_threshold_hold_and_release(self):
+        trigger = ExchangeTrigger('threshold', min_waiting=3)
+        self.assertTrue(trigger.holds)
+        pool = [(0, 1), (1, 1)]
+        # the pool is held back from launch until large enough
+        self.assertEqual(trigger.held(pool, 4), set([0, 1]))
+        self.assertFalse(trigger.ready(pool, 4, now=0.))
+        self.assertEqual(trigger.ndeferred, 1)
+        pool.append((2, 1))
+        self.assertEqual(trigger.held(pool, 4), set([0, 1, 2]))
+        self.assertTrue(trigger.ready(pool, 4, now=1.))
+        trigger.exchanged(pool, now=1.)
+        # exchanged replicas are released until their next cycle
+        self.assertEqual(trigger.held(pool, 4), set())
+        self.assertEqual(trigger.held([(0, 2), (1, 1)], 4), set([0]))
+
+    def test_window_time(self):
+        trigger = ExchangeTrigger('window', window_time=10.)
+        pool = [(0, 1), (1, 1), (2, 1)]
+        self.assertFalse(trigger.ready(pool, 2, now=0.))
+        self.assertFalse(trigger.ready(pool, 2, now=5.))
+        self.assertEqual(trigger.held(pool, 2), set([0, 1, 2]))
+        self.assertTrue(trigger.ready(pool, 2, now=10.))
+        trigger.exchanged(pool, now=10.)
+        self.assertEqual(trigger.held(pool, 2), set())
+        self.assertEqual(trigger.nexchanges, 1)
+        self.assertEqual(trigger.pool_size_total, 3)
+        self.assertAlmostEqual(trigger.latency_total/trigger.nlatency, 10.)
+
+    def test_window_count(self):
+        trigger = ExchangeTrigger('window', window_time=100.,
+                                  window_count=3)
+        self.assertFalse(trigger.ready([(0, 1), (1, 1)], 2, now=0.))
+        self.assertTrue(trigger.ready([(0, 1), (1, 1), (2, 1)], 2, now=1.))
+
+    def test_release_when_nothing_runs(self):
+        trigger = ExchangeTrigger('threshold', min_waiting=10)
+        pool = [(0, 1), (1, 1)]
+        self.assertEqual(trigger.held(pool, 2), set([0, 1]))
+        self.assertFalse(trigger.ready(pool, 2, now=0.))
+        # no replica can join the pool any more: nothing is held back and
+        # the pool is exchanged once
+        self.assertEqual(trigger.held(pool, 0), set())
+        self.assertTrue(trigger.ready(pool, 0, now=1.))
+        trigger.exchanged(pool, now=1.)
+        self.assertFalse(trigger.ready(pool, 0, now=2.))
+
+    def test_immediate(self):
+        trigger = ExchangeTrigger('immediate')
+        self.assertEqual(trigger.minTime(0.5), 0.)
+        pool = [(0, 1), (1, 1)]
+        self.assertTrue(trigger.ready(pool, 2, now=0.))
+        trigger.exchanged(pool, now=0.)
+        # no replica joined since the last exchange
+        self.assertFalse(trigger.ready(pool, 2, now=1.))
+        self.assertTrue(trigger.ready([(0, 2), (1, 1)], 2, now=2.))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Tests of the layouts of the replica directories (replica_layout.py).
+
+python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from replica_layout import ReplicaLayout, replica_layout
+from settings import SettingsError
+
+class ReplicaLayoutTest(unittest.TestCase):
+
+    def test_flat(self):
+        layout = ReplicaLayout()
+        self.assertEqual(layout.replicaDir(7), 'r7')
+        self.assertEqual(layout.replicaPath(7, 'job_3.out'), 'r7/job_3.out')
+        self.assertEqual(layout.bucketDir(7), None)
+        self.assertEqual(layout.bucketDirs(10), [])
+
+    def test_sharded(self):
+        layout = ReplicaLayout('sharded')
+        self.assertEqual(layout.replicaDir(1207), 'rb07/r1207')
+        self.assertEqual(layout.replicaPath(1207, 'job_1.inp'),
+                         'rb07/r1207/job_1.inp')
+        self.assertEqual(layout.bucketDir(1207), 'rb07')
+        self.assertEqual(layout.bucketDirs(3), ['rb00', 'rb01', 'rb02'])
+        self.assertEqual(len(layout.bucketDirs(5000)), 100)
+
+    def test_bucket_names(self):
+        # bucket numbers are padded to the width of the largest one
+        layout = ReplicaLayout('sharded', 1000)
+        self.assertEqual(layout.replicaDir(1207), 'rb207/r1207')
+        layout = ReplicaLayout('sharded', 4)
+        self.assertEqual(layout.replicaDir(6), 'rb02/r6')
+
+    def test_root(self):
+        layout = ReplicaLayout('flat', root='/data/job')
+        self.assertEqual(layout.replicaPath(2, 'a.inp'), '/data/job/r2/a.inp')
+        layout = ReplicaLayout('sharded', 10, root='/data/job')
+        self.assertEqual(layout.replicaDir(12), '/data/job/rb02/r12')
+        self.assertEqual(layout.bucketDirs(2),
+                         ['/data/job/rb00', '/data/job/rb01'])
+
+    def test_keywords(self):
+        layout = replica_layout({})
+        self.assertEqual(layout.layout, 'flat')
+        layout = replica_layout({'REPLICA_DIR_LAYOUT': 'Sharded',
+                                 'REPLICA_DIR_BUCKETS': '16'}, '/job')
+        self.assertEqual(layout.replicaDir(17), '/job/rb01/r17')
+        self.assertRaises(SettingsError, replica_layout,
+                          {'REPLICA_DIR_LAYOUT': 'deep'})
+        self.assertRaises(SettingsError, replica_layout,
+                          {'REPLICA_DIR_LAYOUT': 'sharded',
+                           'REPLICA_DIR_BUCKETS': '0'})
+
+if __name__ == '__main__':
+    unittest.main()
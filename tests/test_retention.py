@@ -0,0 +1,90 @@
+"""
+Tests of the retention of the files of old cycles (retention.py).
+
+python -m unittest discover -s tests
+"""
+import os
+import sys
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from retention import RetentionService
+from replica_layout import ReplicaLayout
+
+class RetentionServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.layout = ReplicaLayout('flat', root=self.dir)
+        os.mkdir(self.layout.replicaDir(0))
+        self.current = {0: 6}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def create(self, names):
+        for name in names:
+            f = open(self.layout.replicaPath(0, name), 'w')
+            f.write(name)
+            f.close()
+
+    def files(self):
+        return sorted(os.listdir(self.layout.replicaDir(0)))
+
+    def service(self, mode, **kwargs):
+        return RetentionService(mode, 'job', self.layout, 1,
+                                lambda k: self.current[k], **kwargs)
+
+    def test_keep_window(self):
+        self.create(['job_%d.out' % c for c in range(1, 7)] +
+                    ['job_lig_3.dms', 'job.cntl', 'job_stat.txt'])
+        # replica about to run cycle 6, keeps cycles 4 and 5
+        service = self.service('prune', keep_cycles=2)
+        self.assertEqual(service.sweep(), 4)
+        self.assertEqual(self.files(), ['job.cntl', 'job_4.out', 'job_5.out',
+                                        'job_6.out', 'job_stat.txt'])
+        self.assertEqual(service.nfiles, 4)
+
+    def test_extensions_and_exclude(self):
+        self.create(['job_1.out', 'job_1.rst', 'job_1.inp', 'job_2.rst',
+                     'job_0.dms'])
+        service = self.service('prune', keep_cycles=2,
+                               extensions=['rst', '.inp'],
+                               exclude=['/somewhere/job_0.dms'])
+        self.assertEqual(service.sweep(), 3)
+        self.assertEqual(self.files(), ['job_0.dms', 'job_1.out'])
+
+    def test_archive(self):
+        self.create(['job_%d.out' % c for c in range(1, 7)] +
+                    ['job_lig_2.dms'])
+        service = self.service('archive', keep_cycles=2, batch=3)
+        self.assertEqual(service.sweep(), 4)
+        archive = 'job_archive_1-3.tar.gz'
+        self.assertEqual(self.files(), ['job_4.out', 'job_5.out',
+                                        'job_6.out', archive])
+        tar = tarfile.open(self.layout.replicaPath(0, archive))
+        self.assertEqual(sorted(tar.getnames()), ['job_1.out', 'job_2.out',
+                                                  'job_3.out',
+                                                  'job_lig_2.dms'])
+        tar.close()
+        self.assertEqual(service.narchives, 1)
+
+    def test_archive_batch(self):
+        self.create(['job_%d.out' % c for c in range(1, 5)])
+        self.current[0] = 5
+        service = self.service('archive', keep_cycles=2, batch=3)
+        # cycles 1 and 2 only are old, fewer than a batch
+        self.assertEqual(service.sweep(), 0)
+        self.assertEqual(len(self.files()), 4)
+        # the last archive of the run takes what is left
+        self.assertEqual(service.sweep(force=True), 2)
+        self.assertEqual(self.files(), ['job_3.out', 'job_4.out',
+                                        'job_archive_1-2.tar.gz'])
+
+if __name__ == '__main__':
+    unittest.main()
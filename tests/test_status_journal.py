@@ -0,0 +1,86 @@
+"""
+Tests of the journaled storage of the status table (status_journal.py).
+
+python -m unittest discover -s tests
+"""
+import os
+import sys
+import shutil
+import pickle
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from status_journal import StatusJournal
+
+def status_table(nreplicas):
+    return [{'stateid_current': k, 'running_status': 'W', 'cycle_current': 1}
+            for k in range(nreplicas)]
+
+class StatusJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.basename = os.path.join(self.dir, 'job')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_replay(self):
+        journal = StatusJournal(self.basename, 100)
+        status = status_table(4)
+        journal.write(status)
+        status[1]['running_status'] = 'R'
+        journal.write(status)
+        status[2]['cycle_current'] = 2
+        status[2]['stateid_current'] = 3
+        journal.write(status)
+        journal.close()
+
+        # the snapshot holds the first write only
+        f = open(self.basename + '.stat')
+        self.assertEqual(pickle.load(f), status_table(4))
+        f.close()
+        self.assertEqual(StatusJournal(self.basename, 100).load(), status)
+
+    def test_replay_torn_entry(self):
+        journal = StatusJournal(self.basename, 100)
+        status = status_table(4)
+        journal.write(status)
+        status[0]['cycle_current'] = 2
+        journal.write(status)
+        journal.close()
+        expected = [dict(record) for record in status]
+
+        # an entry cut short by a crash in the middle of the write
+        status[3]['cycle_current'] = 5
+        entry = pickle.dumps([(3, status[3])], pickle.HIGHEST_PROTOCOL)
+        f = open(self.basename + '.stat.journal', 'ab')
+        f.write(entry[:len(entry)//2])
+        f.close()
+
+        journal = StatusJournal(self.basename, 100)
+        self.assertEqual(journal.load(), expected)
+        # the journal is compacted, the torn entry is gone
+        self.assertEqual(os.path.getsize(self.basename + '.stat.journal'), 0)
+        journal.close()
+        self.assertEqual(StatusJournal(self.basename, 100).load(), expected)
+
+    def test_compaction(self):
+        journal = StatusJournal(self.basename, 3)
+        status = status_table(4)
+        journal.write(status)
+        for cycle in range(2, 6):
+            status[0]['cycle_current'] = cycle
+            journal.write(status)
+        journal.close()
+        # the fourth record compacted the journal into the snapshot
+        f = open(self.basename + '.stat')
+        self.assertEqual(pickle.load(f)[0]['cycle_current'], 5)
+        f.close()
+        self.assertEqual(StatusJournal(self.basename, 3).load(), status)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,17 +10,174 @@ runtime loop, where N is the number of replicas
 Instead, we've added the Transport.poll() method which can be run to update the
 status of all replicas at once.  For transport modules which don't need this
 functionality, they will inherit an empty method
+
+Transports also emit completion events: when a transport learns that a
+replica has finished it calls notifyCompletion(), which wakes up a controller
+blocked in waitCompletion() (typically from within ProcessJobQueue()) so that
+the replica can be exchanged and relaunched right away rather than at the end
+of the current scheduling cycle. The controller also wakes itself up through
+notifyReady() when the input file of a replica is ready; those notifications
+are kept apart (readyReplicas()) so that consuming completions does not lose
+them. A transport shared by several jobs (see multi_async_re.py) hands each
+job the notifications of its own replicas only.
+
+Transports that start the jobs themselves also record when each job starts
+and ends on its slot (_jobStarted() and _jobEnded()), so that the controller
+can measure how busy the slots are (busyTime()).
 """
 
-import os
-import logging, logging.config
+import time
+import threading
+
+from log_config import configure_logging
 
 class Transport(object):
-    logging.config.fileConfig(os.path.join(os.path.dirname(__file__), "utils/logging.conf"))
 
     def __init__(self):
-        pass
+        configure_logging()
+        # completion notifications, possibly posted by watcher threads
+        self._completion_lock = threading.Lock()
+        self._completion_event = threading.Event()
+        self._completed_replicas = set()
+        self._ready_replicas = set()
+        # slot time used by the jobs of each replica, and start time of the
+        # jobs occupying a slot, if the transport records them
+        self._busy_tracked = False
+        self._busy_time = {}
+        self._busy_since = {}
+        # launch priority policy of the controller, if any
+        self.launch_priority = None
 
-    def poll(self):
+    def poll(self, replicas=None):
+        """
+        Updates the status of the given replicas (all if None) at once.
+        """
         return
 
+    def setLaunchPriority(self, launch_priority):
+        """
+        Sets the LaunchPriority object used to order queued jobs.
+        """
+        self.launch_priority = launch_priority
+
+    def cancelQueued(self, replicas=None):
+        """
+        Removes from the queue of the transport the jobs of the given
+        replicas (all if None) that have not been started yet, e.g. when the
+        controller drains. Returns the set of replicas whose jobs were
+        removed; transports that hand jobs over right away keep them all.
+        """
+        return set()
+
+    def terminateJobs(self, replicas=None):
+        """
+        Stops the started jobs of the given replicas (all if None) so that
+        the controller can exit without waiting for them, e.g. at the
+        deadline of a drain. The replicas are restarted when the RE job is
+        restarted. Returns the set of replicas whose jobs were stopped.
+        """
+        return set()
+
+    def _jobStarted(self, replica, now=None):
+        """
+        Records that the job of a replica has started on a slot. Safe to
+        call from any thread.
+        """
+        if now is None:
+            now = time.time()
+        with self._completion_lock:
+            self._busy_tracked = True
+            self._busy_since[replica] = now
+
+    def _jobEnded(self, replica, now=None):
+        """
+        Records that the job of a replica has released its slot. Safe to
+        call from any thread.
+        """
+        if now is None:
+            now = time.time()
+        with self._completion_lock:
+            start = self._busy_since.pop(replica, None)
+            if start is not None:
+                self._busy_time[replica] = (self._busy_time.get(replica, 0.) +
+                                            max(0., now - start))
+
+    def busyTime(self, replicas=None):
+        """
+        Returns the total slot time in seconds used so far by the jobs of the
+        given replicas (all if None), including the jobs still running, or
+        None if the transport does not record it.
+        """
+        now = time.time()
+        with self._completion_lock:
+            if not self._busy_tracked:
+                return None
+            if replicas is None:
+                replicas = set(self._busy_time) | set(self._busy_since)
+            total = 0.
+            for k in replicas:
+                total += self._busy_time.get(k, 0.)
+                if k in self._busy_since:
+                    total += max(0., now - self._busy_since[k])
+            return total
+
+    def notifyCompletion(self, replica):
+        """
+        Records that a replica has finished running, or is otherwise ready
+        to be handled by the controller, and wakes up anyone waiting in
+        waitCompletion(). Safe to call from any thread.
+        """
+        with self._completion_lock:
+            self._completed_replicas.add(replica)
+            self._completion_event.set()
+
+    def notifyReady(self, replica):
+        """
+        Records that the input file of a replica is ready and wakes up anyone
+        waiting in waitCompletion(). Safe to call from any thread.
+        """
+        with self._completion_lock:
+            self._ready_replicas.add(replica)
+            self._completion_event.set()
+
+    def waitCompletion(self, timeout):
+        """
+        Blocks until at least one completion notification is pending or
+        timeout (in seconds) elapses. Returns True if notifications are
+        pending.
+        """
+        self._completion_event.wait(timeout)
+        return self._completion_event.is_set()
+
+    def completedReplicas(self, replicas=None):
+        """
+        Returns and clears the set of replicas for which completion
+        notifications have been posted since the last call, restricted to
+        the given set of replicas if any, and clears the wake up event
+        unless completions of other replicas are pending.
+        """
+        with self._completion_lock:
+            if replicas is None:
+                completed = self._completed_replicas
+                self._completed_replicas = set()
+            else:
+                completed = self._completed_replicas.intersection(replicas)
+                self._completed_replicas -= completed
+            if not self._completed_replicas:
+                self._completion_event.clear()
+        return completed
+
+    def readyReplicas(self, replicas=None):
+        """
+        Returns and clears the set of replicas for which notifyReady() has
+        been called since the last call, restricted to the given set of
+        replicas if any.
+        """
+        with self._completion_lock:
+            if replicas is None:
+                ready = self._ready_replicas
+                self._ready_replicas = set()
+            else:
+                ready = self._ready_replicas.intersection(replicas)
+                self._ready_replicas -= ready
+        return ready
@@ -13,6 +13,10 @@ from configobj import ConfigObj
 import random, math, numpy
 import glob
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from replica_layout import replica_layout
+
 def _exit(message):
     """Print and flush a message to stdout and then exit."""
     print message
@@ -46,6 +50,9 @@ class asyncRE_analysis:
 
     def _checkInput(self):
 
+        #layout of the replica directories (see replica_layout.py)
+        self.replica_layout = replica_layout(self.keywords)
+
         #Option for calculating binding free energy
         self.CalcBindEng=True
         if self.keywords.get('CALC_BIND_ENG') is None:
@@ -531,8 +538,8 @@ calculate the binding free energies at different time from the time series of bi
                 ntail = i*self.nfreq
 
             for ir in range(self.repstart,self.repend+1):
-                inpf = "r%d/lbe.dat" %ir
-                outf = "r%d/lbe_temp.dat" %ir
+                inpf = self.replica_layout.replicaPath(ir, "lbe.dat")
+                outf = self.replica_layout.replicaPath(ir, "lbe_temp.dat")
                 lbe_cmd = 'head -n ' + str(nhead) + ' ' + inpf + '| tail -n ' + str(ntail) + ' > ' + outf
                 os.system(lbe_cmd)
                 if (ir == self.repstart ):
@@ -595,8 +602,8 @@ calculate the binding free energies at different time from the time series of bi
                 ntail = i*self.nfreq
 
             for ir in range(self.repstart,self.repend+1):
-                inpf = "r%d/lbe.dat" %ir
-                outf = "r%d/lbe_temp.dat" %ir
+                inpf = self.replica_layout.replicaPath(ir, "lbe.dat")
+                outf = self.replica_layout.replicaPath(ir, "lbe_temp.dat")
                 lbe_cmd = 'head -n ' + str(nhead) + ' ' + inpf + '| tail -n ' + str(ntail) + ' > ' + outf
                 os.system(lbe_cmd)
                 if (ir == self.repstart ):
@@ -709,9 +716,9 @@ extract the conformers at certain thermodynamic states.
         os.system(makefolder_cmd)
         for ir in range(self.repstart,self.repend+1):
             cycles = []
-	    out_files = glob.glob("r%d/%s_*.out" % (ir,self.jobname))
+	    out_files = glob.glob(self.replica_layout.replicaPath(ir, "%s_*.out" % self.jobname))
 	    # print out_files
-	    to_cycle = re.compile("r"+ str(ir) + "/" + self.jobname + r"_(\d+).out")
+	    to_cycle = re.compile(re.escape(self.replica_layout.replicaPath(ir, self.jobname)) + r"_(\d+).out")
 	    for f in out_files:
    		c = re.match(to_cycle, f).group(1)
      		# print c
@@ -719,19 +726,19 @@ extract the conformers at certain thermodynamic states.
             cycles.sort()
 	    for r in cycles:
    	        #construct file name
-	        datafile = "r%d/%s_%d.out" % (ir,self.jobname,r)
+	        datafile = self.replica_layout.replicaPath(ir, "%s_%d.out" % (self.jobname,r))
                 #print datafil
 	        stateValues=self.getStateValues(datafile)
                 # print stateValues
                 if self.ExtTemp == stateValues[0] and self.ExtLambda == stateValues[1] :
                    if self.ConfFormat == 'rst' :
-		      conffile= "r%d/%s_%d.%s" % (ir,self.jobname,r,self.ConfFormat)
+		      conffile= self.replica_layout.replicaPath(ir, "%s_%d.%s" % (self.jobname,r,self.ConfFormat))
                       outfile = "%s_r%d_%d.%s" % (self.jobname,ir,r,self.ConfFormat) 
                       cp_cmd= 'cp ' + conffile + ' ' + foldername + '/' + outfile
                    elif self.ConfFormat == 'dms' :
-                       infile_lig= "r%d/%s_lig_%d.%s" % (ir,self.jobname,r,self.ConfFormat)
+                       infile_lig= self.replica_layout.replicaPath(ir, "%s_lig_%d.%s" % (self.jobname,r,self.ConfFormat))
                        outfile_lig = "%s_lig_r%d_%d.%s" % (self.jobname,ir,r,self.ConfFormat)
-		       infile_rcpt= "r%d/%s_rcpt_%d.%s" % (ir,self.jobname,r,self.ConfFormat) 
+		       infile_rcpt= self.replica_layout.replicaPath(ir, "%s_rcpt_%d.%s" % (self.jobname,r,self.ConfFormat)) 
                        outfile_rcpt = "%s_rcpt_r%d_%d.%s" % (self.jobname,ir,r,self.ConfFormat)
 	               cp_cmd= 'cp ' + infile_lig + ' ' + foldername + '/' + outfile_lig + '; cp ' + infile_rcpt + ' ' + foldername + '/' + outfile_rcpt
 	 	   os.system(cp_cmd)
@@ -754,7 +761,7 @@ calculate the diffision coefficient in lamda state space.
         #print lambda_dict
 
         for ir in range(self.repstart,self.repend+1):
-             inpf = "r%d/lbe.dat" %ir
+             inpf = self.replica_layout.replicaPath(ir, "lbe.dat")
              f=open(inpf,'r')
              lambdas_inp=[]
              line = f.readline()
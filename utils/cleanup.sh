@@ -3,6 +3,8 @@
 # Contributors: 
 #    Junchao Xia <junchao.xia@temple.edu>
 
+. "$(dirname "$0")/replica_dir.sh"
+
 SCHRODINGER=$1
 scripts=$2
 jobname=$3
@@ -13,8 +15,9 @@ export MALLOC_CHECK_=0
 export SCHRODINGER
 for (( ir=$rb; ir<=$re; ir++ ))
 do
-   cd r$ir
+   rdir=$(replica_dir $ir) || exit 1
+   cd $rdir
    $SCHRODINGER/run $scripts/cleanup.py $jobname $tar_type && rm -f ${jobname}_*.{err,log,trj,idx}
    echo "Finished the cleanup in r$ir"
-   cd ../
+   cd - > /dev/null
 done
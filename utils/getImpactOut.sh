@@ -6,6 +6,8 @@
 # Junchao Xia  07/28/2014
 #####################################################################################################
 
+. "$(dirname "$0")/replica_dir.sh"
+
 async_scripts=$1     #  path to scripts /home/tuf29141/software/async_scripts
 job_dirs=$2          #  job folders
 basename=$3          #  .out file from IMPACT
@@ -26,12 +28,13 @@ for folder in $job_dirs; do
 	echo "working in the folder of $folder"
         for (( ir=$rbgn; ir<=$rend; ir++ ))
         do
-            cd r$ir
+            rdir=$(replica_dir $ir) || exit 1
+            cd $rdir
             rm -rf lbe.dat
             cat `/bin/ls -v ${basename}_*.out` > ${basename}_all.dat
             python $async_scripts/getImpactOut.py ${basename} $neq $nprod $nskip $nfreq
             echo "Finished collecting data in r$ir"
-            cd ../
+            cd - > /dev/null
         done
 	cd $root_path
     else 
@@ -5,6 +5,9 @@
 #
 # Junchao Xia  03/04/2015
 #####################################################################################################
+
+. "$(dirname "$0")/replica_dir.sh"
+
 newfolder=$1
 oldfolders=$2
 job_dirs=`ls -d $oldfolders`
@@ -39,7 +42,8 @@ for folder in $job_dirs; do
         echo "working in the folder of $folder"
  	for (( ir=$rbgn; ir<=$rend; ir++ ))
         do
-           head -n $nhead $folder/r$ir/lbe.dat | tail -n $ntail >> $newfolder/r$ir/lbe.dat 
+           rdir=$(replica_dir $ir $folder) || exit 1
+           head -n $nhead $rdir/lbe.dat | tail -n $ntail >> $newfolder/r$ir/lbe.dat 
         done
     else
         echo "$folder does not exist."
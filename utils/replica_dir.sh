@@ -0,0 +1,23 @@
+#!/bin/bash
+# Sourced by the scripts of this folder to find the directory of a replica
+# in a job directory, whatever the REPLICA_DIR_LAYOUT of the job (see
+# replica_layout.py): r<k> with the 'flat' layout, rb<bucket>/r<k> with the
+# 'sharded' layout.
+#
+# usage: rdir=$(replica_dir <replica> [<job directory>]) || exit 1
+
+replica_dir () {
+    local replica=$1
+    local root=${2:-.}
+    if [ -d $root/r$replica ]; then
+        echo $root/r$replica
+        return 0
+    fi
+    local dirs=( $root/rb*/r$replica )
+    if [ -d ${dirs[0]} ]; then
+        echo ${dirs[0]}
+        return 0
+    fi
+    echo "directory of replica $replica not found in $root" >&2
+    return 1
+}
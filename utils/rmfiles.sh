@@ -3,13 +3,16 @@
 # Contributors: 
 #    Junchao Xia <junchao.xia@temple.edu>
 
+. "$(dirname "$0")/replica_dir.sh"
+
 jobname=$1
 ftype=$2
 rb=$3 
 re=$4
 for (( ir=$rb; ir<=$re; ir++ ))
 do
-   cd r$ir
+   rdir=$(replica_dir $ir) || exit 1
+   cd $rdir
     if [ "$ftype" = "dms" ]; then
        rm -rf  ${jobname}_lig_*.dms 
        rm -rf  ${jobname}_rcpt_*.dms       
@@ -23,5 +26,5 @@ do
        echo "need to modify script from remove $ftype files."  
     fi
    echo "finished removing $ftype files in r$ir"
-   cd ../
+   cd - > /dev/null
 done
@@ -6,6 +6,8 @@
 # Junchao Xia  07/15/2014
 #####################################################################################################
 
+. "$(dirname "$0")/replica_dir.sh"
+
 async_scripts=$1
 job_dirs=$2
 rbgn=$3
@@ -23,9 +25,10 @@ for folder in $job_dirs; do
         echo "working in the folder of $folder"
           for (( ir=$rbgn;ir<=$rend; ir++ ))
 	  do 
-            cd r$ir 
+            rdir=$(replica_dir $ir) || exit 1
+            cd $rdir
 	    tar -xvf ${folder}_${tar_type}.tar 
-            cd ../
+            cd - > /dev/null
           done
         cd $root_path
     else